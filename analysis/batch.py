@@ -0,0 +1,248 @@
+"""Reprocesses every measurement file in a directory with a pool of worker processes: formatted X and Y grids and a
+PNG for every map, amplitude, phase and anisotropy grids and a PNG for every polarization map, a PNG for every time
+and polarization scan, and a summary table of all of them. A manifest in the output directory records the
+modification time, size and content hash of every processed file, so a later run only processes new and changed
+files.
+
+python -m optics.analysis.batch C:\\data\\cooldown --workers 4"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from optics.analysis import map_loader, polarization_fit
+from optics.heating_plot.heating_map import LABELS, format_map_data
+from optics.measurements import file_index, storage
+
+# the kind of file of each measurement_type of LockinBaseMeasurement.make_file
+MEASUREMENTS = {'map scan': 'map', 'intensity scan': 'time', 'polarization scan': 'polarization',
+                'polarization map': 'polarization map'}
+# the fitted quantities written for every signal column of a polarization map and their colormaps
+POLARIZATION_MAPS = [('amplitude', 'viridis'), ('phase', 'twilight'), ('anisotropy', 'viridis')]
+MANIFEST = 'batch_manifest.json'
+SUMMARY = 'summary.csv'
+SUMMARY_COLUMNS = ['file', 'measurement', 'device', 'polarization', 'index', 'kind', 'points', 'measured', 'complete',
+                   'gain', 'power (W)', 'x min', 'x max', 'y min', 'y max', 'outputs']
+
+
+def parse_name(filename):
+    """Returns the device, kind of file, polarization and index of a file named by make_file, or None"""
+    name = file_index.parse_name(filename)
+    if name:
+        name['measurement'] = MEASUREMENTS[name['measurement']]
+    return name
+
+
+def find_files(directory, exclude=None):
+    """Returns every measurement file under directory, skipping the exclude directory"""
+    found = []
+    for root, directories, files in os.walk(directory):
+        if exclude:
+            directories[:] = [d for d in directories if os.path.abspath(os.path.join(root, d)) != exclude]
+        found += [os.path.join(root, name) for name in sorted(files) if parse_name(name)]
+    return sorted(found)
+
+
+def file_hash(filename):
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _save_figure(fig, filename):
+    FigureCanvasAgg(fig)
+    fig.savefig(filename, format='png', bbox_inches='tight')
+
+
+def _limits(x, y):
+    return {'x min': float(np.ma.min(x)), 'x max': float(np.ma.max(x)), 'y min': float(np.ma.min(y)),
+            'y max': float(np.ma.max(y))}
+
+
+def process_map(filename, stem):
+    map_data = map_loader.load_map(filename, cut=False)
+    x, y = format_map_data(map_data)
+    title, label, _ = LABELS[map_data.kind]
+    outputs = [stem + '_x.csv', stem + '_y.csv', stem + '.png']
+    np.savetxt(outputs[0], x.filled(np.nan), delimiter=',')
+    np.savetxt(outputs[1], y.filled(np.nan), delimiter=',')
+    fig = Figure(figsize=(10, 4))
+    for k, (values, component) in enumerate([(x, 'X'), (y, 'Y')]):
+        ax = fig.add_subplot(1, 2, k + 1)
+        im = ax.imshow(values, cmap='coolwarm', interpolation='nearest', origin='lower')
+        fig.colorbar(im, ax=ax).set_label(label, rotation=270, labelpad=20)
+        ax.title.set_text('{} {}'.format(title, component))
+    _save_figure(fig, outputs[2])
+    measured = map_data.measured if map_data.frames == 1 else map_data.measured.any(axis=0)
+    summary = {'kind': map_data.kind, 'points': measured.size, 'measured': int(measured.sum()),
+               'complete': bool(measured.all()), 'outputs': outputs}
+    if measured.any():
+        summary.update(_limits(x, y))
+    return map_data.attributes, summary
+
+
+def process_polarization_map(filename, stem):
+    attributes, fits = polarization_fit.fit_map(filename)
+    outputs = []
+    fig = Figure(figsize=(15, 4 * len(fits)))
+    for row, (column, result) in enumerate(fits.items()):
+        for k, (name, cmap) in enumerate(POLARIZATION_MAPS):
+            values = np.ma.masked_invalid(getattr(result, name).T)
+            outputs.append('{}_{}_{}.csv'.format(stem, column, name))
+            np.savetxt(outputs[-1], values.filled(np.nan), delimiter=',')
+            ax = fig.add_subplot(len(fits), len(POLARIZATION_MAPS), row * len(POLARIZATION_MAPS) + k + 1)
+            im = ax.imshow(values, cmap=cmap, interpolation='nearest', origin='lower')
+            fig.colorbar(im, ax=ax)
+            ax.title.set_text('{} {}'.format(column, name))
+    outputs.append(stem + '.png')
+    _save_figure(fig, outputs[-1])
+    amplitude = np.ma.masked_invalid(next(iter(fits.values())).amplitude)
+    summary = {'kind': map_loader.schema(list(fits))[0], 'points': amplitude.size, 'measured': int(amplitude.count()),
+               'complete': bool(amplitude.count() == amplitude.size), 'outputs': outputs}
+    return attributes, summary
+
+
+def process_series(filename, stem, measurement):
+    attributes, data = storage.load(filename)
+    kind, signal = next(((kind, columns) for kind, columns in map_loader.SERIES_SIGNALS
+                         if all(column in data for column in columns)), (None, None))
+    if signal is None:
+        raise ValueError('no signal columns in {}'.format(filename))
+    x, y = (np.ma.masked_invalid(data[column]) for column in signal)
+    fig = Figure(figsize=(10, 4))
+    if measurement == 'polarization':
+        angle = np.radians(data['polarization'])
+        for k, values in enumerate([x, y]):
+            ax = fig.add_subplot(1, 2, k + 1, projection='polar')
+            ax.plot(angle, values, linestyle='', marker='o', markersize=2)
+            ax.title.set_text(signal[k])
+    else:
+        for k, values in enumerate([x, y]):
+            ax = fig.add_subplot(1, 2, k + 1)
+            ax.plot(data['time'], values)
+            ax.set_xlabel('time (s)')
+            ax.title.set_text(signal[k])
+    outputs = [stem + '.png']
+    _save_figure(fig, outputs[0])
+    summary = {'kind': kind, 'points': len(x), 'measured': int(x.count()), 'complete': True, 'outputs': outputs}
+    if x.count():
+        summary.update(_limits(x, y))
+    return attributes, summary
+
+
+def process(filename, output, previous_hash=None):
+    """Runs in a worker process. Writes the outputs of one measurement file under output and returns its content hash
+    and its summary row, or its hash and None if the content has not changed since previous_hash"""
+    content_hash = file_hash(filename)
+    if content_hash == previous_hash:
+        return content_hash, None
+    name = parse_name(filename)
+    os.makedirs(output, exist_ok=True)
+    stem = os.path.join(output, os.path.splitext(os.path.basename(filename))[0])
+    if name['measurement'] == 'map':
+        attributes, summary = process_map(filename, stem)
+    elif name['measurement'] == 'polarization map':
+        attributes, summary = process_polarization_map(filename, stem)
+    else:
+        attributes, summary = process_series(filename, stem, name['measurement'])
+    summary.update(name)
+    summary.update({'file': filename, 'gain': attributes.get('gain', ''), 'power (W)': attributes.get('power (W)', '')})
+    return content_hash, summary
+
+
+def load_manifest(output):
+    filename = os.path.join(output, MANIFEST)
+    if not os.path.exists(filename):
+        return {}
+    with open(filename) as f:
+        return json.load(f)
+
+
+def save_manifest(output, manifest):
+    temporary = os.path.join(output, MANIFEST + '.tmp')
+    with open(temporary, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(temporary, os.path.join(output, MANIFEST))
+
+
+def write_summary(output, manifest):
+    with open(os.path.join(output, SUMMARY), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(SUMMARY_COLUMNS)
+        for path in sorted(manifest):
+            summary = manifest[path]['summary']
+            writer.writerow([';'.join(summary.get(column, '')) if column == 'outputs' else summary.get(column, '')
+                             for column in SUMMARY_COLUMNS])
+
+
+def _outputs_exist(entry):
+    return entry is not None and all(os.path.exists(output) for output in entry['summary']['outputs'])
+
+
+def _unchanged(entry, stat):
+    return _outputs_exist(entry) and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size
+
+
+def run(directory, output=None, workers=None, force=False):
+    """Processes the new and changed measurement files under directory into output, by default a processed directory
+    inside it, with the given number of worker processes. Returns the number of files processed, skipped and
+    failed"""
+    directory = os.path.abspath(directory)
+    output = os.path.abspath(output or os.path.join(directory, 'processed'))
+    os.makedirs(output, exist_ok=True)
+    manifest = {} if force else load_manifest(output)
+    files = find_files(directory, exclude=output)
+    manifest = {path: entry for path, entry in manifest.items() if path in files}  # files that were deleted
+    processed = skipped = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for filename in files:
+            stat = os.stat(filename)
+            entry = manifest.get(filename)
+            if _unchanged(entry, stat):
+                skipped += 1
+                continue
+            destination = os.path.join(output, os.path.relpath(os.path.dirname(filename), directory))
+            futures[filename] = stat, pool.submit(process, filename, os.path.normpath(destination),
+                                                  entry['hash'] if _outputs_exist(entry) else None)
+        for filename, (stat, future) in futures.items():
+            try:
+                content_hash, summary = future.result()
+            except Exception as err:  # the file is tried again on the next run
+                print('{}: {}'.format(filename, err))
+                manifest.pop(filename, None)
+                failed += 1
+                continue
+            if summary is None:  # touched, but the same content
+                summary = manifest[filename]['summary']
+                skipped += 1
+            else:
+                processed += 1
+            manifest[filename] = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'hash': content_hash,
+                                  'summary': summary}
+    save_manifest(output, manifest)
+    write_summary(output, manifest)
+    return processed, skipped, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reprocess the measurement files of a directory')
+    parser.add_argument('directory')
+    parser.add_argument('--output', help='directory for the outputs, by default processed inside the directory')
+    parser.add_argument('--workers', type=int, help='worker processes, by default one per CPU')
+    parser.add_argument('--force', action='store_true', help='process every file, changed or not')
+    args = parser.parse_args()
+    processed, skipped, failed = run(args.directory, args.output, workers=args.workers, force=args.force)
+    print('{} files processed, {} unchanged, {} failed'.format(processed, skipped, failed))
+
+
+if __name__ == '__main__':
+    main()
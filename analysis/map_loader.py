@@ -0,0 +1,103 @@
+"""Loads the map scan files written by MapScan, of any storage backend, onto their pixel grids. Rows are scattered
+straight into preallocated grids by their x_pixel and y_pixel (and frame or angle) columns, so the rows can be in any
+order and nothing is sorted, and pixels that were never measured, because the scan was aborted or is adaptive, are
+masked"""
+import os
+
+import numpy as np
+
+from optics.measurements import storage
+from optics.misc_utility import scanner
+
+# the X and Y signal columns of each kind of map, after the gain is taken out
+SIGNALS = {'thermovoltage': ('x_v', 'y_v'), 'heating': ('x_iphoto', 'y_iphoto')}
+SIGNAL_COLUMNS = [column for signal in SIGNALS.values() for column in signal]
+# the kind and signal columns of time and polarization files, in x and y or in r and theta mode
+SERIES_SIGNALS = [('thermovoltage', ('x_v', 'y_v')), ('heating', ('iphoto_x', 'iphoto_y')),
+                  ('thermovoltage', ('r_v', 'theta')), ('heating', ('iphoto', 'theta'))]
+
+
+def cut_file(filename):
+    """Returns the cut through file written next to a map file"""
+    return os.path.splitext(filename)[0] + '_cut.csv'
+
+
+def schema(columns):
+    """Returns the kind of map and its X and Y signal columns from the column names of its file"""
+    for kind, signal in SIGNALS.items():
+        if all(column in columns for column in signal):
+            return kind, signal
+    if 'x_raw' in columns and 'y_raw' in columns:
+        return 'raw', ('x_raw', 'y_raw')
+    raise ValueError('no X and Y signal columns in {}'.format(', '.join(columns)))
+
+
+class MapData:
+    """A map scan file on its pixel grid. data holds a masked array for every column, indexed [x_pixel, y_pixel],
+    [frame, x_pixel, y_pixel] for a map measured several times or [x_pixel, y_pixel, angle] for a map measured at
+    several waveplate angles, as named by axes, and masked where measured is False. x and y are the signal columns of
+    the kind of map. x_values and y_values are the stage positions of the pixels. cut holds the columns of the cut
+    through file, or None if there is none"""
+    def __init__(self, filename, attributes, data, cut=None, cut_axis=None):
+        if 'order' not in data:
+            raise ValueError('{} is not a map scan file'.format(filename))
+        self.filename = filename
+        self.attributes = attributes
+        self.order = data['order']  # the row of the file of every pixel, -1 where it was not measured
+        self.measured = self.order >= 0
+        if self.measured.ndim == 2:
+            self.axes = ('x_pixel', 'y_pixel')
+        elif 'polarization angles' in attributes:
+            self.axes = ('x_pixel', 'y_pixel', 'angle')
+        else:
+            self.axes = ('frame', 'x_pixel', 'y_pixel')
+        self.columns = [column for column in data if column != 'order']
+        self.data = {column: np.ma.masked_array(data[column], mask=~self.measured) for column in self.columns}
+        self.kind, self.signal = schema(self.columns)
+        self.x, self.y = (self.data[column] for column in self.signal)
+        self.cut = cut
+        self.cut_axis = cut_axis
+        self.x_values, self.y_values = None, None
+        keys = ('x center', 'y center', 'x scan range', 'y scan range', 'x scan density', 'y scan density')
+        if all(key in attributes for key in keys):
+            xc, yc, xr, yr, xd, yd = (float(attributes[key]) for key in keys)
+            self.x_values, self.y_values = scanner.find_scan_values(xc, yc, xr, yr, int(xd), int(yd))
+
+    @property
+    def complete(self):
+        """Whether every pixel was measured"""
+        return bool(self.measured.all())
+
+    @property
+    def frames(self):
+        return self.measured.shape[0] if 'frame' in self.axes else 1
+
+    @property
+    def angles(self):
+        return self.measured.shape[2] if 'angle' in self.axes else 1
+
+    def average(self, column):
+        """Returns the mean of a column over the frames of a map measured several times, masked where no frame was
+        measured. The readings of a polarization map are not averaged over the angles, see polarization_fit.fit_map"""
+        if 'angle' in self.axes:
+            raise ValueError('{} is a polarization map, fit it with polarization_fit.fit_map'.format(self.filename))
+        values = self.data[column]
+        return values.mean(axis=0) if 'frame' in self.axes else values
+
+
+def load_cut(filename):
+    """Returns the cut through axis and the columns of the cut through file of a map file, or None, None if there is
+    none"""
+    filename = cut_file(filename)
+    if not os.path.exists(filename):
+        return None, None
+    attributes, data = storage.load(filename)
+    return attributes.get('axis'), data
+
+
+def load_map(filename, columns=SIGNAL_COLUMNS, cut=True):
+    """Returns the MapData of a map file, with its cut through file unless cut is False. Only the signal columns are
+    read by default, as parsing is most of the cost of loading a large csv file. columns None reads every column"""
+    attributes, data = storage.load(filename, columns=columns)
+    cut_axis, cut_data = load_cut(filename) if cut else (None, None)
+    return MapData(filename, attributes, data, cut=cut_data, cut_axis=cut_axis)
@@ -0,0 +1,158 @@
+"""Fits the polarization dependence A cos^2(theta - phi) + C of photovoltage and photocurrent signals. As
+A cos^2(theta - phi) + C = C + A / 2 + A / 2 (cos(2 phi) cos(2 theta) + sin(2 phi) sin(2 theta)), the fit is a linear
+least squares fit on the basis 1, cos(2 theta), sin(2 theta), solved in closed form from its 3 by 3 normal equations.
+Any number of series, for example thousands of files or every pixel of a map, are fitted at once, and a fit can be
+updated point by point during a sweep"""
+import numpy as np
+
+from optics.analysis import map_loader
+from optics.measurements import storage
+
+
+def _basis(theta):
+    """Returns the basis functions at polarization angles theta in degrees, with a last axis of 3"""
+    theta = np.radians(theta)
+    return np.stack([np.ones_like(theta), np.cos(2 * theta), np.sin(2 * theta)], axis=-1)
+
+
+def _propagate(covariance, *gradient):
+    gradient = np.stack(gradient, axis=-1)
+    return np.sqrt(np.maximum(np.einsum('...i,...ij,...j->...', gradient, covariance, gradient), 0))
+
+
+class PolarizationFit:
+    """The result of a fit of one or more series: amplitude A, phase phi in degrees in [0, 180) and offset C of
+    A cos^2(theta - phi) + C, their standard errors, the rms of the residuals and the number of points. Every
+    attribute has the shape of the series, and is nan where a series has fewer than three distinct angles. The
+    amplitude is never negative, a dip is a peak 90 degrees away"""
+    def __init__(self, xtx, xty, yy, count):
+        singular = np.abs(np.linalg.det(xtx)) <= 1e-12 * np.maximum(count, 1) ** 3
+        xtx = np.where(singular[..., None, None], np.eye(3), xtx)
+        inverse = np.linalg.inv(xtx)
+        coefficients = np.einsum('...ij,...j->...i', inverse, xty)
+        c, a, b = np.moveaxis(np.where(singular[..., None], np.nan, coefficients), -1, 0)
+        residual = np.maximum(yy - np.einsum('...i,...i->...', coefficients, xty), 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            variance = np.where(count > 3, residual / (count - 3), np.nan)
+            covariance = variance[..., None, None] * inverse
+            r = np.hypot(a, b)
+            zero = np.zeros_like(r)
+            self.amplitude = 2 * r
+            self.phase = np.degrees(np.arctan2(b, a) / 2) % 180
+            self.offset = c - r
+            # errors propagated from the covariance of c, a and b through the gradients of A, phi and C
+            self.amplitude_error = _propagate(covariance, zero, 2 * a / r, 2 * b / r)
+            self.phase_error = np.degrees(_propagate(covariance, zero, -b / (2 * r * r), a / (2 * r * r)))
+            self.offset_error = _propagate(covariance, zero + 1, -a / r, -b / r)
+            self.rms = np.sqrt(residual / count)
+        self.count = count
+
+    @property
+    def anisotropy(self):
+        """Returns (maximum - minimum) / |maximum + minimum| of the fitted curve, A / |A + 2 C|, from 0 for a signal
+        that does not depend on polarization to 1 for one that vanishes at the minimum"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.amplitude / np.abs(self.amplitude + 2 * self.offset)
+
+    def evaluate(self, theta):
+        """Returns the fitted curve at polarization angles theta in degrees"""
+        return self.amplitude * np.cos(np.radians(np.asarray(theta) - self.phase)) ** 2 + self.offset
+
+    def converged(self, amplitude_tolerance=0.02, phase_tolerance=1.0):
+        """Returns whether the standard error of the amplitude is below amplitude_tolerance times the amplitude and
+        that of the phase below phase_tolerance degrees"""
+        return (self.amplitude_error <= amplitude_tolerance * self.amplitude) & (self.phase_error <= phase_tolerance)
+
+
+def fit(theta, values):
+    """Fits every series of values, the last axis, against the polarization angles theta in degrees. theta is
+    broadcast against values, so one set of angles can be shared by every series, for example every pixel of a map.
+    Points where either is nan are left out, so series of different lengths can be padded with nan"""
+    values = np.asarray(values, dtype=float)
+    theta = np.broadcast_to(np.asarray(theta, dtype=float), values.shape)
+    valid = np.isfinite(values) & np.isfinite(theta)
+    basis = _basis(np.where(valid, theta, 0)) * valid[..., None]
+    values = np.where(valid, values, 0)
+    return PolarizationFit(np.einsum('...ni,...nj->...ij', basis, basis), np.einsum('...ni,...n->...i', basis, values),
+                           np.einsum('...n,...n->...', values, values), valid.sum(axis=-1))
+
+
+class LiveFit:
+    """A fit updated point by point, for stopping a sweep once it has converged. Only the normal equations are kept,
+    so adding a point and solving cost the same however many points there are. value can be an array of channels,
+    whose number is given by channels, or a single value if channels is None"""
+    def __init__(self, minimum_points=6, channels=None):
+        shape = () if channels is None else (channels,)
+        self._xtx = np.zeros((3, 3))
+        self._xty = np.zeros(shape + (3,))
+        self._yy = np.zeros(shape)
+        self.count = 0
+        self._minimum_points = minimum_points
+
+    def add(self, theta, value):
+        basis = _basis(float(theta))
+        value = np.asarray(value, dtype=float)
+        if not np.all(np.isfinite(value)):  # a failed reading is left out
+            return
+        self._xtx = self._xtx + np.outer(basis, basis)
+        self._xty = self._xty + value[..., None] * basis
+        self._yy = self._yy + value * value
+        self.count += 1
+
+    def result(self):
+        """Returns the PolarizationFit of the points so far, which is nan until there are three distinct angles"""
+        xtx = np.broadcast_to(self._xtx, np.shape(self._yy) + (3, 3))
+        return PolarizationFit(xtx, self._xty, self._yy, np.full(np.shape(self._yy), self.count))
+
+    def converged(self, amplitude_tolerance=0.02, phase_tolerance=1.0, channels=None):
+        """Returns whether the channels with the given indexes, or every channel if channels is None, have converged,
+        after at least minimum_points points"""
+        if self.count < self._minimum_points:
+            return False
+        converged = np.atleast_1d(self.result().converged(amplitude_tolerance, phase_tolerance))
+        return bool(np.all(converged if channels is None else converged[list(channels)]))
+
+
+def fit_files(filenames):
+    """Fits the signal columns of polarization scan files all at once. Returns a list with a dictionary of column
+    name to PolarizationFit for every file"""
+    series = []
+    for filename in filenames:
+        _, data = storage.load(filename)
+        signal = next((columns for _, columns in map_loader.SERIES_SIGNALS
+                       if all(column in data for column in columns)), None)
+        if signal is None or 'polarization' not in data:
+            raise ValueError('{} is not a polarization scan file'.format(filename))
+        series.append((data['polarization'], [data[column] for column in signal], signal))
+    length = max((len(theta) for theta, _, _ in series), default=0)
+    channels = max((len(signal) for _, _, signal in series), default=0)
+    theta = np.full((len(series), 1, length), np.nan)
+    values = np.full((len(series), channels, length), np.nan)
+    for k, (angles, columns, _) in enumerate(series):
+        theta[k, 0, :len(angles)] = angles
+        for channel, column in enumerate(columns):
+            values[k, channel, :len(column)] = column
+    result = fit(theta, values)
+    fits = []
+    for k, (_, _, signal) in enumerate(series):
+        fits.append({column: _select(result, (k, channel)) for channel, column in enumerate(signal)})
+    return fits
+
+
+def fit_map(filename):
+    """Fits every pixel of a polarization map file, a map measured at several waveplate angles. Returns the header
+    attributes and a dictionary of signal column name to PolarizationFit, whose attributes are indexed
+    [x_pixel, y_pixel]"""
+    attributes, data = storage.load(filename, columns=map_loader.SIGNAL_COLUMNS + ['polarization'])
+    if 'polarization' not in data or np.ndim(data['polarization']) != 3:
+        raise ValueError('{} is not a polarization map file'.format(filename))
+    _, signal = map_loader.schema(list(data))
+    return attributes, {column: fit(data['polarization'], data[column]) for column in signal}
+
+
+def _select(result, index):
+    """Returns the fit of one series of a fit of many"""
+    selected = PolarizationFit.__new__(PolarizationFit)
+    for name, value in vars(result).items():
+        selected.__dict__[name] = value[index]
+    return selected
@@ -0,0 +1,86 @@
+"""Benchmark of loading a map scan csv file onto its pixel grid. The pandas parser that sorted the rows by pixel and
+reshaped them, which heating_plot.heating_map used before optics.analysis.map_loader, is kept here as the baseline.
+The maps are written as MapScan writes them, in serpentine order, and loaded both complete and as an aborted scan.
+No hardware is needed.
+
+python -m optics.benchmarks.map_loader_benchmark --sizes 50 200"""
+import argparse
+import csv
+import os
+import tempfile
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from optics.analysis import map_loader
+from optics.misc_utility import path_planner
+
+
+def legacy_load(filename):
+    """heating_map.parse and format_map_data before the map loader. Returns the X and Y grids indexed [y, x]"""
+    with open(filename) as inputfile:
+        header = {}
+        for i, line in enumerate(inputfile):
+            key, value = (token.strip() for token in line.split(":,", maxsplit=1))
+            header[key] = value
+            if key == 'end':
+                break
+        data = pd.read_csv(inputfile, sep=',')
+    data = data.sort_values(by=['y_pixel', 'x_pixel'])
+    xvalues = data['x_iphoto'].values.reshape(int(header['y scan density']), int(header['x scan density']))
+    yvalues = data['y_iphoto'].values.reshape(int(header['y scan density']), int(header['x scan density']))
+    return xvalues, yvalues
+
+
+def write_map(filename, size, fraction=1.0, seed=0):
+    """Writes a heating map file of size by size pixels, of which the first fraction of the serpentine is measured"""
+    rng = np.random.default_rng(seed)
+    order = path_planner.serpentine(size, size)
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        for key, value in [('gain:', 1000), ('x scan density:', size), ('y scan density:', size),
+                           ('x scan range:', 8), ('y scan range:', 8), ('x center:', 4), ('y center:', 4)]:
+            writer.writerow([key, value])
+        writer.writerow(['end:', 'end of header'])
+        writer.writerow(['x_raw', 'y_raw', 'x_iphoto', 'y_iphoto', 'x_pixel', 'y_pixel', 'dwell'])
+        for x_ind, y_ind in order[:int(len(order) * fraction)]:
+            raw = rng.normal(size=2) * 1e-5
+            writer.writerow([raw[0], raw[1], raw[0] / 1000, raw[1] / 1000, x_ind, y_ind, 0.01])
+
+
+def check(filename):
+    """Checks that both loaders agree on a complete map"""
+    x, y = legacy_load(filename)
+    map_data = map_loader.load_map(filename, cut=False)
+    if not (np.allclose(x, map_data.x.T) and np.allclose(y, map_data.y.T)):
+        raise ValueError('loaders disagree on {}'.format(filename))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark loading map scan files')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[50, 200], help='map pixels per side')
+    parser.add_argument('--repeat', type=int, default=5, help='loads per measurement, the best is reported')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            complete = os.path.join(directory, 'complete_{}.csv'.format(size))
+            aborted = os.path.join(directory, 'aborted_{}.csv'.format(size))
+            write_map(complete, size)
+            write_map(aborted, size, fraction=0.6)
+            check(complete)
+            legacy = min(timeit.repeat(lambda: legacy_load(complete), number=1, repeat=args.repeat))
+            loader = min(timeit.repeat(lambda: map_loader.load_map(complete), number=1, repeat=args.repeat))
+            every = min(timeit.repeat(lambda: map_loader.load_map(complete, columns=None), number=1,
+                                      repeat=args.repeat))
+            partial = min(timeit.repeat(lambda: map_loader.load_map(aborted), number=1, repeat=args.repeat))
+            print('{0}x{0}: legacy {1:.1f} ms, map loader {2:.1f} ms ({3:.1f}x), every column {4:.1f} ms, '
+                  'aborted scan {5:.1f} ms'.format(size, legacy * 1000, loader * 1000, legacy / loader, every * 1000,
+                                                   partial * 1000))
+            # the legacy loader cannot reshape an aborted scan
+            print('    aborted scan: {} of {} pixels measured'.format(
+                int(map_loader.load_map(aborted).measured.sum()), size * size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""Throughput benchmark of the map, time and polarization measurements against the simulated instruments in
+optics.simulation. Every run reports points (pixels) per second, the p50 and p99 latency of each phase of a point
+(motion, dwell, usb, csv, update, draw) and the peak Python memory, and the results can be saved as JSON and compared
+with the results of an earlier version to catch regressions. The measurements draw into tkinter windows, so a display
+is needed (use xvfb-run on a headless computer).
+
+python -m optics.benchmarks.measurement_benchmark --sizes 10 50 --output new.json --compare old.json"""
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import tkinter as tk
+from contextlib import ExitStack
+
+import optics.hardware_control.hardware_addresses_and_constants as hw
+from optics.benchmarks.phase_timer import PhaseTimer, TimedWriter
+from optics.heating_measurement.heating_map import HeatingMapScan
+from optics.simulation.simulated_setup import SimulatedSetup
+from optics.thermovoltage_measurement.thermovoltage_map import ThermovoltageMapScan
+from optics.thermovoltage_measurement.thermovoltage_polarization import ThermovoltagePolarization
+from optics.thermovoltage_measurement.thermovoltage_time import ThermovoltageTime
+
+PROFILES = {'fast': dict(usb_latency=0.0005, motor_latency=0.001, polling_ms=10, stage_velocity=20,
+                         stage_acceleration=200, rotator_velocity=100, rotator_acceleration=500, time_constant=1e-3),
+            'realistic': dict()}  # the defaults of SimulatedSetup
+PHASES = ['motion', 'dwell', 'usb', 'csv', 'update', 'draw']
+
+
+def version():
+    """Returns the git description of the checked out version of optics"""
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def instrument(timer, setup, measurement, motors):
+    """Times the phases of a measurement. USB I/O is timed at the simulated lock in device, so every command counts,
+    including those of the settle policy and of the header"""
+    timer.wrap(setup.lockin, 'write', 'usb')
+    timer.wrap(setup.lockin, 'read', 'usb')
+    for motor in motors:
+        for attribute in ('move', 'start_move', 'home'):
+            if hasattr(motor, attribute):
+                timer.wrap(motor, attribute, 'motion')
+    timer.wrap(measurement._settle, 'settle', 'dwell')
+    timer.wrap(measurement, 'do_measurement', 'update')
+    for attribute in ('draw', 'blit'):
+        timer.wrap(measurement._canvas, attribute, 'draw')
+    write_header = measurement.write_header
+
+    def timed_header(writer, **kwargs):
+        measurement._writer = TimedWriter(writer, timer)
+        write_header(measurement._writer, **kwargs)
+    measurement.write_header = timed_header
+
+
+def run(root, setup, name, size, mode, create, motors, memory=True):
+    """Creates a measurement in a new window with create(master, filepath), runs it and returns its results"""
+    timer = PhaseTimer()
+    with tempfile.TemporaryDirectory() as filepath:
+        master = tk.Toplevel(root)
+        try:
+            measurement = create(master, filepath)
+            instrument(timer, setup, measurement, motors)
+            if memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            measurement.main()
+            wall = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if memory else None
+        finally:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            master.destroy()
+    phases = timer.summary()
+    points = timer.count('update')
+    phases['other'] = {'count': 1, 'total': wall - sum(phase['total'] for phase in phases.values())}
+    return {'measurement': name, 'size': size, 'mode': mode, 'points': points, 'wall': wall,
+            'points_per_second': points / wall if wall else 0, 'peak_memory': peak, 'phases': phases}
+
+
+def benchmark_map(root, profile, size, kind='thermovoltage', mode='step', memory=True):
+    setup = SimulatedSetup(**PROFILES[profile])
+    with ExitStack() as cm:
+        lockin = cm.enter_context(setup.create_endpoints_single(hw.vendor, hw.product))
+        powermeter = cm.enter_context(setup.connect_pm100d(hw.pm100d_address))
+        waveplate = cm.enter_context(setup.connect_tdc001(hw.tdc001_serial_number, waveplate=True))
+        bsc102_y, bsc102_x = cm.enter_context(setup.connect_bsc102(hw.bsc102_serial_number))
+
+        def create(master, filepath):
+            if kind == 'heating':
+                return HeatingMapScan(master, filepath, 'benchmark', 'benchmark', 1, 1000, size, size, 3, 3, 4, 4,
+                                      0, 0, bsc102_x, bsc102_y, lockin, powermeter, waveplate, True, 'y',
+                                      fly=mode == 'fly', adaptive=mode == 'adaptive')
+            return ThermovoltageMapScan(master, filepath, 'benchmark', 'benchmark', 1, 1000, size, size, 3, 3, 4, 4,
+                                        bsc102_x, bsc102_y, lockin, powermeter, waveplate, True, 'y',
+                                        fly=mode == 'fly', adaptive=mode == 'adaptive')
+        return run(root, setup, '{} map'.format(kind), size, mode, create, (bsc102_x, bsc102_y), memory=memory)
+
+
+def benchmark_time(root, profile, rate, maxtime, buffered=False, memory=True):
+    setup = SimulatedSetup(**PROFILES[profile])
+    with ExitStack() as cm:
+        lockin = cm.enter_context(setup.create_endpoints_single(hw.vendor, hw.product))
+        powermeter = cm.enter_context(setup.connect_pm100d(hw.pm100d_address))
+        waveplate = cm.enter_context(setup.connect_tdc001(hw.tdc001_serial_number, waveplate=True))
+
+        def create(master, filepath):
+            return ThermovoltageTime(master, filepath, 'benchmark', 'benchmark', 1, 1000, rate, maxtime, lockin,
+                                     powermeter, waveplate, buffered=buffered)
+        return run(root, setup, 'thermovoltage time', rate, 'buffered' if buffered else 'single', create, (),
+                   memory=memory)
+
+
+def benchmark_polarization(root, profile, steps, memory=True):
+    setup = SimulatedSetup(**PROFILES[profile])
+    with ExitStack() as cm:
+        lockin = cm.enter_context(setup.create_endpoints_single(hw.vendor, hw.product))
+        powermeter = cm.enter_context(setup.connect_pm100d(hw.pm100d_address))
+        waveplate = cm.enter_context(setup.connect_tdc001(hw.tdc001_serial_number, waveplate=True))
+
+        def create(master, filepath):
+            return ThermovoltagePolarization(master, filepath, 'benchmark', 'benchmark', 1, 1000, lockin, powermeter,
+                                             waveplate, steps)
+        return run(root, setup, 'thermovoltage polarization', steps, 'step', create, (waveplate,), memory=memory)
+
+
+def key(result):
+    return result['measurement'], result['mode'], result['size']
+
+
+def compare(baseline, results, tolerance=0.1):
+    """Returns a list of regressions of the results against the baseline results: runs whose throughput dropped or
+    whose peak memory grew by more than the relative tolerance"""
+    previous = {key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results['results']:
+        old = previous.get(key(result))
+        if not old:
+            continue
+        if result['points_per_second'] < old['points_per_second'] * (1 - tolerance):
+            regressions.append('{} {} {}: {:.2f} points/s, was {:.2f}'.format(*key(result),
+                                                                             result['points_per_second'],
+                                                                             old['points_per_second']))
+        if result['peak_memory'] and old['peak_memory'] and \
+                result['peak_memory'] > old['peak_memory'] * (1 + tolerance):
+            regressions.append('{} {} {}: peak memory {:.1f} MB, was {:.1f} MB'.format(
+                *key(result), result['peak_memory'] / 1e6, old['peak_memory'] / 1e6))
+    return regressions
+
+
+def report(result):
+    print('{} {} {}: {} points in {:.2f} s, {:.2f} points/s{}'.format(
+        *key(result), result['points'], result['wall'], result['points_per_second'],
+        ', peak memory {:.1f} MB'.format(result['peak_memory'] / 1e6) if result['peak_memory'] else ''))
+    for name in PHASES:
+        phase = result['phases'].get(name)
+        if phase:
+            print('    {:8} {:7d} calls {:9.3f} s total  p50 {:8.2f} ms  p99 {:8.2f} ms'.format(
+                name, phase['count'], phase['total'], phase['p50'] * 1000, phase['p99'] * 1000))
+    print('    {:8} {:25.3f} s total'.format('other', result['phases']['other']['total']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the measurements against simulated instruments')
+    parser.add_argument('--measurements', nargs='+', default=['map', 'time', 'polarization'],
+                        choices=['map', 'heating_map', 'time', 'polarization'])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10, 50, 100, 200], help='map pixels per side')
+    parser.add_argument('--fly', action='store_true', help='also run the maps in fly scan mode')
+    parser.add_argument('--adaptive', action='store_true', help='also run the maps in adaptive scan mode')
+    parser.add_argument('--rates', nargs='+', type=float, default=[10, 100], help='time measurement rates (Hz)')
+    parser.add_argument('--maxtime', type=float, default=10, help='time measurement duration (s)')
+    parser.add_argument('--steps', type=int, default=20, help='polarization measurement steps (degrees)')
+    parser.add_argument('--profile', default='fast', choices=sorted(PROFILES),
+                        help='simulated instrument speeds. fast shortens motion and dwell so the software shows')
+    parser.add_argument('--no-memory', action='store_true', help='do not trace memory, which slows python down')
+    parser.add_argument('--output', help='JSON file to save the results to')
+    parser.add_argument('--compare', help='JSON results of an earlier version to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='relative change counted as a regression')
+    args = parser.parse_args()
+    memory = not args.no_memory
+    root = tk.Tk()
+    root.withdraw()
+    results = {'version': version(), 'date': datetime.datetime.now().isoformat(), 'profile': args.profile,
+               'python': sys.version.split()[0], 'results': []}
+    runs = []
+    for size in args.sizes:
+        for mode in ['step'] + (['fly'] if args.fly else []) + (['adaptive'] if args.adaptive else []):
+            if 'map' in args.measurements:
+                runs.append(lambda size=size, mode=mode: benchmark_map(root, args.profile, size, mode=mode,
+                                                                       memory=memory))
+            if 'heating_map' in args.measurements:
+                runs.append(lambda size=size, mode=mode: benchmark_map(root, args.profile, size, kind='heating',
+                                                                       mode=mode, memory=memory))
+    if 'time' in args.measurements:
+        for rate in args.rates:
+            for buffered in [False, True]:
+                runs.append(lambda rate=rate, buffered=buffered: benchmark_time(root, args.profile, rate, args.maxtime,
+                                                                                buffered=buffered, memory=memory))
+    if 'polarization' in args.measurements:
+        runs.append(lambda: benchmark_polarization(root, args.profile, args.steps, memory=memory))
+    for benchmark in runs:
+        result = benchmark()
+        report(result)
+        results['results'].append(result)
+    root.destroy()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        for regression in regressions:
+            print('regression: ' + regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import contextlib
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+
+class PhaseTimer:
+    """Collects the time spent in named phases of a measurement. Phases can nest, in any thread, and each sample is
+    the exclusive time of the phase: time spent in a nested phase is only counted for the nested phase. For example a
+    lock in reading inside a dwell counts as usb, not as dwell"""
+    def __init__(self):
+        self._samples = defaultdict(list)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        stack = self._local.stack
+        stack.append([name, 0])  # name and time spent in nested phases
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            _, nested = stack.pop()
+            if stack:
+                stack[-1][1] += elapsed
+            with self._lock:
+                self._samples[name].append(elapsed - nested)
+
+    def wrap(self, obj, attribute, name):
+        """Replaces a method of an instance with one that is timed as the named phase"""
+        method = getattr(obj, attribute)
+
+        def timed(*args, **kwargs):
+            with self.phase(name):
+                return method(*args, **kwargs)
+        setattr(obj, attribute, timed)
+
+    def count(self, name):
+        return len(self._samples.get(name, []))
+
+    def summary(self):
+        """Returns a dictionary of phase name to the number of samples, the total time and the p50 and p99 latency of
+        a sample in seconds"""
+        with self._lock:
+            samples = {name: np.array(values) for name, values in self._samples.items()}
+        return {name: {'count': len(values), 'total': float(np.sum(values)),
+                       'p50': float(np.percentile(values, 50)), 'p99': float(np.percentile(values, 99))}
+                for name, values in samples.items() if len(values)}
+
+
+class TimedWriter:
+    """csv.writer wrapper that times every row as the named phase"""
+    def __init__(self, writer, timer, name='csv'):
+        self._writer = writer
+        self._timer = timer
+        self._name = name
+
+    def writerow(self, row):
+        with self._timer.phase(self._name):
+            return self._writer.writerow(row)
+
+    def writerows(self, rows):
+        with self._timer.phase(self._name):
+            return self._writer.writerows(rows)
+
+    def sync(self):
+        with self._timer.phase(self._name):
+            return self._writer.sync()
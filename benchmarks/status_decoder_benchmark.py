@@ -0,0 +1,92 @@
+"""Microbenchmark of the parse cost of one SR7270 response: the bytes read from USB to the list of values, with the
+status and overload bytes checked. The string based parser that LockIn used before the lookup table decoder is kept
+here as the baseline. No hardware is needed.
+
+python -m optics.benchmarks.status_decoder_benchmark"""
+import argparse
+import array
+import timeit
+from collections import OrderedDict
+
+from optics.hardware_control.sr7270 import LockIn
+
+
+def legacy_read_dev(raw):
+    return ''.join(chr(x) for x in raw)
+
+
+def legacy_check_status(i):
+    """LockIn.check_status before the lookup table decoder. Returns the values and the overload and unlock flags"""
+    overloaded = False
+    unlocked = False
+    status_codes = OrderedDict({'command complete': 0, 'invalid command': 'Invalid lock in command',
+                                'invalid command parameter': 'Invalid lock in command parameter',
+                                'reference unlock': 0,
+                                'output overload': 0,
+                                'new ADC after trigger': 0,
+                                'input overload': 'Lock in input overload',
+                                'data available': 0})
+    overload_codes = ['X1', 'Y1', 'X2', 'Y2', 'CH1', 'CH2', 'CH3', 'CH4']
+    status_bytes = [x for x in i[-2::]]
+    i = i[0:-3].replace('\n', '')
+    if status_bytes[0] == '!':
+        return ([float(j) for j in i.split(',')] if i else None), overloaded, unlocked
+    for j, k in enumerate(reversed(bin(ord(status_bytes[0])))):
+        if k == '1':
+            if status_codes[list(status_codes.keys())[j]]:
+                if status_codes[list(status_codes.keys())[j]] != 'Lock in input overload':
+                    raise ValueError(status_codes[list(status_codes.keys())[j]])
+            if list(status_codes.keys())[j] == 'reference unlock':
+                unlocked = True
+            else:
+                if list(status_codes.keys())[j] == 'output overload':
+                    for l, m in enumerate(reversed(bin(ord(status_bytes[1])))):
+                        if m == '1':
+                            if overload_codes[l] == 'X1' or overload_codes[l] == 'Y1':
+                                overloaded = True
+    return ([float(j) for j in i.split(',')] if i else None), overloaded, unlocked
+
+
+class _Decoder(LockIn):
+    """LockIn without a device, for parsing only"""
+    def __init__(self):
+        self._overload = False
+        self._unlocked = False
+
+
+def response(text, status, overload=0):
+    """Returns a response as pyusb returns it, an array of unsigned bytes"""
+    return array.array('B', text.encode('latin-1') + b'\n\x00' + bytes([status, overload]))
+
+
+def check(decoder, responses):
+    """Checks that both parsers agree on every response"""
+    for raw in responses:
+        legacy = legacy_check_status(legacy_read_dev(raw))
+        values = decoder.check_status(bytes(raw))
+        if legacy != (values, decoder._overload, decoder._unlocked):
+            raise ValueError('parsers disagree on {}: {} and {}'.format(
+                bytes(raw), legacy, (values, decoder._overload, decoder._unlocked)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the SR7270 response parser')
+    parser.add_argument('--number', type=int, default=100000, help='parses per measurement')
+    args = parser.parse_args()
+    decoder = _Decoder()
+    responses = {'xy.': response('1.23450E-05,-6.78900E-06', 0x81),
+                 'tc.': response('1.00000E-01', 0x01),
+                 'dac 3 50': response('', 0x01),
+                 'xy. unlocked': response('1.23450E-05,-6.78900E-06', 0x89)}
+    check(decoder, list(responses.values()) + [response('1.0,2.0', 0x20 + status) for status in range(0, 32, 8)] +
+          [response('1.0,2.0', 0x11, 0x01), response('1.0,2.0', 0x19, 0x04), response('1.0', ord('!'))])
+    print('{:14} {:>12} {:>12} {:>8}'.format('response', 'before (us)', 'after (us)', 'speedup'))
+    for name, raw in responses.items():
+        before = timeit.timeit(lambda: legacy_check_status(legacy_read_dev(raw)), number=args.number)
+        after = timeit.timeit(lambda: decoder.check_status(bytes(raw)), number=args.number)
+        print('{:14} {:12.2f} {:12.2f} {:7.1f}x'.format(name, before / args.number * 1e6, after / args.number * 1e6,
+                                                        before / after))
+
+
+if __name__ == '__main__':
+    main()
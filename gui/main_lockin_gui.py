@@ -1,12 +1,13 @@
 import matplotlib
 
-matplotlib.use('Qt4Agg')  # this allows you to see the interactive plots!
+matplotlib.use('TkAgg')  # this allows you to see the interactive plots!
 import tkinter as tk
 from optics.hardware_control import pm100d, sr7270, polarizercontroller, bsc102controller
 import optics.hardware_control.hardware_addresses_and_constants as hw
 from optics.thermovoltage_measurement.thermovoltage_polarization import ThermovoltagePolarization, \
     ThermovoltagePolarizationRT
 from optics.thermovoltage_measurement.thermovoltage_map import ThermovoltageMapScan
+from optics.thermovoltage_measurement.thermovoltage_polarization_map import ThermovoltagePolarizationMapScan
 from optics.thermovoltage_measurement.thermovoltage_time import ThermovoltageTime, ThermovoltageTimeRT
 from optics.heating_measurement.heating_time import HeatingTime, HeatingTimeRT
 from optics.heating_measurement.heating_polarization import HeatingPolarization, HeatingPolarizationRT
@@ -50,7 +51,8 @@ class BaseLockinGUI(BaseGUI):
                        'measureresistance': self._app.build_measure_resistance_gui,
                        'changeposition': self._app.build_change_position_gui,
                        'ptemap': self._app.build_thermvoltage_map_gui,
-                       'heatingmap': self._app.build_heating_map_gui}
+                       'heatingmap': self._app.build_heating_map_gui,
+                       'ptepolarizationmap': self._app.build_thermovoltage_polarization_map_gui}
         measurement[measurementtype]()
 
     def build(self):
@@ -58,6 +60,8 @@ class BaseLockinGUI(BaseGUI):
         if self._bsc102_x and self._bsc102_y:
             self.make_measurement_button(row, 'thermovoltage', 'ptemap')
             self.make_measurement_button(row, 'heating', 'heatingmap')
+            if self._waveplate:
+                self.make_measurement_button(row, 'thermovoltage polarization', 'ptepolarizationmap')
         else:
             self.makerow('BSC102 Stepper Motor not connected', side=None, width=20)
         row = self.makerow('polarization scans')
@@ -104,6 +108,18 @@ class LockinMeasurementGUI(BaseGUI):
         self._direction.set('Forward')
         self._axis = tk.StringVar()
         self._axis.set('y')
+        self._scan_mode = tk.StringVar()
+        self._scan_mode.set('Step')
+        self._path = tk.StringVar()
+        self._path.set('Serpentine')
+        self._order = tk.StringVar()
+        self._order.set('Auto')
+        self._acquisition = tk.StringVar()
+        self._acquisition.set('Single point')
+        self._storage = tk.StringVar()
+        self._storage.set('csv')
+        self._ranging = tk.StringVar()
+        self._ranging.set('On overload')
         self._current_gain = tk.StringVar()
         self._current_gain.set('1 mA/V')
         self._voltage_gain = tk.StringVar()
@@ -130,22 +146,19 @@ class LockinMeasurementGUI(BaseGUI):
 
     def changeposition(self, event=None):
         self.fetch(event)
-        self._bsc102_x.move(float(self._inputs['x']))
-        self._bsc102_y.move(float(self._inputs['y']))
+        bsc102controller.move_xy(self._bsc102_x, self._bsc102_y, float(self._inputs['x']), float(self._inputs['y']))
         self._textbox.delete(1.0, tk.END)
         self._textbox.insert(tk.END, [self._bsc102_x.read_position(), self._bsc102_y.read_position()])
         self._textbox.pack()
 
     def center_beam(self):
-        self._bsc102_x.move(4)
-        self._bsc102_y.move(4)
+        bsc102controller.move_xy(self._bsc102_x, self._bsc102_y, 4, 4)
         self._textbox.delete(1.0, tk.END)
         self._textbox.insert(tk.END, [self._bsc102_x.read_position(), self._bsc102_y.read_position()])
         self._textbox.pack()
 
     def home(self):
-        self._bsc102_y.home()
-        self._bsc102_x.home()
+        bsc102controller.home_xy(self._bsc102_x, self._bsc102_y)
         self._textbox.delete(1.0, tk.END)
         self._textbox.insert(tk.END, [self._bsc102_x.read_position(), self._bsc102_y.read_position()])
         self._textbox.pack()
@@ -153,11 +166,16 @@ class LockinMeasurementGUI(BaseGUI):
     def build_thermvoltage_map_gui(self):
         caption = "Thermovoltage map scan"
         self._fields = {'file path': "", 'device': "", 'scan': 0, 'notes': "", 'x pixel density': 20,
-                        'y pixel density': 20, 'x range': 8, 'y range': 8, 'x center': 4, 'y center': 4}
+                        'y pixel density': 20, 'x range': 8, 'y range': 8, 'x center': 4, 'y center': 4,
+                        'frames': 1, 'target sem (uV)': "", 'resume checkpoint': ""}
         self.beginform(caption)
         self.make_option_menu('gain', self._voltage_gain, self._voltage_gain_options)
         self.make_option_menu('direction', self._direction, ['Forward', 'Reverse'])
         self.make_option_menu('cutthrough axis', self._axis, ['x', 'y'])
+        self.make_option_menu('scan mode', self._scan_mode, ['Step', 'Fly', 'Adaptive'])
+        self.make_option_menu('step path', self._path, ['Serpentine', 'Hilbert', 'Nearest neighbour'])
+        self.make_option_menu('file format', self._storage, ['csv', 'hdf5', 'npz'])
+        self.make_option_menu('sensitivity ranging', self._ranging, ['On overload', 'Remember per region'])
         self.endform(self.thermovoltage_scan)
 
     def thermovoltage_scan(self, event=None):
@@ -172,18 +190,64 @@ class LockinMeasurementGUI(BaseGUI):
                                    float(self._inputs['x range']), float(self._inputs['y range']),
                                    float(self._inputs['x center']), float(self._inputs['y center']),
                                    self._bsc102_x, self._bsc102_y, self._sr7270_single_reference, self._powermeter,
-                                   self._waveplate, direction,self._axis.get())
+                                   self._waveplate, direction, self._axis.get(),
+                                   fly=self._scan_mode.get() == 'Fly', storage=self._storage.get(),
+                                   adaptive=self._scan_mode.get() == 'Adaptive', path=self._path.get().lower(),
+                                   frames=int(self._inputs['frames']),
+                                   target_sem=float(self._inputs['target sem (uV)'] or 0) or None,
+                                   resume=self._inputs['resume checkpoint'] or None,
+                                   ranging=self._ranging.get() == 'Remember per region')
+        run.main()
+
+    def build_thermovoltage_polarization_map_gui(self):
+        caption = "Thermovoltage polarization map scan"
+        self._fields = {'file path': "", 'device': "", 'scan': 0, 'notes': "", 'x pixel density': 20,
+                        'y pixel density': 20, 'x range': 8, 'y range': 8, 'x center': 4, 'y center': 4,
+                        'polarization angles': 6, 'resume checkpoint': ""}
+        self.beginform(caption)
+        self.make_option_menu('gain', self._voltage_gain, self._voltage_gain_options)
+        self.make_option_menu('direction', self._direction, ['Forward', 'Reverse'])
+        self.make_option_menu('cutthrough axis', self._axis, ['x', 'y'])
+        self.make_option_menu('scan mode', self._scan_mode, ['Step', 'Fly'])
+        self.make_option_menu('step path', self._path, ['Serpentine', 'Hilbert', 'Nearest neighbour'])
+        self.make_option_menu('angle order', self._order, ['Auto', 'Pixel', 'Map'])
+        self.make_option_menu('file format', self._storage, ['csv', 'hdf5', 'npz'])
+        self.endform(self.thermovoltage_polarization_map)
+
+    def thermovoltage_polarization_map(self, event=None):
+        self.fetch(event)
+        if self._direction.get() == 'Reverse':
+            direction = False
+        else:
+            direction = True
+        run = ThermovoltagePolarizationMapScan(tk.Toplevel(self._master), self._inputs['file path'],
+                                               self._inputs['notes'], self._inputs['device'], int(self._inputs['scan']),
+                                               float(self._voltage_gain.get()), int(self._inputs['x pixel density']),
+                                               int(self._inputs['y pixel density']), float(self._inputs['x range']),
+                                               float(self._inputs['y range']), float(self._inputs['x center']),
+                                               float(self._inputs['y center']), self._bsc102_x, self._bsc102_y,
+                                               self._sr7270_single_reference, self._powermeter, self._waveplate,
+                                               direction, self._axis.get(),
+                                               angles=int(self._inputs['polarization angles']),
+                                               order=self._order.get().lower(), fly=self._scan_mode.get() == 'Fly',
+                                               storage=self._storage.get(), path=self._path.get().lower(),
+                                               resume=self._inputs['resume checkpoint'] or None)
         run.main()
 
     def build_heating_map_gui(self):
         caption = "Heating map scan"
         self._fields = {'file path': "", 'device': "", 'scan': 0, 'notes': "", 'x pixel density': 20,
                         'y pixel density': 20, 'x range': 8, 'y range': 8, 'x center': 4, 'y center': 4,
-                        'bias (mV)': 5, 'oscillator amplitude (mV)': 0.7}
+                        'bias (mV)': 5, 'oscillator amplitude (mV)': 0.7, 'frames': 1, 'target sem (mA)': "",
+                        'resume checkpoint': ""}
         self.beginform(caption)
         self.make_option_menu('gain', self._voltage_gain, self._voltage_gain_options)
         self.make_option_menu('direction', self._direction, ['Forward', 'Reverse'])
         self.make_option_menu('cutthrough axis', self._axis, ['x', 'y'])
+        self.make_option_menu('scan mode', self._scan_mode, ['Step', 'Fly', 'Adaptive'])
+        self.make_option_menu('step path', self._path, ['Serpentine', 'Hilbert', 'Nearest neighbour'])
+        self.make_option_menu('file format', self._storage, ['csv', 'hdf5', 'npz'])
+        self.make_option_menu('sensitivity ranging', self._ranging, ['On overload', 'Remember per region'])
         self.endform(self.heating_scan)
 
     def heating_scan(self, event=None):
@@ -199,7 +263,13 @@ class LockinMeasurementGUI(BaseGUI):
                              float(self._inputs['x center']), float(self._inputs['y center']),
                              float(self._inputs['bias (mV)']), float(self._inputs['oscillator amplitude (mV)']),
                              self._bsc102_x, self._bsc102_y, self._sr7270_single_reference, self._powermeter,
-                             self._waveplate, direction,self._axis.get())
+                             self._waveplate, direction, self._axis.get(),
+                             fly=self._scan_mode.get() == 'Fly', storage=self._storage.get(),
+                             adaptive=self._scan_mode.get() == 'Adaptive', path=self._path.get().lower(),
+                             frames=int(self._inputs['frames']),
+                             target_sem=float(self._inputs['target sem (mA)'] or 0) or None,
+                             resume=self._inputs['resume checkpoint'] or None,
+                             ranging=self._ranging.get() == 'Remember per region')
         run.main()
 
 
@@ -208,7 +278,8 @@ class LockinMeasurementGUI(BaseGUI):
         run = ThermovoltageTime(tk.Toplevel(self._master), self._inputs['file path'], self._inputs['notes'],
                                 self._inputs['device'], int(self._inputs['scan']), float(self._voltage_gain.get()),
                                 float(self._inputs['rate (per second)']), float(self._inputs['max time (s)']),
-                                self._sr7270_single_reference, self._powermeter, self._waveplate)
+                                self._sr7270_single_reference, self._powermeter, self._waveplate,
+                                buffered=self._acquisition.get() == 'Buffered', storage=self._storage.get())
         run.main()
 
     def thermovoltage_time_rt(self, event=None):
@@ -216,7 +287,8 @@ class LockinMeasurementGUI(BaseGUI):
         run = ThermovoltageTimeRT(tk.Toplevel(self._master), self._inputs['file path'], self._inputs['notes'],
                                 self._inputs['device'], int(self._inputs['scan']), float(self._voltage_gain.get()),
                                 float(self._inputs['rate (per second)']), float(self._inputs['max time (s)']),
-                                self._sr7270_single_reference, self._powermeter, self._waveplate)
+                                self._sr7270_single_reference, self._powermeter, self._waveplate,
+                                buffered=self._acquisition.get() == 'Buffered', storage=self._storage.get())
         run.main()
 
     def heating_time(self, event=None):
@@ -226,7 +298,8 @@ class LockinMeasurementGUI(BaseGUI):
                           float(self._current_amplifier_gain_options[self._current_gain.get()]),
                           float(self._inputs['rate (per second)']), float(self._inputs['max time (s)']),
                           float(self._inputs['bias (mV)']), float(self._inputs['oscillator amplitude (mV)']),
-                          self._sr7270_single_reference, self._powermeter, self._waveplate)
+                          self._sr7270_single_reference, self._powermeter, self._waveplate,
+                          buffered=self._acquisition.get() == 'Buffered', storage=self._storage.get())
         run.main()
 
     def heating_time_rt(self, event=None):
@@ -236,7 +309,8 @@ class LockinMeasurementGUI(BaseGUI):
                           float(self._current_amplifier_gain_options[self._current_gain.get()]),
                           float(self._inputs['rate (per second)']), float(self._inputs['max time (s)']),
                           float(self._inputs['bias (mV)']), float(self._inputs['oscillator amplitude (mV)']),
-                          self._sr7270_single_reference, self._powermeter, self._waveplate)
+                          self._sr7270_single_reference, self._powermeter, self._waveplate,
+                          buffered=self._acquisition.get() == 'Buffered', storage=self._storage.get())
         run.main()
 
     def changepolarization(self):
@@ -255,12 +329,18 @@ class LockinMeasurementGUI(BaseGUI):
     def homewaveplate(self):
         self._waveplate.home()
 
+    def fit_tolerance(self):
+        """Relative standard error of the fitted amplitude at which a polarization sweep stops, None to always
+        complete it"""
+        return float(self._inputs['fit tolerance (%)']) / 100 if self._inputs['fit tolerance (%)'] else None
+
     def thermovoltage_polarization(self, event=None):
         self.fetch(event)
         run = ThermovoltagePolarization(tk.Toplevel(self._master), self._inputs['file path'], self._inputs['notes'],
                                         self._inputs['device'], int(self._inputs['scan']),
                                         float(self._voltage_gain.get()), self._sr7270_single_reference,
-                                        self._powermeter, self._waveplate, int(self._inputs['polarization steps']))
+                                        self._powermeter, self._waveplate, int(self._inputs['polarization steps']),
+                                        fit_tolerance=self.fit_tolerance())
         run.main()
 
     def heating_polarization(self, event=None):
@@ -270,7 +350,7 @@ class LockinMeasurementGUI(BaseGUI):
                                   float(self._current_amplifier_gain_options[self._current_gain.get()]),
                                   float(self._inputs['bias (mV)']), float(self._inputs['oscillator amplitude (mV)']),
                                   self._sr7270_single_reference, self._powermeter, self._waveplate,
-                                  int(self._inputs['polarization steps']))
+                                  int(self._inputs['polarization steps']), fit_tolerance=self.fit_tolerance())
         run.main()
 
     def thermovoltage_polarization_rt(self, event=None):
@@ -278,7 +358,8 @@ class LockinMeasurementGUI(BaseGUI):
         run = ThermovoltagePolarizationRT(tk.Toplevel(self._master), self._inputs['file path'], self._inputs['notes'],
                                         self._inputs['device'], int(self._inputs['scan']),
                                         float(self._voltage_gain.get()), self._sr7270_single_reference,
-                                        self._powermeter, self._waveplate, int(self._inputs['polarization steps']))
+                                        self._powermeter, self._waveplate, int(self._inputs['polarization steps']),
+                                        fit_tolerance=self.fit_tolerance())
         run.main()
 
     def heating_polarization_rt(self, event=None):
@@ -288,7 +369,7 @@ class LockinMeasurementGUI(BaseGUI):
                                   float(self._current_amplifier_gain_options[self._current_gain.get()]),
                                   float(self._inputs['bias (mV)']), float(self._inputs['oscillator amplitude (mV)']),
                                   self._sr7270_single_reference, self._powermeter, self._waveplate,
-                                  int(self._inputs['polarization steps']))
+                                  int(self._inputs['polarization steps']), fit_tolerance=self.fit_tolerance())
         run.main()
 
     def change_single_reference_lockin_parameters(self, event=None):
@@ -298,8 +379,8 @@ class LockinMeasurementGUI(BaseGUI):
         if self._sen.get() != '':
             self._sr7270_single_reference.change_sensitivity(float(self._sen.get()))
         print('lock in parameters: \ntime constant: {} ms\nsensitivity: {} '
-              'mV'.format(self._sr7270_single_reference.read_tc() * 1000,
-                          self._sr7270_single_reference.read_sensitivity() * 1000))
+              'mV'.format(self._sr7270_single_reference.read_tc(refresh=True) * 1000,
+                          self._sr7270_single_reference.read_sensitivity(refresh=True) * 1000))
 
     def build_thermovoltage_time_gui(self):
         caption = "Thermovoltage vs. time"
@@ -307,6 +388,8 @@ class LockinMeasurementGUI(BaseGUI):
                         'max time (s)': 300}
         self.beginform(caption)
         self.make_option_menu('gain', self._voltage_gain, self._voltage_gain_options)
+        self.make_option_menu('acquisition', self._acquisition, ['Single point', 'Buffered'])
+        self.make_option_menu('file format', self._storage, ['csv', 'hdf5', 'npz'])
         self.endform(self.thermovoltage_time)
 
     def build_thermovoltage_time_rt_gui(self):
@@ -315,6 +398,8 @@ class LockinMeasurementGUI(BaseGUI):
                         'max time (s)': 300}
         self.beginform(caption)
         self.make_option_menu('gain', self._voltage_gain, self._voltage_gain_options)
+        self.make_option_menu('acquisition', self._acquisition, ['Single point', 'Buffered'])
+        self.make_option_menu('file format', self._storage, ['csv', 'hdf5', 'npz'])
         self.endform(self.thermovoltage_time_rt)
 
     def build_change_polarization_gui(self):  # TODO fix this
@@ -330,14 +415,16 @@ class LockinMeasurementGUI(BaseGUI):
 
     def build_thermovoltage_polarization_gui(self):
         caption = "Thermovoltage vs. polarization"
-        self._fields = {'file path': "", 'device': "", 'scan': 0, 'notes': "", 'polarization steps': 5}
+        self._fields = {'file path': "", 'device': "", 'scan': 0, 'notes': "", 'polarization steps': 5,
+                        'fit tolerance (%)': ""}
         self.beginform(caption)
         self.make_option_menu('gain', self._voltage_gain, self._voltage_gain_options)
         self.endform(self.thermovoltage_polarization)
 
     def build_thermovoltage_polarization_rt_gui(self):
         caption = "Thermovoltage vs. polarization R vs theta"
-        self._fields = {'file path': "", 'device': "", 'scan': 0, 'notes': "", 'polarization steps': 5}
+        self._fields = {'file path': "", 'device': "", 'scan': 0, 'notes': "", 'polarization steps': 5,
+                        'fit tolerance (%)': ""}
         self.beginform(caption)
         self.make_option_menu('gain', self._voltage_gain, self._voltage_gain_options)
         self.endform(self.thermovoltage_polarization_rt)
@@ -345,7 +432,8 @@ class LockinMeasurementGUI(BaseGUI):
     def build_heating_polarization_gui(self):
         caption = "Heating vs. polarization"
         self._fields = {'file path': "", 'device': "", 'scan': 0, 'notes': "", 'bias (mV)': 5,
-                        'oscillator amplitude (mV)': 7, 'polarization steps': 5}
+                        'oscillator amplitude (mV)': 7, 'polarization steps': 5,
+                        'fit tolerance (%)': ""}
         self.beginform(caption)
         self.make_option_menu('gain', self._current_gain, self._current_amplifier_gain_options.keys())
         self.endform(self.heating_polarization)
@@ -353,7 +441,8 @@ class LockinMeasurementGUI(BaseGUI):
     def build_heating_polarization_rt_gui(self):
         caption = "Heating vs. polarization R vs Theta"
         self._fields = {'file path': "", 'device': "", 'scan': 0, 'notes': "", 'bias (mV)': 5,
-                        'oscillator amplitude (mV)': 7, 'polarization steps': 5}
+                        'oscillator amplitude (mV)': 7, 'polarization steps': 5,
+                        'fit tolerance (%)': ""}
         self.beginform(caption)
         self.make_option_menu('gain', self._current_gain, self._current_amplifier_gain_options.keys())
         self.endform(self.heating_polarization_rt)
@@ -364,6 +453,8 @@ class LockinMeasurementGUI(BaseGUI):
                         'max time (s)': 300, 'bias (mV)': 5, 'oscillator amplitude (mV)': 7}
         self.beginform(caption)
         self.make_option_menu('gain', self._current_gain, self._current_amplifier_gain_options.keys())
+        self.make_option_menu('acquisition', self._acquisition, ['Single point', 'Buffered'])
+        self.make_option_menu('file format', self._storage, ['csv', 'hdf5', 'npz'])
         self.endform(self.heating_time)
 
     def build_heating_time_rt_gui(self):
@@ -372,6 +463,8 @@ class LockinMeasurementGUI(BaseGUI):
                         'max time (s)': 300, 'bias (mV)': 5, 'oscillator amplitude (mV)': 7}
         self.beginform(caption)
         self.make_option_menu('gain', self._current_gain, self._current_amplifier_gain_options.keys())
+        self.make_option_menu('acquisition', self._acquisition, ['Single point', 'Buffered'])
+        self.make_option_menu('file format', self._storage, ['csv', 'hdf5', 'npz'])
         self.endform(self.heating_time_rt)
 
     def build_single_reference_gui(self):
@@ -1,23 +1,64 @@
-import clr  # installs DOTNET DLLs
 import contextlib
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-sys.path.append("C:\\Program Files\\Thorlabs\\Kinesis") #  adds DLL path to PATH
+try:
+    import clr  # installs DOTNET DLLs
+except ImportError:  # Kinesis only exists on the Windows measurement computer. See optics.simulation
+    clr = None
 
-#  DOTNET (x64) DLLs. These need to be UNBLOCKED to be found (right click -> properties -> unblock
-#  This uses Python For DotNet NOT IronPython
+if clr:
+    sys.path.append("C:\\Program Files\\Thorlabs\\Kinesis") #  adds DLL path to PATH
 
-clr.AddReference("Thorlabs.MotionControl.Benchtop.StepperMotorCLI")  # TDC001 DLL
-clr.AddReference("Thorlabs.MotionControl.DeviceManagerCLI")
-clr.AddReference("Thorlabs.MotionControl.GenericMotorCLI")
-clr.AddReference("System")
+    #  DOTNET (x64) DLLs. These need to be UNBLOCKED to be found (right click -> properties -> unblock
+    #  This uses Python For DotNet NOT IronPython
 
-# It's going to look like there's errors here but that's because I'm installing the DOTNET libraries as if they are
-# python packages
-from Thorlabs.MotionControl.DeviceManagerCLI import DeviceManagerCLI
-from Thorlabs.MotionControl.Benchtop.StepperMotorCLI import BenchtopStepperMotor
-from System import Decimal
+    clr.AddReference("Thorlabs.MotionControl.Benchtop.StepperMotorCLI")  # TDC001 DLL
+    clr.AddReference("Thorlabs.MotionControl.DeviceManagerCLI")
+    clr.AddReference("Thorlabs.MotionControl.GenericMotorCLI")
+    clr.AddReference("System")
+
+    # It's going to look like there's errors here but that's because I'm installing the DOTNET libraries as if they are
+    # python packages
+    from Thorlabs.MotionControl.DeviceManagerCLI import DeviceManagerCLI
+    from Thorlabs.MotionControl.Benchtop.StepperMotorCLI import BenchtopStepperMotor
+    from System import Action, Decimal, UInt64
+else:
+    from decimal import Decimal
+
+
+def _completion(callback):
+    """Wraps a python function as the completion callback of the Kinesis MoveTo and Home methods, which is called with
+    the task id when the move is complete"""
+    if clr:
+        return Action[UInt64](callback)
+    return callback
+
+
+def start_move_xy(x_stage, y_stage, x=None, y=None):
+    """Starts moving the X and Y channels of a BSC102 to x and y at the same time and returns the futures of the moves.
+    An axis whose position is None is not moved"""
+    moves = []
+    if x is not None:
+        moves.append(x_stage.move_async(x))
+    if y is not None:
+        moves.append(y_stage.move_async(y))
+    return moves
+
+
+def move_xy(x_stage, y_stage, x, y):
+    """Moves the X and Y channels of a BSC102 to x and y at the same time, so a diagonal move takes as long as the
+    longer of the two axis moves instead of their sum. Returns when both moves are complete"""
+    for move in start_move_xy(x_stage, y_stage, x, y):
+        move.result()
+
+
+def home_xy(x_stage, y_stage):
+    """Homes the X and Y channels of a BSC102 at the same time"""
+    for move in [x_stage.home_async(), y_stage.home_async()]:
+        move.result()
 
 
 @contextlib.contextmanager
@@ -27,6 +68,7 @@ def connect_bsc102(serial_number):
     C:\ProgramData\Microsoft\Windows\Start Menu\Programs\Thorlabs\Kinesis\.Net API Help"""
     device = None
     ch = []
+    controllers = []
     try:
         DeviceManagerCLI.BuildDeviceList()
         # Tell the device manager to get the list of all devices connected to the computer
@@ -47,8 +89,11 @@ def connect_bsc102(serial_number):
             ch[i].EnableDevice()
             motorSettings = ch[i].LoadMotorConfiguration(ch[i].DeviceID)
             currentDeviceSettings = ch[i].MotorDeviceSettings
-        yield (StepperMotorController(ch[0]), StepperMotorController(ch[1]))
+        controllers = [StepperMotorController(ch[0]), StepperMotorController(ch[1])]
+        yield tuple(controllers)
     finally:
+        for controller in controllers:
+            controller.close()
         if ch:
             for i in ch:
                 i.StopPolling()
@@ -60,26 +105,97 @@ def connect_bsc102(serial_number):
 
 
 class StepperMotorController:
-    def __init__(self, ch):
-        """Stepper Motor Controller for Thorlabs BSC102. Inputs are a single channel from the context manager"""
+    def __init__(self, ch, timeout=60, poll_interval=0.01, callbacks=False):
+        """Stepper Motor Controller for Thorlabs BSC102. Inputs are a single channel from the context manager. The
+        Kinesis completion callbacks are not verified on the BSC102, where a wait handler once gave an error with
+        MoveTo, so moves wait on the controller and poll the status unless callbacks is set"""
         self._ch = ch
+        self._timeout = timeout  # seconds a move or home may take
+        self._poll_interval = poll_interval
+        self._callbacks = callbacks
+        # moves and homes of this channel are commanded one after the other from this thread, so the caller does not
+        # wait and both channels can move at the same time
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()  # _idle is written from the executor thread and from the caller's thread
+        self._idle = False  # the last move was confirmed complete
         self.home()
 
+    def _run(self, command):
+        """Runs in the executor thread. Starts a move and waits for it to complete, for its completion callback if
+        callbacks is set and otherwise for the controller, after which the status is polled"""
+        with self._lock:
+            idle, self._idle = self._idle, False
+        if not idle:  # the polled status lags the completion, so it is only checked after other commands
+            self.wait_until_complete()
+        if self._callbacks:
+            complete = threading.Event()
+            command(_completion(lambda task: complete.set()))
+            if not complete.wait(self._timeout):
+                raise ValueError('BSC102 move did not complete in {} s'.format(self._timeout))
+        else:
+            command(int(self._timeout * 1000))  # a timeout in ms blocks until the move is complete
+            self.wait_until_complete()
+        with self._lock:
+            self._idle = True
+
+    def move_async(self, position):
+        """Starts a move to an absolute position and returns immediately. Returns a concurrent.futures.Future that
+        resolves to the position when the move is complete. A move requested while another move of this channel is
+        running starts when that one is complete"""
+        if position < 0:
+            position = 0
+        if position > 8:
+            position = 8
+
+        def move():
+            self._run(lambda wait: self._ch.MoveTo(Decimal(position), wait))  # this is a System.Decimal!
+            return position
+        return self._executor.submit(move)
+
+    def home_async(self):
+        """Starts homing and returns a concurrent.futures.Future that resolves when the channel is homed"""
+        return self._executor.submit(self._run, self._ch.Home)
+
     def move(self, position):
         """Move to absolute position"""
+        self.move_async(position).result()
+
+    def start_move(self, position):
+        """Starts a move to an absolute position and returns without waiting for it to complete"""
         if position < 0:
             position = 0
         if position > 8:
             position = 8
         self.wait_until_complete()
-        self._ch.MoveTo(Decimal(position), 60000)  # do not use waiteventhandler here - there is an error
-            # this is a System.Decimal!
+        with self._lock:
+            self._idle = False
+        self._ch.MoveTo(Decimal(position), 0)  # a timeout of 0 returns immediately
+
+    def stop(self):
+        """Stops the channel immediately"""
+        with self._lock:
+            self._idle = False
+        self._ch.StopImmediate()
+
+    def is_moving(self):
+        """Returns a boolean of whether or not the channel is still moving"""
+        return self._ch.Status.IsInMotion or self._ch.IsDeviceBusy
+
+    def read_velocity(self):
+        """Returns the maximum velocity and acceleration used for moves"""
+        params = self._ch.GetVelocityParams()
+        return float(str(params.MaxVelocity)), float(str(params.Acceleration))
+
+    def change_velocity(self, velocity, acceleration=None):
+        """Changes the maximum velocity and optionally the acceleration used for moves"""
+        if acceleration is None:
+            acceleration = self.read_velocity()[1]
         self.wait_until_complete()
+        self._ch.SetVelocityParams(Decimal(velocity), Decimal(acceleration))
 
     def home(self):
         """Home device. Because this is an open loop, homing should be completed often"""
-        self.wait_until_complete()
-        self._ch.Home(self._ch.InitializeWaitHandler())
+        self.home_async().result()
 
     def is_homed(self):
         """Returns a boolean of whether or not the channel is homed"""
@@ -87,9 +203,13 @@ class StepperMotorController:
 
     def read_position(self):
         """Return an approximate position of channel location"""
-        return self._ch.Position
+        return float(str(self._ch.Position))  # this is a System.Decimal!
 
     def wait_until_complete(self):
         """Bypasses device already moving error"""
         while self._ch.Status.IsInMotion or self._ch.Status.IsJogging or self._ch.State != 0 or self._ch.IsDeviceBusy:
-            time.sleep(0.1)
+            time.sleep(self._poll_interval)
+
+    def close(self):
+        """Waits for the requested moves to complete and stops the command thread"""
+        self._executor.shutdown(wait=True)
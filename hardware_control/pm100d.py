@@ -1,7 +1,10 @@
 import contextlib
 
-import visa
-from ThorlabsPM100 import ThorlabsPM100
+try:
+    import visa
+    from ThorlabsPM100 import ThorlabsPM100
+except ImportError:  # see optics.simulation for a stand in power meter
+    visa = None
 
 
 @contextlib.contextmanager
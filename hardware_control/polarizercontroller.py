@@ -1,29 +1,36 @@
-import clr  # installs DOTNET DLLs
 import contextlib
 import sys
 import time
 
 from optics.hardware_control.hardware_addresses_and_constants import polarizer_offset
 
-sys.path.append("C:\\Program Files\\Thorlabs\\Kinesis") #  adds DLL path to PATH
+try:
+    import clr  # installs DOTNET DLLs
+except ImportError:  # Kinesis only exists on the Windows measurement computer. See optics.simulation
+    clr = None
 
-#  DOTNET (x64) DLLs. These need to be UNBLOCKED to be found (right click -> properties -> unblock
-#  This uses Python For DotNet NOT IronPython
+if clr:
+    sys.path.append("C:\\Program Files\\Thorlabs\\Kinesis") #  adds DLL path to PATH
 
-clr.AddReference("Thorlabs.MotionControl.TCube.DCServoCLI")  # TDC001 DLL
-clr.AddReference("Thorlabs.MotionControl.KCube.DCServoCLI")  # KDC101 DLL
-clr.AddReference("Thorlabs.MotionControl.DeviceManagerCLI")
-clr.AddReference("Thorlabs.MotionControl.GenericMotorCLI")
-clr.AddReference("Thorlabs.MotionControl.TCube.DCServoUI")
-clr.AddReference("Thorlabs.MotionControl.GenericMotorCLI")
-clr.AddReference("System")
+    #  DOTNET (x64) DLLs. These need to be UNBLOCKED to be found (right click -> properties -> unblock
+    #  This uses Python For DotNet NOT IronPython
 
-#  Import the namespaces as modules - they are going to look like these are invalid,  but they aren't
+    clr.AddReference("Thorlabs.MotionControl.TCube.DCServoCLI")  # TDC001 DLL
+    clr.AddReference("Thorlabs.MotionControl.KCube.DCServoCLI")  # KDC101 DLL
+    clr.AddReference("Thorlabs.MotionControl.DeviceManagerCLI")
+    clr.AddReference("Thorlabs.MotionControl.GenericMotorCLI")
+    clr.AddReference("Thorlabs.MotionControl.TCube.DCServoUI")
+    clr.AddReference("Thorlabs.MotionControl.GenericMotorCLI")
+    clr.AddReference("System")
 
-from Thorlabs.MotionControl.DeviceManagerCLI import DeviceManagerCLI
-from Thorlabs.MotionControl.TCube.DCServoCLI import TCubeDCServo  # TDC001
-from Thorlabs.MotionControl.KCube.DCServoCLI import KCubeDCServo  # KDC101
-from System import Decimal
+    #  Import the namespaces as modules - they are going to look like these are invalid,  but they aren't
+
+    from Thorlabs.MotionControl.DeviceManagerCLI import DeviceManagerCLI
+    from Thorlabs.MotionControl.TCube.DCServoCLI import TCubeDCServo  # TDC001
+    from Thorlabs.MotionControl.KCube.DCServoCLI import KCubeDCServo  # KDC101
+    from System import Decimal
+else:
+    from decimal import Decimal
 
 
 @contextlib.contextmanager
@@ -108,6 +115,12 @@ class RotatorMountController:
         self._device.MoveTo(Decimal(position), self._device.InitializeWaitHandler())
         # this is a System.Decimal!
 
+    def read_velocity(self):
+        """Returns the maximum velocity and acceleration used for moves, in degrees per second and degrees per second
+        squared"""
+        params = self._device.GetVelocityParams()
+        return float(str(params.MaxVelocity)), float(str(params.Acceleration))
+
 
 class WaveplateController(RotatorMountController):
     def __init__(self, device):
@@ -119,6 +132,14 @@ class WaveplateController(RotatorMountController):
             time.sleep(0.1)
         self.move(position)
 
+    def move_and_wait(self, position, timeout_ms=60000):
+        """Moves to position and returns once the move is complete, for measurements that read right after a move"""
+        while position > 360:
+            position -= 360
+        while self._device.State == 1:
+            time.sleep(0.1)
+        self._device.MoveTo(Decimal(position), timeout_ms)  # a timeout blocks until the move is complete
+
     def read_polarization(self, wait_ms=0):
         return self.read_position(wait_ms) * 2
 
@@ -1,9 +1,39 @@
 import contextlib
-import usb.core
-import usb.util
-from collections import OrderedDict
+try:
+    import usb.core
+    import usb.util
+except ImportError:  # see optics.simulation for a stand in lock in amplifier
+    usb = None
 import time
-from itertools import count
+import math
+
+# status byte bits: 0 command complete, 1 invalid command, 2 invalid command parameter, 3 reference unlock, 4 output
+# overload, 5 new ADC values available after external trigger, 6 input overload, 7 data available. Input overload is
+# not treated as an error
+STATUS_ERRORS = [None] * 256  # the error raised for every possible status byte
+for _status in range(256):
+    if _status & 0x02:
+        STATUS_ERRORS[_status] = 'Invalid lock in command'
+    elif _status & 0x04:
+        STATUS_ERRORS[_status] = 'Invalid lock in command parameter'
+REFERENCE_UNLOCK = 0x08
+OUTPUT_OVERLOAD = 0x10
+STATUS_SKIP = ord('!')  # status byte of a response that is not checked
+OVERLOAD_CODES = ['X1', 'Y1', 'X2', 'Y2', 'CH1', 'CH2', 'CH3', 'CH4']  # overload byte bits
+OVERLOAD_CHANNELS = [tuple(code for bit, code in enumerate(OVERLOAD_CODES) if overload & 2 ** bit)
+                     for overload in range(256)]  # the overloading outputs for every possible overload byte
+OVERLOAD_XY1 = 0x03
+SENSITIVITIES = [2e-6, 5e-6, 1e-5, 2e-5, 5e-5, 1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2, 0.1, 0.2, 0.5, 1,
+                 2, 5, 10, 20, 50, 100, 200, 500, 1000]  # full scale sensitivity ranges in mV
+
+
+def sensitivity_range(millivolts):
+    """Returns the lowest sensitivity range in mV that holds millivolts, or the highest range"""
+    for sensitivity in SENSITIVITIES:
+        if sensitivity >= millivolts:
+            return sensitivity
+    return SENSITIVITIES[-1]
+
 
 @contextlib.contextmanager
 def create_endpoints(vendor, product):
@@ -51,75 +81,147 @@ class LockIn:
         self._ep1 = ep1
         self._mode = self.check_reference_mode()
         self._overload = False
-        self._loops = count(0)
         self._unlocked = False
+        self._state = {}  # settings read from or written to the lock in, keyed by the command that reads them
+
+    def read_setting(self, command, refresh=False):
+        """Returns the first value of the response to a read command. Settings are cached: the lock in is only asked
+        the first time, or again when refresh is set or the cache has been invalidated"""
+        if refresh or command not in self._state:
+            self._ep0.write(command)
+            self._state[command] = self.read()[0]
+        return self._state[command]
+
+    def read_settings(self, *commands, refresh=False):
+        """Returns a list of the settings read by the commands, like read_setting, asking the lock in for all the
+        settings that are not cached in one transaction"""
+        missing = [command for command in commands if refresh or command not in self._state]
+        if missing:
+            transaction = self.transaction()
+            for command in dict.fromkeys(missing):
+                transaction.read_setting(command)
+            transaction.execute()
+        return [self._state[command] for command in commands]
+
+    def read_state(self, refresh=False):
+        """Reads every setting that is written in file headers or used to settle into the cache in one round trip"""
+        if self._mode == 1.0:
+            commands = ['tc1.', 'tc2.', 'sen1.', 'sen2.', 'refp1.', 'refp2.']
+        else:
+            commands = ['tc.', 'sen.', 'refp.']
+        self.read_settings('dac. 3', 'oa.', 'of.', 'slope', *commands, refresh=refresh)
+
+    def transaction(self):
+        """Returns a Transaction to queue several commands and send them to the lock in together"""
+        return Transaction(self)
+
+    def execute(self, queries):
+        """Sends the (command, number of values, conversion, cached) queries of a transaction in one write, joined
+        with semicolons, reads the combined response and returns the converted result of every query"""
+        self._ep0.write(';'.join(query[0] for query in queries))
+        values = self.check_status(self.read_response()) or []
+        if len(values) != sum(query[1] for query in queries):
+            self._state.clear()
+            raise ValueError('Lock in returned {} values for {}'.format(len(values),
+                                                                         ';'.join(query[0] for query in queries)))
+        if any(query[1] == 0 for query in queries):
+            self._state.clear()  # a queued write may have changed any setting
+        results = []
+        for command, number, convert, cached in queries:
+            result = convert(values[0:number])
+            values = values[number:]
+            if cached:
+                self._state[command] = result
+            results.append(result)
+        return results
+
+    def invalidate(self, *commands):
+        """Forgets the cached settings read by the given commands, or all of them if none are given. Use this after
+        settings were changed on the front panel"""
+        if commands:
+            for command in commands:
+                self._state.pop(command, None)
+        else:
+            self._state.clear()
 
-    def check_status(self, i):
-        """Checks lock in amplifier status and overload bytes"""
+    def check_status(self, response):
+        """Checks the lock in amplifier status and overload bytes at the end of a response read from USB and returns
+        the comma separated values before them. The bytes are decoded with the lookup tables above instead of bit
+        strings. A str response is also accepted"""
+        if isinstance(response, str):
+            response = response.encode('latin-1')
         self._overload = False
         self._unlocked = False
-        status_codes = OrderedDict({'command complete': 0, 'invalid command': 'Invalid lock in command',
-                                    'invalid command parameter': 'Invalid lock in command parameter',
-                                    'reference unlock': 0,
-                                    'output overload': 0,
-                                    'new ADC after trigger': 0,
-                                    'input overload': 'Lock in input overload',
-                                    'data available': 0})
-        overload_codes = ['X1', 'Y1', 'X2', 'Y2', 'CH1', 'CH2', 'CH3', 'CH4']
-        status_bytes = [x for x in i[-2::]]
-        i = i[0:-3].replace('\n', '')
-        if status_bytes[0] == '!':
-            return [float(j) for j in i.split(',')] if i else None
-        for j, k in enumerate(reversed(bin(ord(status_bytes[0])))):
-            if k == '1':
-                if status_codes[list(status_codes.keys())[j]]:
-                    if status_codes[list(status_codes.keys())[j]] != 'Lock in input overload':
-                        raise ValueError(status_codes[list(status_codes.keys())[j]])
-                    #else:
-                    #    print('Warning: {}'.format(status_codes[list(status_codes.keys())[j]]))
-                if list(status_codes.keys())[j] == 'reference unlock':
-                    self._unlocked = True
-                else:
-                    if list(status_codes.keys())[j] == 'output overload':
-                        for l, m in enumerate(reversed(bin(ord(status_bytes[1])))):
-                            if m == '1':
-                                print('{} output overload'.format(overload_codes[l]))
-                                if overload_codes[l] == 'X1' or overload_codes[l] == 'Y1':
-                                    self._overload = True
-        return [float(j) for j in i.split(',')] if i else None
-
-    def auto_sensitivity(self, channel=0):
-        """Sets the sensitivity of output channels to lowest sensitivity to not cause overloading"""
-        sens = [2e-6, 5e-6, 1e-5, 2e-5, 5e-5, 1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2, 0.1, 0.2, 0.5,
-                1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+        status, overload = response[-2], response[-1]
+        data = response[0:-3].rstrip(b'\n').replace(b'\n', b',')  # the replies of compound commands are on lines
+        if status != STATUS_SKIP:
+            error = STATUS_ERRORS[status]
+            if error:
+                self._state.clear()  # a failed command may have left the settings in an unknown state
+                raise ValueError(error)
+            if status & REFERENCE_UNLOCK:
+                self._unlocked = True
+            if status & OUTPUT_OVERLOAD:
+                for code in OVERLOAD_CHANNELS[overload]:
+                    print('{} output overload'.format(code))
+                self._overload = bool(overload & OVERLOAD_XY1)
+        return [float(j) for j in data.split(b',') if j] if data else None
+
+    def auto_sensitivity(self, channel=0, sleep=time.sleep, headroom=2, down=False, max_steps=5):
+        """Sets the sensitivity of an output channel so the signal does not overload. Instead of stepping up one range
+        at a time, the magnitude of X and Y is measured and the range is set straight to the lowest one that holds
+        headroom times the magnitude. A clipped reading can need a second jump. With down set, a range that is more
+        than needed is also lowered. Waits three time constants with sleep after every change, so pass a sleep that
+        keeps tkinter running when called from the tkinter thread. Returns the sensitivity in mV"""
         channels = {0: '', 1: '1', 2: '2'}
-        self._ep0.write('st')
-        self.read()
-        if self._overload:
-            self._ep0.write('sen{}.'.format(channels[channel]))
-            s = self.read_dev()[0:-3].replace('\n', '')
-            s = [float(j) for j in s.split(',')][0] * 1000
-            s = [sens[i + 1] for i in range(len(sens)) if sens[i] == s][0]
-            print('Auto adjusting sensitivity to {} mV'.format(s))
-            self.change_sensitivity(s, channel=channel)
-            self._ep0.write('st')
-            self.read()
-            self._ep0.write('tc{}.'.format(channels[channel]))
-            tc = self.read_dev()[0:-3].replace('\n', '')
-            tc = [float(j) for j in tc.split(',') if ','][0]
-            time.sleep(tc * 3)
-            if next(self._loops) > 5:
-                raise ValueError('Lock in sensitivity out of range')
-            self.auto_sensitivity(channel=channel)
+        self.invalidate('sen.', 'sen1.', 'sen2.', 'tc.', 'tc1.', 'tc2.')  # read below, they may have been changed
+        for _ in range(max_steps):
+            self._ep0.write('xy{}.'.format(channels[channel]))
+            magnitude = math.hypot(*self.read()) * 1000  # mV
+            overloaded = self._overload
+            current = self.read_sensitivity(channel=channel or 1) * 1000
+            target = sensitivity_range(magnitude * headroom)
+            if overloaded:
+                target = max(target, sensitivity_range(current * 1.01))  # at least the next range up
+                if current >= SENSITIVITIES[-1]:
+                    raise ValueError('Lock in sensitivity out of range')
+            elif not down or target >= current:
+                return current
+            print('Auto adjusting sensitivity to {} mV'.format(target))
+            self.change_sensitivity(target, channel=channel or 1)
+            sleep(self.read_tc(channel=channel or 1) * 3)
+        raise ValueError('Lock in sensitivity out of range')
 
     def read(self):
         """Returns the parsed lock in amplifier outputs"""
-        return self.check_status(self.read_dev())
+        return self.check_status(self.read_raw())
+
+    def read_raw(self):
+        """Reads the raw output from the lock in as bytes. The last four bytes are: new line, null character, a
+        status byte representing any errors, and an overload byte indicating which channel is overloading"""
+        try:
+            return bytes(self._dev.read(self._ep1, 100, 100))
+        except Exception:
+            self._state.clear()
+            raise
+
+    def read_response(self, chunk_size=100):
+        """Reads a response of any length as bytes, in chunks of chunk_size bytes until the null, status and overload
+        bytes that end it have arrived"""
+        response = bytearray()
+        while True:
+            try:
+                chunk = self._dev.read(self._ep1, chunk_size, 1000)
+            except Exception:
+                self._state.clear()
+                raise
+            response.extend(chunk)
+            if len(response) >= 3 and response[-3] == 0:  # the data itself is ascii and never contains a null
+                return bytes(response)
 
     def read_dev(self):
-        """Reads the raw output from the lock in. The last four characters are: new line, null character, a status
-        byte representing any errors, and an overload byte indicating which channel is overloading"""
-        return ''.join(chr(x) for x in self._dev.read(self._ep1, 100, 100))
+        """Reads the raw output from the lock in as a string, see read_raw"""
+        return self.read_raw().decode('latin-1')
 
     def check_reference_mode(self):
         """Checks the reference mode of the lock in amplifier. Returns 0 if single reference, 1 if dual harmonic, and
@@ -133,38 +235,37 @@ class LockIn:
         #  it is unclear why the input needs to be divided by 10. The manual shows mV input but the command yields a
         #  voltage 10x higher
         self.read_dev()  # throws away junk
+        self.invalidate('dac. {}'.format(channel))  # read back once, because of the unclear scaling above
 
-    def read_applied_voltage(self, channel=3):
+    def read_applied_voltage(self, channel=3, refresh=False):
         """Reads the applied voltage of the DAC channel. Default is channel 3"""
-        self._ep0.write('dac. {}'.format(channel))
-        return self.read()[0]
+        return self.read_setting('dac. {}'.format(channel), refresh=refresh)
 
     def change_oscillator_frequency(self, millihertz):
         """Changes the oscillator frequency for internal reference"""
         self._ep0.write('of {}'.format(millihertz * 100))
         self.read_dev()  # throws away junk
+        self.invalidate('of.')
 
-    def read_oscillator_frequency(self):
+    def read_oscillator_frequency(self, refresh=False):
         """Reads the oscillator frequency for internal reference"""
-        self._ep0.write('of.')
-        return self.read()[0]
+        return self.read_setting('of.', refresh=refresh)
 
     def change_oscillator_amplitude(self, millivolts):
         """Changes the oscillator amplitude for the internal reference"""
         self._ep0.write('oa {}'.format(millivolts * 100))
         self.read_dev()
+        self.invalidate('oa.')
 
-    def read_oscillator_amplitude(self):
+    def read_oscillator_amplitude(self, refresh=False):
         """Read the oscillator amplitude for the internal reference in volts"""
-        self._ep0.write('oa.')
-        return self.read()[0]
+        return self.read_setting('oa.', refresh=refresh)
 
     def read_xy1(self):
         """Reads XY1 of dual harmonic mode. Returns a list corresponding to [X1, Y1] in volts"""
         self._ep0.write('xy1.')
         values = self.read()
         if self._overload:
-            self._loops = count(0)
             self.auto_sensitivity(channel=1)
             self._ep0.write('xy1.')
             values = self.read()
@@ -175,31 +276,30 @@ class LockIn:
         self._ep0.write('xy2.')
         return self.read()
 
-    def read_xy(self):
-        """Reads XY of single reference mode. Returns a list corresponding to [X, Y] in volts"""
+    def read_xy(self, sleep=time.sleep):
+        """Reads XY of single reference mode. Returns a list corresponding to [X, Y] in volts. While the reference is
+        unlocked and while auto_sensitivity settles, it waits with sleep"""
         self._ep0.write('xy.')
         values = self.read()
         while self._unlocked:
-            time.sleep(0.25)
+            sleep(0.25)
             self._ep0.write('xy.')
             values = self.read()
         if self._overload and not self._unlocked:
-            self._loops = count(0)
-            self.auto_sensitivity(channel=0)
+            self.auto_sensitivity(channel=0, sleep=sleep)
             self._ep0.write('xy.')
             values = self.read()
         return values
 
-    def read_tc(self, channel=1):
+    def is_overloaded(self):
+        """Returns whether X or Y was overloaded in the last reading"""
+        return self._overload
+
+    def read_tc(self, channel=1, refresh=False):
         """Reads the time constant for a lock in amplifier in either the single reference or dual harmonic mode"""
-        if self._mode == 0.0:
-            self._ep0.write('tc.')
         if self._mode == 1.0:
-            if channel == 1:
-                self._ep0.write('tc1.')
-            else:
-                self._ep0.write('tc2.')
-        return self.read()[0]
+            return self.read_setting('tc1.' if channel == 1 else 'tc2.', refresh=refresh)
+        return self.read_setting('tc.', refresh=refresh)
 
     def change_tc(self, seconds, channel=1):
         """Changes the time constant for a lock in amplifier in either the single reference or dual harmonic mode"""
@@ -211,13 +311,20 @@ class LockIn:
             seconds = min(tc_value.items(), key=lambda x: abs(seconds - x[0]))[0]
         if self._mode == 0.0:
             self._ep0.write('tc {}'.format(tc_value[seconds]))
+            self._state['tc.'] = seconds
         if self._mode == 1.0:
             if channel == 1:
                 self._ep0.write('tc1 {}'.format(tc_value[seconds]))
+                self._state['tc1.'] = seconds
             else:
                 self._ep0.write('tc2 {}'.format(tc_value[seconds]))
+                self._state['tc2.'] = seconds
         self.read_dev()  # throws away junk
 
+    def read_slope(self, refresh=False):
+        """Reads the output low pass filter slope in dB/octave (6, 12, 18 or 24)"""
+        return (self.read_setting('slope', refresh=refresh) + 1) * 6
+
     def read_r_theta(self):
         """Reads the magnitude and phase output. Returns a list corresponding to [R, Theta]"""
         self._ep0.write('mp.')
@@ -231,6 +338,7 @@ class LockIn:
     def auto_phase(self):
         self._ep0.write('AQN')
         self.read_dev()
+        self.invalidate('refp.', 'refp1.', 'refp2.')
 
     def change_sensitivity(self, millivolts, channel=1):
         VALID_SENSITIVITY = {2e-6: 1, 5e-6: 2, 1e-5: 3, 2e-5: 4, 5e-5: 5, 1e-4: 6, 2e-4: 7, 5e-4: 8, 1e-3: 9,
@@ -240,29 +348,100 @@ class LockIn:
             millivolts = min(VALID_SENSITIVITY.items(), key=lambda x: abs(millivolts - x[0]))[0]
         if self._mode == 0.0:
             self._ep0.write('sen ' + str(VALID_SENSITIVITY[millivolts]))
+            self._state['sen.'] = millivolts / 1000  # read back in volts
         if self._mode == 1.0:
             self._ep0.write('sen{} {}'.format(channel, str(VALID_SENSITIVITY[millivolts])))
+            self._state['sen{}.'.format(channel)] = millivolts / 1000
         self.read_dev()
 
-    def read_sensitivity(self, channel=1):
-        if self._mode == 0.0:
-            self._ep0.write('sen.')
+    def read_sensitivity(self, channel=1, refresh=False):
         if self._mode == 1.0:
-            self._ep0.write('sen{}.'.format(channel))
-        return self.read()[0]
+            return self.read_setting('sen{}.'.format(channel), refresh=refresh)
+        return self.read_setting('sen.', refresh=refresh)
 
-    def read_reference_phase(self, channel=1):
-        if self._mode == 0.0:
-            self._ep0.write('refp.')
+    def read_reference_phase(self, channel=1, refresh=False):
         if self._mode == 1.0:
-            if channel == 1:
-                self._ep0.write('refp1.')
-            else:
-                self._ep0.write('refp2.')
-        return self.read()[0]
+            return self.read_setting('refp1.' if channel == 1 else 'refp2.', refresh=refresh)
+        return self.read_setting('refp.', refresh=refresh)
+
+    def setup_curve_buffer(self, interval, points, curves=(0, 1)):
+        """Defines the internal curve buffer. interval is the time between stored points in seconds (1 ms
+        resolution), points is the curve length and curves lists the outputs to store: 0: X, 1: Y, 2: magnitude,
+        3: phase. Returns the interval that was set in seconds"""
+        milliseconds = int(round(interval * 1000))
+        if milliseconds < 1:
+            raise ValueError('Curve buffer interval {} s is below the 1 ms resolution'.format(interval))
+        self._ep0.write('cbd {}'.format(sum(2 ** curve for curve in curves)))
+        self.read_dev()
+        self._ep0.write('len {}'.format(int(points)))
+        self.read_dev()
+        self._ep0.write('str {}'.format(milliseconds))
+        self.read_dev()
+        return milliseconds / 1000
+
+    def start_curve_buffer(self):
+        """Clears the curve buffer and starts a single acquisition of the defined length"""
+        self._ep0.write('nc')
+        self.read_dev()
+        self._ep0.write('td')
+        self.read_dev()
+
+    def stop_curve_buffer(self):
+        """Halts the curve buffer acquisition"""
+        self._ep0.write('hc')
+        self.read_dev()
+
+    def read_curve_status(self):
+        """Returns a list corresponding to [acquisition status, sweeps acquired, status byte, points acquired]. The
+        acquisition status is 1 while a single acquisition is running and 0 or 5 once it has stopped"""
+        self._ep0.write('m')
+        return self.read()
+
+    def read_curve(self, curve, chunk_size=4096):
+        """Bulk downloads one stored curve (0: X, 1: Y, 2: magnitude, 3: phase) in floating point. The response is
+        read from USB in chunks of chunk_size bytes until the null and status bytes that end it have arrived"""
+        self._ep0.write('dc. {}'.format(curve))
+        response = self.read_response(chunk_size)
+        self.check_status(response[-3:])
+        return [float(j) for j in response[0:-3].replace(b'\r', b'').replace(b'\n', b',').split(b',') if j.strip()]
 
     def status(self):
         self._ep0.write('n')
         return self.read()
 
 
+class Transaction:
+    """Commands queued to be sent to the lock in in one USB transfer, so that reading several outputs and settings
+    costs one round trip. Every method queues a command and returns the index of its result in the list returned by
+    execute. The replies are split between the commands by the number of values each one returns"""
+    def __init__(self, lockin):
+        self._lockin = lockin
+        self._queries = []
+
+    def query(self, command, values, convert=list, cached=False):
+        """Queues a command that returns the given number of values, which are passed to convert"""
+        self._queries.append((command, values, convert, cached))
+        return len(self._queries) - 1
+
+    def write(self, command):
+        """Queues a command without a reply, such as a setting change"""
+        return self.query(command, 0, lambda values: None)
+
+    def read_setting(self, command):
+        """Queues a settings read. The result also updates the settings cache of the lock in"""
+        return self.query(command, 1, lambda values: values[0], cached=True)
+
+    def read_xy(self):
+        return self.query('xy.', 2)
+
+    def read_r_theta(self):
+        return self.query('mp.', 2)
+
+    def read_adc(self, channel):
+        return self.query('adc. {}'.format(channel), 1)
+
+    def execute(self):
+        """Sends the queued commands and returns the list of their results"""
+        if not self._queries:
+            return []
+        return self._lockin.execute(self._queries)
@@ -8,10 +8,10 @@ from optics.measurements.base_polarization import PolarizationMeasurement
 
 class HeatingPolarization(PolarizationMeasurement):
     def __init__(self, master, filepath, notes, device, scan, gain, bias, osc,
-                 sr7270_single_reference, powermeter, waveplate, steps):
+                 sr7270_single_reference, powermeter, waveplate, steps, settle=None, fit_tolerance=None):
         super().__init__(master, filepath, notes, device, scan, steps, gain=gain,
                          sr7270_single_reference=sr7270_single_reference,
-                         powermeter=powermeter, waveplate=waveplate)
+                         powermeter=powermeter, waveplate=waveplate, settle=settle, fit_tolerance=fit_tolerance)
         self._bias = bias
         self._osc = osc
 
@@ -26,29 +26,28 @@ class HeatingPolarization(PolarizationMeasurement):
 
     def end_header(self, writer):
         writer.writerow(['end:', 'end of header'])
-        writer.writerow(['time', 'polarization', 'x_raw', 'y_raw', 'iphoto_x', 'iphoto_y'])
+        writer.writerow(['time', 'polarization', 'x_raw', 'y_raw', 'iphoto_x', 'iphoto_y', 'dwell'])
 
     def setup_plots(self):
         self._ax1.title.set_text('|iphoto_X| (mA)')
         self._ax2.title.set_text('|iphoto_Y| (mA)')
 
-    def do_measurement(self):
-        raw = self._sr7270_single_reference.read_xy()
+    def do_measurement(self, raw):
         iphoto = [conversions.convert_x_to_iphoto(x, self._gain) for x in raw]
         time_now = time.time() - self._start_time
-        self._writer.writerow([time_now, self._polarization, raw[0], raw[1], iphoto[0], iphoto[1]])
-        self._ax1.plot(conversions.degrees_to_radians(self._polarization), abs(iphoto[0]) * 1000, linestyle='',
-                       color='blue', marker='o', markersize=2)
-        self._ax2.plot(conversions.degrees_to_radians(self._polarization), abs(iphoto[1]) * 1000, linestyle='',
-                       color='blue', marker='o', markersize=2)
+        self._writer.writerow([time_now, self._polarization, raw[0], raw[1], iphoto[0], iphoto[1], self._dwell])
+        self._plot1.append(conversions.degrees_to_radians(self._polarization), abs(iphoto[0]) * 1000)
+        self._plot2.append(conversions.degrees_to_radians(self._polarization), abs(iphoto[1]) * 1000)
 
 
 class HeatingPolarizationRT(PolarizationMeasurement):
+    fit_channels = (0,)  # R, theta does not follow the polarization
+
     def __init__(self, master, filepath, notes, device, scan, gain, bias, osc,
-                 sr7270_single_reference, powermeter, waveplate, steps):
+                 sr7270_single_reference, powermeter, waveplate, steps, settle=None, fit_tolerance=None):
         super().__init__(master, filepath, notes, device, scan, steps, gain=gain,
                          sr7270_single_reference=sr7270_single_reference,
-                         powermeter=powermeter, waveplate=waveplate)
+                         powermeter=powermeter, waveplate=waveplate, settle=settle, fit_tolerance=fit_tolerance)
         self._bias = bias
         self._osc = osc
 
@@ -63,18 +62,19 @@ class HeatingPolarizationRT(PolarizationMeasurement):
 
     def end_header(self, writer):
         writer.writerow(['end:', 'end of header'])
-        writer.writerow(['time', 'polarization', 'r_raw', 'theta_raw', 'iphoto', 'theta'])
+        writer.writerow(['time', 'polarization', 'r_raw', 'theta_raw', 'iphoto', 'theta', 'dwell'])
 
     def setup_plots(self):
         self._ax1.title.set_text('|R| (mA)')
         self._ax2.title.set_text('theta')
 
-    def do_measurement(self):
-        raw = self._sr7270_single_reference.read_r_theta()
+    def read_sample(self):
+        return self._sr7270_single_reference.read_r_theta()
+
+    def do_measurement(self, raw):
         iphoto = conversions.convert_x_to_iphoto(raw[0], self._gain)
         time_now = time.time() - self._start_time
-        self._writer.writerow([time_now, self._polarization, raw[0], raw[1], iphoto, raw[1] / self._gain])
-        self._ax1.plot(conversions.degrees_to_radians(self._polarization), abs(iphoto) * 1000, linestyle='',
-                       color='blue', marker='o', markersize=2)
-        self._ax2.plot(conversions.degrees_to_radians(self._polarization), abs(raw[1]) / self._gain, linestyle='',
-                       color='blue', marker='o', markersize=2)
+        self._writer.writerow([time_now, self._polarization, raw[0], raw[1], iphoto, raw[1] / self._gain,
+                               self._dwell])
+        self._plot1.append(conversions.degrees_to_radians(self._polarization), abs(iphoto) * 1000)
+        self._plot2.append(conversions.degrees_to_radians(self._polarization), abs(raw[1]) / self._gain)
@@ -2,16 +2,15 @@ import matplotlib
 matplotlib.use('TkAgg')
 from optics.misc_utility import conversions
 from optics.measurements.base_time import TimeMeasurement
-import time
 from optics.misc_utility.tkinter_utilities import tk_sleep
 
 
 class HeatingTime(TimeMeasurement):
     def __init__(self, master, filepath, notes, device, scan, gain, rate, maxtime, bias, osc,
-                 sr7270_single_reference, powermeter, waveplate):
+                 sr7270_single_reference, powermeter, waveplate, buffered=False, settle=None, storage='csv'):
         super().__init__(master, filepath, notes, device, scan, rate, maxtime,
                          sr7270_single_reference=sr7270_single_reference, powermeter=powermeter, gain=gain,
-                         waveplate=waveplate)
+                         waveplate=waveplate, buffered=buffered, settle=settle, storage=storage)
         self._bias = bias
         self._osc = osc
         self._iphoto = []
@@ -38,24 +37,21 @@ class HeatingTime(TimeMeasurement):
         self._ax2.set_xlabel('time (s)')
         self._canvas.draw()
 
-    def do_measurement(self):
-        raw = self._sr7270_single_reference.read_xy()
+    def do_measurement(self, time_now, raw):
         self._iphoto = [conversions.convert_x_to_iphoto(x, self._gain) for x in raw]
-        tk_sleep(self._master, self._sleep)
-        time_now = time.time() - self._start_time
         self._writer.writerow([time_now, raw[0], raw[1], self._iphoto[0], self._iphoto[1]])
-        self._ax1.plot(time_now, self._iphoto[0] * 1000, linestyle='', color='blue', marker='o', markersize=2)
-        self._ax2.plot(time_now, self._iphoto[1] * 1000, linestyle='', color='blue', marker='o', markersize=2)
-        self._fig.tight_layout()
-        self._fig.canvas.draw()
+        self._plot1.append(time_now, self._iphoto[0] * 1000)
+        self._plot2.append(time_now, self._iphoto[1] * 1000)
 
 
 class HeatingTimeRT(TimeMeasurement):
+    _curves = (2, 3)  # magnitude and phase
+
     def __init__(self, master, filepath, notes, device, scan, gain, rate, maxtime, bias, osc,
-                 sr7270_single_reference, powermeter, waveplate):
+                 sr7270_single_reference, powermeter, waveplate, buffered=False, settle=None, storage='csv'):
         super().__init__(master, filepath, notes, device, scan, rate, maxtime,
                          sr7270_single_reference=sr7270_single_reference, powermeter=powermeter, gain=gain,
-                         waveplate=waveplate)
+                         waveplate=waveplate, buffered=buffered, settle=settle, storage=storage)
         self._bias = bias
         self._osc = osc
         self._iphoto = []
@@ -82,13 +78,11 @@ class HeatingTimeRT(TimeMeasurement):
         self._ax2.set_xlabel('time (s)')
         self._canvas.draw()
 
-    def do_measurement(self):
-        raw = self._sr7270_single_reference.read_r_theta()
+    def read_sample(self):
+        return self._sr7270_single_reference.read_r_theta()
+
+    def do_measurement(self, time_now, raw):
         self._iphoto = conversions.convert_x_to_iphoto(raw[0], self._gain)
-        tk_sleep(self._master, self._sleep)
-        time_now = time.time() - self._start_time
         self._writer.writerow([time_now, raw[0], raw[1], self._iphoto, raw[1] / self._gain])
-        self._ax1.plot(time_now, self._iphoto * 1000, linestyle='', color='blue', marker='o', markersize=2)
-        self._ax2.plot(time_now, raw[1] / self._gain, linestyle='', color='blue', marker='o', markersize=2)
-        self._fig.tight_layout()
-        self._fig.canvas.draw()
+        self._plot1.append(time_now, self._iphoto * 1000)
+        self._plot2.append(time_now, raw[1] / self._gain)
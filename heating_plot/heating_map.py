@@ -1,25 +1,23 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import pandas as pd
+from optics.analysis import map_loader
+
+# title, colorbar label and scale of the X and Y signals of each kind of map
+LABELS = {'heating': ('iphoto', 'current (mA)', 1e3), 'thermovoltage': ('voltage', 'voltage (uV)', 1e6),
+          'raw': ('raw', 'lock in output (uV)', 1e6)}
 
 
 def parse(filename):
-    with open(filename) as inputfile:
-        header = {}
-        for i, line in enumerate(inputfile):
-            key, value = (token.strip() for token in line.split(":,", maxsplit=1))
-            header[key] = value
-            if key == 'end':
-                break
-        data = pd.read_csv(inputfile, sep=',')
-    return data, header
+    """Returns the MapData of a heating or thermovoltage map file"""
+    return map_loader.load_map(filename)
 
 
-def format_map_data(data, header):
-    data = data.sort_values(by=['y_pixel', 'x_pixel'])
-    xvalues = data['x_iphoto'].values.reshape(int(header['y scan density']), int(header['x scan density']))
-    yvalues = data['y_iphoto'].values.reshape(int(header['y scan density']), int(header['x scan density']))
-    return xvalues, yvalues
+def format_map_data(map_data):
+    """Returns the X and Y signals of a map indexed [y_pixel, x_pixel], as imshow expects, in the units of LABELS.
+    Pixels that were not measured are masked, and a map measured several times is averaged over its frames"""
+    scale = LABELS[map_data.kind][2]
+    x, y = (map_data.average(column) * scale for column in map_data.signal)
+    return x.T, y.T
 
 
 def save_formatted_map_data(f, data):
@@ -45,12 +43,12 @@ def plot_heating_data(xvalues, yvalues, fig=None, ax1=None, ax2=None, xamax=None
     clb2.set_label(clb2title, rotation=270, labelpad=20)
     plt.show()
 
-f = 'C:\\Users\\Ruoyu\\Desktop\\test_map scan__2.csv'
-data, header = parse(f)
-x, y = format_map_data(data, header)
-plot_heating_data(x, y)
-f_format = 'C:\\Users\\Ruoyu\\Desktop\\formatted_x.csv'
-save_formatted_map_data(f_format, x)
-
-
 
+if __name__ == '__main__':
+    f = 'C:\\Users\\Ruoyu\\Desktop\\test_map scan__2.csv'
+    map_data = parse(f)
+    x, y = format_map_data(map_data)
+    title, label, _ = LABELS[map_data.kind]
+    plot_heating_data(x, y, ax1title=title + ' X', ax2title=title + ' Y', clb1title=label, clb2title=label)
+    f_format = 'C:\\Users\\Ruoyu\\Desktop\\formatted_x.csv'
+    save_formatted_map_data(f_format, x.filled(np.nan))
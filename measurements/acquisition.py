@@ -0,0 +1,83 @@
+import queue
+import threading
+import tkinter as tk
+
+
+class AcquisitionThread:
+    """Runs an acquisition function in a worker thread and hands its results to the tkinter mainloop. The target is
+    called in the worker thread with a single argument, a function that posts an item to the queue. The handler is
+    called on the tkinter thread for every posted item, and refresh is called once per timer tick after the pending
+    items have been handled, so rendering never sits between the hardware calls of the worker thread. If the handler
+    or refresh raises, abort is called to stop the target and run raises the error once the worker thread has
+    finished. The disabled widgets, such as buttons that would move the stage, are disabled while run is active"""
+    def __init__(self, master, target, handler, refresh=None, interval_ms=50, abort=None, disabled=()):
+        self._master = master
+        self._target = target
+        self._handler = handler
+        self._refresh = refresh
+        self._interval_ms = interval_ms
+        self._abort = abort
+        self._disabled = [widget for widget in disabled if widget is not None]
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._done = tk.BooleanVar(master=self._master, value=False)
+        self._finished = object()  # sentinel posted by the worker thread when the target returns
+        self._error = None
+
+    def _run(self):
+        try:
+            self._target(self._queue.put)
+        except Exception as err:
+            if self._error is None:  # an error of the handler, which aborted the target, comes first
+                self._error = err
+        finally:
+            self._queue.put(self._finished)
+
+    def drain(self):
+        """Handles every item currently in the queue. Returns True once the worker thread has finished"""
+        finished = False
+        handled = False
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is self._finished:
+                finished = True
+                break
+            self._handler(item)
+            handled = True
+        if handled and self._refresh:
+            self._refresh()
+        return finished
+
+    def _poll(self):
+        try:
+            finished = self.drain()
+        except Exception as err:
+            self._error = err
+            if self._abort:
+                self._abort()
+            self._done.set(True)
+            return
+        if finished:
+            self._done.set(True)
+        else:
+            self._master.after(self._interval_ms, self._poll)
+
+    def run(self):
+        """Starts the worker thread and blocks until it has finished and the queue is empty. The tkinter event loop
+        keeps running in the meantime, so buttons such as abort still work. Raises the first error of the target or the
+        handler"""
+        for widget in self._disabled:
+            widget.config(state=tk.DISABLED)
+        try:
+            self._thread.start()
+            self._master.after(self._interval_ms, self._poll)
+            self._master.wait_variable(self._done)
+            self._thread.join()
+        finally:
+            for widget in self._disabled:
+                widget.config(state=tk.NORMAL)
+        if self._error:
+            raise self._error
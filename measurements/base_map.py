@@ -1,18 +1,38 @@
 import matplotlib
 
-matplotlib.use('Qt4Agg')  # this allows you to see the interactive plots!
-from optics.misc_utility import scanner
+matplotlib.use('TkAgg')  # this allows you to see the interactive plots!
+from optics.misc_utility import scanner, path_planner
+from optics.misc_utility.statistics import PixelStatistics
 import numpy as np
+import threading
 import warnings
 from optics.measurements.base_measurement import LockinBaseMeasurement
-from optics.misc_utility.tkinter_utilities import tk_sleep
+from optics.measurements.storage import ExtraColumns
+from optics.measurements.acquisition import AcquisitionThread
+from optics.measurements.settling import SettlePolicy
+from optics.measurements.live_plot import MapRenderer
+from optics.measurements.ranging import RangeMemory
+from optics.measurements.checkpoint import MapCheckpoint, checkpoint_file, load_checkpoint
+from optics.hardware_control.bsc102controller import start_move_xy, move_xy, home_xy
 import csv
+import os
+import time
+
+MOTION_TIMEOUT = 1.0  # seconds after which a fly sweep that has not been reported moving is given up
 
 
 class MapScan(LockinBaseMeasurement):
     def __init__(self, master, filepath, notes, device, scan, gain, xd, yd, xr, yr, xc, yc,
                  bsc102_x, bsc102_y, sr7270_single_reference, powermeter=None, waveplate=None, direction=True,
-                 axis='y'):
+                 axis='y', fly=False, settle=None, storage='csv', ranging=False, adaptive=False,
+                 path='serpentine', home=True, frames=1, target_sem=None, resume=None, checkpoint_interval=60):
+        state = load_checkpoint(resume) if resume else None
+        if state:  # the scan continues with the parameters of the checkpoint
+            parameters = state['parameters']
+            xd, yd, xr, yr, xc, yc = (parameters[key] for key in ('xd', 'yd', 'xr', 'yr', 'xc', 'yc'))
+            axis, direction, fly, adaptive, path, storage, frames, target_sem = (
+                parameters[key] for key in ('axis', 'direction', 'fly', 'adaptive', 'path', 'storage', 'frames',
+                                            'target_sem'))
         self._xd = xd  # x pixel density
         self._yd = yd  # y pixel density
         self._yr = yr  # y range
@@ -26,14 +46,131 @@ class MapScan(LockinBaseMeasurement):
         self._axis = axis
         self._x_val, self._y_val = scanner.find_scan_values(self._xc, self._yc, self._xr, self._yr, self._xd, self._yd)
         self._direction = direction
-        if not self._direction:
-            self._y_val = self._y_val[::-1]
+        self._fly = fly  # sweep the inner axis at constant velocity instead of stopping at every pixel
+        # coarse pass first, then only the cells with signal or gradient are refined to the full pixel density
+        self._grid = scanner.AdaptiveGrid(self._xd, self._yd) if adaptive else None
+        self._measured = np.zeros((self._xd, self._yd), dtype=bool)
+        self._raw = np.full((self._xd, self._yd, 2), np.nan)  # X and Y of every measured pixel, for checkpoints
+        self._done = self._measured  # pixels measured before the scan was resumed, skipped by the worker thread
+        if path not in path_planner.PATHS:
+            raise ValueError('unknown path {}, use one of {}'.format(path, ', '.join(path_planner.PATHS)))
+        self._path = path  # visit order of a step scan
+        self._home = home  # home both stages after the scan, otherwise the stage stays at the last pixel
+        if frames > 1 and storage == 'npz':
+            raise ValueError('npz storage writes the whole archive at once, use csv or hdf5 for a map measured {} '
+                             'times'.format(frames))
+        # the map is measured frames times and _z1 and _z2 hold the running mean of every pixel. The scan stops early
+        # once the standard error of the mean of every pixel is below target_sem, in the units of the map
+        self._frames = frames
+        self._target_sem = target_sem
+        self._frame = 0
+        self._stats1 = PixelStatistics(self._z1) if frames > 1 else None
+        self._stats2 = PixelStatistics(self._z2) if frames > 1 else None
+        self._frame_checked = threading.Event()  # set by the tkinter thread once the statistics of a frame are checked
+        self._converged = False
         self._v = []
+        self._dwell = None
         self._cut_writer = None
         super().__init__(master=master, filepath=filepath, device=device,
                          sr7270_single_reference=sr7270_single_reference, powermeter=powermeter, waveplate=waveplate,
-                         notes=notes, gain=gain, bsc102_x=bsc102_x, bsc102_y=bsc102_y, scan=scan)
-        self._time_constant = self._sr7270_single_reference.read_tc()
+                         notes=notes, gain=gain, bsc102_x=bsc102_x, bsc102_y=bsc102_y, scan=scan, storage=storage)
+        self._settle = settle if settle else SettlePolicy(self._sr7270_single_reference)
+        self._time_constant = self._settle.time_constant
+        self._renderer = MapRenderer(self._canvas)
+        if ranging is True:
+            pitch = max(abs(self._xr) / max(self._xd - 1, 1), abs(self._yr) / max(self._yd - 1, 1))
+            ranging = RangeMemory(self._sr7270_single_reference, region_size=2 * pitch if pitch else 0.1)
+        # sensitivity remembered per region of the map, True or a RangeMemory. By default the range only changes on
+        # an overload
+        self._ranging = ranging
+        self._checkpoint_interval = checkpoint_interval
+        self._checkpoint = None
+        self._cut_file = None
+        self._cut_position = None  # end of the cut file at the checkpoint, which a resumed scan appends from
+        self._settings = None
+        if state:
+            self.restore(state)
+
+    def parameters(self):
+        """Returns the parameters that a resumed scan needs to continue this one"""
+        return {'xd': self._xd, 'yd': self._yd, 'xr': self._xr, 'yr': self._yr, 'xc': self._xc, 'yc': self._yc,
+                'axis': self._axis, 'direction': self._direction, 'fly': self._fly, 'adaptive': bool(self._grid),
+                'path': self._path, 'storage': self._storage, 'frames': self._frames, 'target_sem': self._target_sem,
+                'filename': self._filename,
+                'imagefile': self._imagefile, 'scan': self._scan}
+
+    def instrument_settings(self):
+        """Returns the lock in settings. Cached settings cost no USB round trips, but the ones that are not cached are
+        read from the lock in, so only call this from the thread that drives it"""
+        lockin = self._sr7270_single_reference
+        return {'time constant': lockin.read_tc(), 'sensitivity': lockin.read_sensitivity(),
+                'reference phase': lockin.read_reference_phase(), 'applied voltage': lockin.read_applied_voltage(),
+                'oscillator amplitude': lockin.read_oscillator_amplitude(),
+                'oscillator frequency': lockin.read_oscillator_frequency()}
+
+    def restore(self, state):
+        """Continues the scan of a checkpoint: its file, the measured pixels and their values"""
+        parameters = state['parameters']
+        self._filename, self._imagefile = parameters['filename'], parameters['imagefile']
+        self._scan = parameters['scan']
+        self._resume = state['position']
+        self._cut_position = int(state['cut_position']) if 'cut_position' in state else None
+        self._measured[...] = state['measured']
+        self._done = self._measured.copy()
+        self._z1[...] = state['z1']
+        self._z2[...] = state['z2']
+        self._raw[...] = state['raw']
+        if self._stats1:
+            self._frame = int(state['frame'])
+            self._stats1.count[...], self._stats1.m2[...] = state['count1'], state['m2_1']
+            self._stats2.count[...], self._stats2.m2[...] = state['count2'], state['m2_2']
+        if self._grid and self._frame == 0:  # the refinement decisions are made again from the same values
+            for x_ind, y_ind in zip(*np.nonzero(self._done)):
+                self._grid.add(int(x_ind), int(y_ind), *self._raw[x_ind, y_ind])
+        self._settings = state['settings']
+        print('resuming {} with {} of {} pixels of frame {} measured, last stage position {}'.format(
+            self._filename, int(self._done.sum()), self._done.size, self._frame, state['stage']))
+
+    def restore_settings(self):
+        """Sets the time constant and sensitivity of the checkpoint and reports other settings that differ"""
+        lockin = self._sr7270_single_reference
+        settings = self.instrument_settings()
+        if not np.isclose(settings['time constant'], self._settings['time constant']):
+            lockin.change_tc(self._settings['time constant'])
+        if not np.isclose(settings['sensitivity'], self._settings['sensitivity']):
+            lockin.change_sensitivity(self._settings['sensitivity'] * 1000)
+        self._settle.refresh()
+        self._time_constant = self._settle.time_constant
+        for key, value in self._settings.items():
+            if key not in ('time constant', 'sensitivity') and not np.isclose(settings[key], value):
+                print('{} is {} but was {} before the scan was resumed'.format(key, settings[key], value))
+
+    def save_checkpoint(self):
+        """Runs in the tkinter thread. Writes out the measurement file and saves the progress up to the last handled
+        pixel, with the lock in settings last posted by the worker thread, so the lock in is not read from here"""
+        position = self._writer.sync()
+        self._cut_file.flush()
+        cut_position = self._cut_file.tell()
+        stage = [float(self._x_val[self._x_ind]), float(self._y_val[self._y_ind])] if self._measured.any() else None
+        self._checkpoint.save(self.parameters(), self._settings, stage, position, self._measured,
+                              cut_position=cut_position, **self.checkpoint_arrays())
+
+    def checkpoint_arrays(self):
+        """Returns the arrays a resumed scan restores"""
+        arrays = dict(z1=self._z1, z2=self._z2, raw=self._raw)
+        if self._stats1:
+            arrays.update(frame=self._frame, count1=self._stats1.count, m2_1=self._stats1.m2,
+                          count2=self._stats2.count, m2_2=self._stats2.m2)
+        return arrays
+
+    def write_header(self, writer, **kwargs):
+        if self._stats1:
+            # the frames of a map measured several times are told apart by a frame column
+            self._writer = writer = ExtraColumns(writer, ['frame'], lambda: [self._frame])
+            writer.writerow(['frames:', self._frames])
+            if self._target_sem:
+                writer.writerow(['target sem:', self._target_sem])
+        super().write_header(writer, **kwargs)
 
     def load(self):
         self._ax1 = self._fig.add_subplot(221)
@@ -44,10 +181,7 @@ class MapScan(LockinBaseMeasurement):
     def onclick(self, event):
         try:
             points = [int(np.ceil(event.xdata - 0.5)), int(np.ceil(event.ydata - 0.5))]
-            if not self._direction:
-                points = [int(np.ceil(event.xdata - 0.5)), int(np.ceil(self._yd - event.ydata - 0.5 - 1))]
-            self._bsc102_x.move(self._x_val[points[0]])
-            self._bsc102_y.move(self._y_val[points[1]])
+            move_xy(self._bsc102_x, self._bsc102_y, float(self._x_val[points[0]]), float(self._y_val[points[1]]))
             print('pixel: ' + str(points))
             print('position: ' + str(self._x_val[points[0]]) + ', ' + str(self._y_val[points[1]]))
         except:
@@ -57,69 +191,313 @@ class MapScan(LockinBaseMeasurement):
         pass
 
     def measure(self):
-        cutfilename = self._filename.split('.csv')[0] + '_cut.csv'
-        with open(cutfilename, 'w', newline='') as cutinputfile:
+        cutfilename = os.path.splitext(self._filename)[0] + '_cut.csv'
+        resumed = self._resume is not None and os.path.exists(cutfilename)
+        with open(cutfilename, 'r+' if resumed else 'w', newline='') as cutinputfile:
+            if resumed and self._cut_position is None:  # a checkpoint without the position, appended to
+                cutinputfile.seek(0, os.SEEK_END)
+            elif resumed:
+                cutinputfile.seek(self._cut_position)
+                cutinputfile.truncate()  # cut throughs written after the checkpoint are measured again
+            self._cut_file = cutinputfile
             self._cut_writer = csv.writer(cutinputfile)
-            self._cut_writer.writerow(['axis:', self._axis])
-            self._cut_writer.writerow(['end:', 'end of header'])
-            self._cut_writer.writerow(['pixel', 'cut v_x', 'cut v_y'])
-            if self._axis == 'y':
-                for self._y_ind, i in enumerate(self._y_val):
-                    self._master.update()
-                    if self._abort:
-                        self._bsc102_x.move(0)
-                        self._bsc102_y.move(0)
-                        break
-                    if not self._direction:
-                        self._y_ind = len(self._y_val) - self._y_ind - 1
-                    self._bsc102_y.move(float(i))
-                    self._v = []
-                    x_val = self._x_val if self._y_ind % 2 == 0 else self._x_val[::-1]
-                    for self._x_ind, j in enumerate(x_val):
-                        self._x_ind = self._x_ind if self._y_ind % 2 == 0 else len(x_val) - self._x_ind - 1
-                        self._bsc102_x.move(float(j))
-                        tk_sleep(self._master, self._time_constant * 1000 * 3)  # DO NOT USE TIME.SLEEP IN TKINTER LOOP
-                        self.do_measurement()
-                        self._fig.set_tight_layout(True)
-                        self._canvas.draw()  # dynamically plots the data and closes automatically after completing the scan
-                        self._master.update()
-                        if self._abort:
-                            self._bsc102_x.move(0)
-                            self._bsc102_y.move(0)
-                            break
-                    self.do_cut_measurement()
-                    self._fig.set_tight_layout(True)
-                    self._canvas.draw()
-                self._bsc102_x.home()
-                self._bsc102_y.home()  # returns piezo controller position to 0,0
+            if not resumed:
+                self._cut_writer.writerow(['axis:', self._axis])
+                self._cut_writer.writerow(['end:', 'end of header'])
+                self._cut_writer.writerow(['pixel', 'cut v_x', 'cut v_y'])
+            if self._resume is not None:
+                self.restore_settings()
+                self._renderer.reload()
+                if self._stats1:
+                    self._writer = ExtraColumns(self._writer, ['frame'], lambda: [self._frame], header=False)
+            self._settings = self.instrument_settings()
+            self._fig.tight_layout()  # once, the layout does not change while the map fills in
+            self._checkpoint = MapCheckpoint(checkpoint_file(self._filename), interval=self._checkpoint_interval)
+            # the stage and lock in are driven from a worker thread. Results are plotted and written from the tkinter
+            # thread whenever the queue is drained, so drawing is no longer between pixels
+            try:
+                AcquisitionThread(self._master, self.scan, self.handle, refresh=self._renderer.refresh,
+                                  abort=self.abort, disabled=[self._center_button]).run()
+            except Exception:
+                self.save_checkpoint()  # for example when the USB connection was lost
+                raise
+            if self._abort:
+                self.save_checkpoint()
+                print('scan aborted, resume it from {}'.format(self._checkpoint.filename))
             else:
-                for self._x_ind, i in enumerate(self._x_val):
-                    self._master.update()
-                    if self._abort:
-                        self._bsc102_x.home()
-                        self._bsc102_y.home()
-                        break
-                    if not self._direction:
-                        self._x_ind = len(self._x_val) - self._x_ind - 1
-                    self._bsc102_x.move(float(i))
-                    self._v = []
-                    for self._y_ind, j in enumerate(self._y_val):
-                        self._bsc102_y.move(float(j))
-                        self.do_measurement()
-                        self._fig.set_tight_layout(True)
-                        self._canvas.draw()  # dynamically plots the data and closes automatically after completing the scan
-                        self._master.update()
-                        if self._abort:
-                            self._bsc102_x.home()
-                            self._bsc102_y.home()
-                            break
-                    self.do_cut_measurement()
-                    self._fig.set_tight_layout(True)
-                    self._canvas.draw()
-                self._bsc102_x.home()
-                self._bsc102_y.home()  # returns piezo controller position to 0,0
+                self._checkpoint.remove()
+            self._renderer.finish()
             self.plot_final()
 
+    def read_pixel(self):
+        return self._sr7270_single_reference.read_xy()
+
+    def scan(self, post):
+        """Runs in the worker thread. Measures the map frames times, posting ('frame', frame) before and ('frame end',
+        frame) after every frame. After every frame it waits for the tkinter thread to check the standard error, and
+        stops once it is below the target. The first frame of an adaptive scan chooses the pixels and later frames
+        measure the same pixels again"""
+        post = self.post_settings(post)
+        for frame in range(self._frame, self._frames):
+            if self._abort or self._converged:
+                break
+            post(('frame', frame))
+            if self._grid and frame == 0:
+                self.adaptive_raster(post)
+            elif self._grid:
+                points = [(int(i), int(j)) for i, j in zip(*np.nonzero(self._stats1.count)) if not self._done[i, j]]
+                self.step_path(post, path_planner.plan(points, self._x_val, self._y_val, self.stage_model()))
+            else:
+                self.raster(post)
+            if self._abort:
+                break
+            post(('frame end', frame))
+            while not self._frame_checked.wait(0.1):
+                if self._abort:
+                    break
+            self._frame_checked.clear()
+            self._done = np.zeros((self._xd, self._yd), dtype=bool)  # only the resumed frame was partly measured
+        self.park()
+
+    def post_settings(self, post):
+        """Runs in the worker thread. Returns a post function that, before every pixel, also posts ('settings',
+        settings) when the lock in settings have changed, for example by auto ranging, so the checkpoints saved in the
+        tkinter thread have them without talking to the lock in"""
+        last = [self._settings]
+
+        def post_pixel(item):
+            if item[0] == 'pixel':
+                settings = self.instrument_settings()
+                if settings != last[0]:
+                    last[0] = settings
+                    post(('settings', settings))
+            post(item)
+        return post_pixel
+
+    def raster(self, post):
+        """Runs in the worker thread. Visits every pixel in the order of the path and posts ('pixel', x_ind, y_ind,
+        raw, dwell) for every pixel. A serpentine path, and a fly scan, which always sweeps serpentine lines along the
+        cut through axis, also post ('line', None) at the end of every line"""
+        if self._fly:
+            self.fly_raster(post)
+        else:
+            order = self.visit_order()
+            self.step_path(post, [(i, j) for i, j in order if not self._done[i, j]], lines=self._path == 'serpentine')
+
+    def visit_order(self):
+        """Returns the order in which a step scan visits every pixel, as (x_ind, y_ind) pairs. On a full grid the
+        nearest neighbour path strands pixels that it has to go back for, so it is only used where the stage model
+        finds it cheaper than a serpentine"""
+        if self._path == 'serpentine':
+            return path_planner.serpentine(self._xd, self._yd, axis=self._axis, direction=self._direction)
+        if self._path == 'hilbert':
+            return path_planner.hilbert(self._xd, self._yd)
+        return path_planner.plan([(i, j) for i in range(self._xd) for j in range(self._yd)], self._x_val, self._y_val,
+                                 self.stage_model())
+
+    def fly_raster(self, post):
+        """Runs in the worker thread. Sweeps the serpentine lines of the map along the cut through axis. Only the pixels
+        that received samples are posted, so the rest of an aborted line and pixels the sweep missed stay unmeasured"""
+        if self._axis == 'y':
+            outer, inner = self._bsc102_y, self._bsc102_x
+            outer_val, inner_val = self._y_val, self._x_val
+        else:
+            outer, inner = self._bsc102_x, self._bsc102_y
+            outer_val, inner_val = self._x_val, self._y_val
+        outer_order = range(len(outer_val)) if self._direction else range(len(outer_val) - 1, -1, -1)
+        for line, i in enumerate(outer_order):
+            if self._abort:
+                break
+            if (self._done[:, i] if self._axis == 'y' else self._done[i, :]).all():
+                continue  # measured before the scan was resumed
+            # the row change and the run up of the line move at the same time
+            row_change = outer.move_async(float(outer_val[i]))
+            inner_order = range(len(inner_val)) if line % 2 == 0 else range(len(inner_val) - 1, -1, -1)
+            raws, dwell = self.fly_line(inner, inner_val, reverse=line % 2 == 1, ready=row_change)
+            missed = 0
+            for j in inner_order:
+                if self._done[j, i] if self._axis == 'y' else self._done[i, j]:
+                    continue  # measured before the scan was resumed
+                if np.isnan(raws[j][0]):
+                    missed += 1
+                    continue
+                post(('pixel', j, i, raws[j], dwell) if self._axis == 'y' else ('pixel', i, j, raws[j], dwell))
+            post(('line', None))
+            if missed and not self._abort:
+                print('no samples for {} pixels of line {}, they are left unmeasured'.format(missed, i))
+
+    def stage_model(self):
+        """Returns the motion cost model of the stages, for planning visit orders. Both axes move at the same time"""
+        return path_planner.StageModel.from_stages(self._bsc102_x, self._bsc102_y, concurrent=True)
+
+    def start_stage_move(self, x, y, last=None):
+        """Starts moving both axes to x, y at the same time, commanding only the axes that differ from the last
+        position, and returns the futures of the moves"""
+        return start_move_xy(self._bsc102_x, self._bsc102_y, x if last is None or x != last[0] else None,
+                             y if last is None or y != last[1] else None)
+
+    def park(self):
+        if self._home:
+            home_xy(self._bsc102_x, self._bsc102_y)  # returns piezo controller position to 0,0
+
+    def step_path(self, post, order, last=None, lines=False, settle_first=False):
+        """Runs in the worker thread. Steps the stage through the pixels of a visit order and reads each of them. The
+        move to the next pixel is started as soon as a pixel has been read. With lines, ('line', None) is posted
+        whenever the pixel leaves a line of the cut through axis. With settle_first, the first pixel settles as after
+        a full step, for when something other than the stage has changed the signal. Returns the last stage
+        position"""
+        line = None
+        pixels = list(path_planner.visit(order, self._x_val, self._y_val))
+        moves = self.start_stage_move(*pixels[0][2:], last=last) if pixels else []
+        for k, (x_ind, y_ind, x, y) in enumerate(pixels):
+            if lines:
+                current = y_ind if self._axis == 'y' else x_ind
+                if line is not None and current != line:
+                    post(('line', None))
+                line = current
+            for move in moves:
+                move.result()
+            if self._abort:
+                break
+            step = np.hypot(x - last[0], y - last[1]) if last and not (settle_first and k == 0) else None
+            last = x, y
+            raw, dwell = self.read_step(x, y, step)
+            # the move to the next pixel overlaps with handing this one over
+            moves = self.start_stage_move(*pixels[k + 1][2:], last=last) if k + 1 < len(pixels) else []
+            if self._grid:
+                self._grid.add(x_ind, y_ind, raw[0], raw[1])
+            post(('pixel', x_ind, y_ind, raw, dwell))
+        if line is not None:
+            post(('line', None))
+        return last
+
+    def read_step(self, x, y, step):
+        """Runs in the worker thread. Reads the pixel at stage position x, y once the lock in has settled after a step
+        of the given size. Returns the reading and the dwell"""
+        if self._ranging and self._ranging.prepare(x, y):
+            step = None  # a range change settles like a full step
+            self._settle.refresh()
+        # worker thread, so sleeping here does not block tkinter
+        raw, dwell = self._settle.settle(self.read_pixel, step=step)
+        if self._ranging:
+            self._ranging.remember(x, y, raw)
+        return raw, dwell
+
+    def adaptive_raster(self, post):
+        """Runs in the worker thread. Measures the pixels chosen by the AdaptiveGrid one pass at a time, each pass in
+        the cheapest visit order from where the last one ended, and posts ('pixel', x_ind, y_ind, raw, dwell) for every
+        pixel and ('pass', pass, number of pixels) after every pass"""
+        model = self.stage_model()
+        last = None
+        while not self._abort:
+            points = self._grid.next_points()
+            if not points:
+                break
+            points = [(i, j) for i, j in points if not self._done[i, j]]  # measured before the scan was resumed
+            order = path_planner.plan(points, self._x_val, self._y_val, model, start=last)
+            last = self.step_path(post, order, last=last)
+            post(('pass', self._grid.passes, len(points)))
+
+    def fly_line(self, stage, values, reverse=False, ready=None):
+        """Runs in the worker thread. Sweeps the stage across one line at constant velocity while reading the lock in,
+        then bins the timestamped samples onto the scan values using the positions reported by the stage. The sweep
+        velocity covers one pixel in the model dwell for a one pixel step. The sweep waits for the ready future, the
+        move of the other axis, if one is given. Returns the binned readings and the dwell per pixel"""
+        velocity, acceleration = stage.read_velocity()
+        pitch = abs(values[-1] - values[0]) / (len(values) - 1) if len(values) > 1 else 0
+        dwell = self._settle.model_dwell(pitch)
+        sweep_velocity = min(pitch / dwell, velocity) if pitch and dwell else velocity
+        run_up = sweep_velocity ** 2 / (2 * acceleration)  # distance needed to reach the sweep velocity
+        start, stop = values[0] - run_up, values[-1] + run_up
+        if reverse:
+            start, stop = stop, start
+        stage.move(float(start))
+        if ready is not None:
+            ready.result()  # the other axis has to be in place before the sweep
+        stage.change_velocity(sweep_velocity)
+        position_times, positions, sample_times, samples = [], [], [], []
+        try:
+            stage.start_move(float(stop))
+            started = time.time()
+            # the status is refreshed at the 250 ms polling interval, so it can report the stage idle right after the
+            # move is started. Sampling goes on until the move has been reported and then reported complete, or until
+            # the stage is at the end of the sweep
+            seen = False
+            while not self._abort:
+                position_times.append(time.time())
+                positions.append(stage.read_position())
+                samples.append(self.read_pixel())
+                sample_times.append(time.time() - self._time_constant)  # the output lags the input by about one tc
+                if stage.is_moving():
+                    seen = True
+                elif seen or abs(positions[-1] - stop) <= pitch / 2 or time.time() - started > MOTION_TIMEOUT:
+                    break
+        finally:
+            if stage.is_moving():
+                stage.stop()
+            stage.change_velocity(velocity, acceleration)
+        dwell = pitch / sweep_velocity
+        if not samples:
+            return [[np.nan, np.nan] for _ in values], dwell
+        # the reported position only changes when the controller is polled, so only the first time each new
+        # position is seen is used to interpolate the position of every lock in sample
+        positions = np.asarray(positions)
+        changed = np.r_[True, np.diff(positions) != 0]
+        sample_positions = np.interp(sample_times, np.asarray(position_times)[changed], positions[changed])
+        binned, _ = scanner.bin_fly_scan(values, sample_positions, samples)
+        return binned.tolist(), dwell
+
+    def handle(self, item):
+        """Runs in the tkinter thread for every item posted by scan"""
+        kind, *values = item
+        if kind == 'pixel':
+            self._x_ind, self._y_ind, raw, self._dwell = values
+            self._measured[self._x_ind, self._y_ind] = True
+            self._raw[self._x_ind, self._y_ind] = raw[0:2]
+            if self._stats1:
+                pixel = self._x_ind, self._y_ind
+                mean = self._z1[pixel], self._z2[pixel]
+                self.do_measurement(raw)  # writes the frame's values into the maps, which are then averaged
+                sample = self._z1[pixel], self._z2[pixel]
+                self._z1[pixel], self._z2[pixel] = mean
+                self._stats1.add(pixel, sample[0])
+                self._stats2.add(pixel, sample[1])
+            else:
+                self.do_measurement(raw)
+            if self._checkpoint.due():
+                self.save_checkpoint()
+        elif kind == 'settings':
+            self._settings = values[0]
+        elif kind == 'line' and self._v:
+            if self._frame == 0:  # cut throughs of the first frame only
+                self.do_cut_measurement()
+                self._renderer.invalidate()  # the cut through plots are not blitted
+            self._v = []
+        elif kind == 'frame':
+            if values[0] != self._frame:
+                self._frame = values[0]
+                self._measured[...] = False
+        elif kind == 'frame end':
+            if self._stats1:
+                sem = np.fmax(self._stats1.sem, self._stats2.sem)
+                largest = float(np.nanmax(sem)) if np.isfinite(sem).any() else np.nan
+                print('frame {} of {}: largest standard error {:.4g}'.format(values[0] + 1, self._frames, largest))
+                if self._target_sem and largest < self._target_sem:
+                    self._converged = True
+                    print('standard error below {}, stopping after {} frames'.format(self._target_sem,
+                                                                                     values[0] + 1))
+                self._renderer.reload()
+            self._frame_checked.set()
+        elif kind == 'pass':
+            # the pixels not measured yet are shown interpolated, measured ones keep their values
+            self._z1[...] = scanner.fill_grid(self._z1, self._measured)
+            self._z2[...] = scanner.fill_grid(self._z2, self._measured)
+            self._renderer.reload()
+            self._v = []  # no cut throughs, the passes do not measure whole lines
+            print('adaptive pass {}: {} pixels, {} of {} measured'.format(values[0], values[1],
+                                                                           int(self._measured.sum()),
+                                                                           self._measured.size))
+
     def stop(self):
         self.plot_final()
         self._canvas.draw()
@@ -132,6 +510,9 @@ class MapScan(LockinBaseMeasurement):
     def stop2(self):
         pass
 
+    def do_measurement(self, raw):
+        pass
+
     def do_cut_measurement(self):
         pass
 
@@ -2,7 +2,8 @@ import numpy as np
 import os
 import tkinter as tk
 import time
-import csv
+from optics.measurements import storage, file_index
+from optics.hardware_control.bsc102controller import move_xy
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
@@ -10,7 +11,7 @@ class LockinBaseMeasurement:
     def __init__(self, master, filepath, device, npc3sg_input=None, npc3sg_x=None, npc3sg_y=None, sr7270_dual_harmonic=None,
                  sr7270_single_reference=None, powermeter=None, attenuator_wheel=None, waveplate=None, keithley=None,
                  daq_input=None, daq_switch_ai=None, daq_switch_ao=None, laser=None, gain=None, notes=None, mono=None,
-                 ccd=None, scan=None, bsc102_x=None, bsc102_y=None):
+                 ccd=None, scan=None, bsc102_x=None, bsc102_y=None, storage='csv'):
         self._master = master
         self._filepath = filepath
         self._device = device
@@ -29,6 +30,8 @@ class LockinBaseMeasurement:
         self._writer = None
         self._start_time = None
         self._scan = scan
+        self._storage = storage  # csv, hdf5 or npz, see optics.measurements.storage
+        self._resume = None  # position in an existing file to continue from, see storage.open_writer
         if self._powermeter:
             self._power = self._powermeter.read_power()
         else:
@@ -47,6 +50,7 @@ class LockinBaseMeasurement:
             self._measuredpolarization = ''
             self._polarization = ''
         self._abort = False
+        self._center_button = None  # disabled while a worker thread drives the stage
         self._new_max = tk.StringVar()
         self._new_min = tk.StringVar()
         self._ax1 = None
@@ -73,23 +77,17 @@ class LockinBaseMeasurement:
     def abort(self):
         self._abort = True
 
-    def make_file(self, measurement_type, index, record_polarization=True):
+    def make_file(self, measurement_type, index, record_polarization=True, extension='.csv'):
         os.makedirs(self._filepath, exist_ok=True)
-        filename = os.path.join(self._filepath, '{}_{}_{}_{}{}'.format(self._device, measurement_type,
-                                                                       self._polarization if record_polarization else '',
-                                                                       index, '.csv'))
-        imagefile = os.path.join(self._filepath, '{}_{}_{}_{}{}'.format(self._device,  measurement_type,
-                                                                        self._polarization if record_polarization else '',
-                                                                        index, '.png'))
-        while os.path.exists(filename):
-            index += 1
-            filename = os.path.join(self._filepath, '{}_{}_{}_{}{}'.format(self._device,  measurement_type,
-                                                                           self._polarization if record_polarization else '',
-                                                                           index, '.csv'))
-            imagefile = os.path.join(self._filepath, '{}_{}_{}_{}{}'.format(self._device,  measurement_type,
-                                                                            self._polarization if record_polarization else '',
-                                                                            index, '.png'))
-        return filename, imagefile, index
+        polarization = self._polarization if record_polarization else ''
+
+        def name(i, ext):
+            return os.path.join(self._filepath, '{}_{}_{}_{}{}'.format(self._device, measurement_type, polarization, i,
+                                                                       ext))
+        # the index of the directory hands out the next free index, so there is no probing of file names
+        index = file_index.allocate(self._filepath, self._device, measurement_type, polarization, index,
+                                    lambda i: os.path.exists(name(i, extension)))
+        return name(index, extension), name(index, '.png'), index
 
     def write_header(self, writer, record_position=True, record_power=True, record_polarization=True):
         if self._npc3sg_input and record_position:
@@ -97,6 +95,7 @@ class LockinBaseMeasurement:
             writer.writerow(['x laser position:', position[0]])
             writer.writerow(['y laser position:', position[1]])
         if self._sr7270_dual_harmonic:
+            self._sr7270_dual_harmonic.read_state()
             writer.writerow(['applied voltage (V):', self._sr7270_dual_harmonic.read_applied_voltage()])
             writer.writerow(['osc amplitude (V):', self._sr7270_dual_harmonic.read_oscillator_amplitude()])
             writer.writerow(['osc frequency:', self._sr7270_dual_harmonic.read_oscillator_frequency()])
@@ -107,6 +106,7 @@ class LockinBaseMeasurement:
             writer.writerow(['dual harmonic reference phase 2: ',
                                    self._sr7270_dual_harmonic.read_reference_phase(channel=2)])
         if self._sr7270_single_reference:
+            self._sr7270_single_reference.read_state()  # one round trip for the settings that are not cached
             writer.writerow(['applied voltage (V):', self._sr7270_single_reference.read_applied_voltage()])
             writer.writerow(['osc amplitude (V):', self._sr7270_single_reference.read_oscillator_amplitude()])
             writer.writerow(['osc frequency:', self._sr7270_single_reference.read_oscillator_frequency()])
@@ -129,8 +129,7 @@ class LockinBaseMeasurement:
         pass
 
     def centerbeam(self):
-        self._bsc102_y.move(4)
-        self._bsc102_x.move(4)
+        move_xy(self._bsc102_x, self._bsc102_y, 4, 4)
 
     def pack_buttons(self, master, abort_button=True, colormap_rescale=False, center_beam=False):
         if colormap_rescale:
@@ -150,11 +149,14 @@ class LockinBaseMeasurement:
             button = tk.Button(master=master, text="Abort", command=self.abort)
             button.pack(side=tk.BOTTOM)
         if center_beam:
-            button = tk.Button(master=self._master, text="Go to center", command=self.centerbeam)
-            button.pack(side=tk.BOTTOM)
+            self._center_button = tk.Button(master=self._master, text="Go to center", command=self.centerbeam)
+            self._center_button.pack(side=tk.BOTTOM)
 
     def tk_sleep(self, ms):
-        self._master.after(int(np.round(ms, 0)), self.do_nothing())
+        """Waits without blocking the tkinter event loop, so buttons such as abort keep working"""
+        done = tk.BooleanVar(master=self._master, value=False)
+        self._master.after(int(np.round(ms, 0)), done.set, True)
+        self._master.wait_variable(done)
 
     def do_nothing(self):
         pass
@@ -178,14 +180,19 @@ class LockinBaseMeasurement:
               center_beam=False, colormap_rescale=False):
         self.pack_buttons(self._master, abort_button=abort_button, center_beam=center_beam,
                           colormap_rescale=colormap_rescale)
-        self._filename, self._imagefile, self._scan = self.make_file(scan_name, self._scan,
-                                                                     record_polarization=record_polarization)
-        with open(self._filename, 'w', newline='') as inputfile:
+        if self._resume is None:
+            self._filename, self._imagefile, self._scan = self.make_file(scan_name, self._scan,
+                                                                         record_polarization=record_polarization,
+                                                                         extension=storage.EXTENSIONS[self._storage])
+        with storage.open_writer(self._filename, self._storage, resume=self._resume) as writer:
             self.start()
             self._start_time = time.time()
-            self._writer = csv.writer(inputfile)
-            self.write_header(self._writer, record_polarization=record_polarization, record_power=record_power,
-                              record_position=record_position)
+            self._writer = writer
+            if self._resume is None:  # a resumed file already has its header
+                self._writer = header = file_index.HeaderRecorder(writer)
+                self.write_header(self._writer, record_polarization=record_polarization, record_power=record_power,
+                                  record_position=record_position)
+                file_index.record(self._filename, header.attributes)
             self.setup_plots()
             self._canvas.draw()
             self.measure()
@@ -1,4 +1,7 @@
 from optics.measurements.base_measurement import LockinBaseMeasurement
+from optics.measurements.settling import SettlePolicy
+from optics.measurements.live_plot import StreamingPlot
+from optics.analysis.polarization_fit import LiveFit
 import numpy as np
 import time
 import csv
@@ -6,9 +9,11 @@ from optics.misc_utility.tkinter_utilities import tk_sleep
 
 
 class PolarizationMeasurement(LockinBaseMeasurement):
+    fit_channels = (0, 1)  # lock in outputs that follow A cos^2(theta - phi) + C, X and Y
+
     def __init__(self, master, filepath, notes, device, scan, steps, gain=None, npc3sg_input=None,
                  sr7270_single_reference=None, powermeter=None, waveplate=None, sr7270_dual_harmonic=None, ccd=None,
-                 mono=None, daq_input=None):
+                 mono=None, daq_input=None, settle=None, fit_tolerance=None, phase_tolerance=1.0):
         super().__init__(master=master, filepath=filepath, device=device, npc3sg_input=npc3sg_input,
                          sr7270_dual_harmonic=sr7270_dual_harmonic, sr7270_single_reference=sr7270_single_reference,
                          powermeter=powermeter, waveplate=waveplate, notes=notes, gain=gain, scan=scan, ccd=ccd,
@@ -20,12 +25,23 @@ class PolarizationMeasurement(LockinBaseMeasurement):
         self._vmax_x = 0
         self._vmax_y = 0
         self._polarization = float(str(self._waveplate.read_polarization()))
+        self._settle = settle if settle else SettlePolicy(self._sr7270_single_reference)
+        self._dwell = None
+        self._plot1 = StreamingPlot(self._ax1)
+        self._plot2 = StreamingPlot(self._ax2)
+        # the sweep stops once the standard error of the fitted amplitude of the first fit channel is below
+        # fit_tolerance times the amplitude and that of the phase below phase_tolerance degrees. The other channels,
+        # such as Y when the phase is set on X, can be mostly noise, whose fit does not converge
+        self._fit_tolerance = fit_tolerance
+        self._phase_tolerance = phase_tolerance
+        self._fit = LiveFit(channels=len(self.fit_channels))
 
     def load(self):
         self._ax1 = self._fig.add_subplot(211, polar=True)
         self._ax2 = self._fig.add_subplot(212, polar=True)
 
     def measure(self):
+        self._fig.tight_layout()
         for i in np.arange(self._waveplate_angle, self._waveplate_angle + 180, self._steps):
             if self._abort:
                 break
@@ -36,10 +52,32 @@ class PolarizationMeasurement(LockinBaseMeasurement):
             tk_sleep(self._master, 1500)
             self._master.update()
             self._polarization = float(str(self._waveplate.read_polarization()))
-            self.do_measurement()
-            self._fig.tight_layout()
+            raw, self._dwell = self._settle.settle(self.read_sample,
+                                                   sleep=lambda seconds: self.tk_sleep(seconds * 1000))
+            self.do_measurement(raw)
+            self._fit.add(self._polarization, [raw[channel] for channel in self.fit_channels])
+            self._plot1.refresh()
+            self._plot2.refresh()
             self._canvas.draw()
             self._master.update()
+            if self._fit_tolerance and self._fit.converged(self._fit_tolerance, self._phase_tolerance, channels=[0]):
+                print('polarization fit converged after {} points'.format(self._fit.count))
+                break
+        self.report_fit()
+
+    def report_fit(self):
+        result = self._fit.result()
+        for k, channel in enumerate(self.fit_channels):
+            print('lock in output {}: amplitude {:.4g} +/- {:.2g} V, phase {:.1f} +/- {:.1f} degrees, offset {:.4g} '
+                  'V'.format(channel + 1, result.amplitude[k], result.amplitude_error[k], result.phase[k],
+                             result.phase_error[k], result.offset[k]))
+
+    def read_sample(self):
+        # tkinter thread, so ranging waits with tk_sleep to keep the window responsive
+        return self._sr7270_single_reference.read_xy(sleep=lambda seconds: self.tk_sleep(seconds * 1000))
+
+    def do_measurement(self, raw):
+        pass
 
     def main(self):
         self.main2('polarization scan', record_polarization=False)
\ No newline at end of file
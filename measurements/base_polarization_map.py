@@ -0,0 +1,190 @@
+from optics.measurements.base_map import MapScan
+from optics.measurements.checkpoint import load_checkpoint
+from optics.analysis import polarization_fit
+from optics.misc_utility import path_planner
+import numpy as np
+
+ORDERS = ['auto', 'pixel', 'map']
+
+
+class PolarizationMapScan(MapScan):
+    """Map scan that measures every pixel at angles waveplate angles spread over 180 degrees of polarization and fits
+    A cos^2(theta - phi) + C to every pixel. Order 'pixel' steps the waveplate through the angles at every pixel and
+    'map' measures the whole map at one angle before turning the waveplate. 'auto' picks the one that takes less time
+    according to the motion cost models of the stages and of the waveplate. The X and Y values of every pixel at every
+    angle, in the units of the maps, are kept in an (x, y, angle) cube, and the file has angle and polarization
+    columns, so it loads as arrays indexed [x_pixel, y_pixel, angle]"""
+    def __init__(self, master, filepath, notes, device, scan, gain, xd, yd, xr, yr, xc, yc, bsc102_x, bsc102_y,
+                 sr7270_single_reference, powermeter=None, waveplate=None, angles=6, order='auto', direction=True,
+                 axis='y', fly=False, settle=None, storage='csv', path='serpentine', home=True, resume=None,
+                 checkpoint_interval=60):
+        state = load_checkpoint(resume) if resume else None
+        self._positions = None  # waveplate position of every angle
+        if state:  # the scan continues with the parameters of the checkpoint
+            parameters = state['parameters']
+            xd, yd, angles, order, self._positions = (parameters[key] for key in ('xd', 'yd', 'angles', 'order',
+                                                                                   'positions'))
+            fly = parameters['fly']
+        if order not in ORDERS:
+            raise ValueError('unknown order {}, use one of {}'.format(order, ', '.join(ORDERS)))
+        if angles < 3:
+            raise ValueError('a polarization map needs at least 3 angles, not {}'.format(angles))
+        if fly and order == 'pixel':
+            raise ValueError('a fly scan measures the whole map at every angle, use order map or auto')
+        self._angles = angles
+        self._order = order
+        self._angle = 0  # index of the angle of the pixels being handled
+        self._reading = np.nan  # polarization read at that angle
+        self._cube = np.full((xd, yd, angles, 2), np.nan)
+        self._theta = np.full((xd, yd, angles), np.nan)  # polarization of every reading, nan where not measured yet
+        # fitted amplitude, phase and anisotropy of X, shown while the scan runs
+        self._amplitude = np.zeros((xd, yd))
+        self._phase = np.zeros((xd, yd))
+        self._anisotropy = np.zeros((xd, yd))
+        super().__init__(master, filepath, notes, device, scan, gain, xd, yd, xr, yr, xc, yc, bsc102_x, bsc102_y,
+                         sr7270_single_reference, powermeter=powermeter, waveplate=waveplate, direction=direction,
+                         axis=axis, fly=fly, settle=settle, storage=storage, path=path, home=home, resume=resume,
+                         checkpoint_interval=checkpoint_interval)
+        if self._positions is None:
+            start = float(str(self._waveplate.read_position())) % 360
+            step = 90 / angles  # the polarization turns by twice the angle of a half wave plate
+            sign = 1 if start + 90 <= 360 else -1  # never across 360, which would turn the mount the long way round
+            self._positions = [start + sign * k * step for k in range(angles)]
+        if self._order == 'auto':
+            self._order = self.choose_order()
+
+    def choose_order(self):
+        """Returns 'pixel' or 'map', whichever takes less time according to the stage and waveplate motion models and
+        the lock in settling after a stage step and after a rotation"""
+        if self._fly:
+            return 'map'
+        pitch = max(abs(self._xr) / max(self._xd - 1, 1), abs(self._yr) / max(self._yd - 1, 1))
+        costs = path_planner.polarization_costs(self.visit_order(), self._x_val, self._y_val, self.stage_model(),
+                                                path_planner.RotatorModel.from_rotator(self._waveplate),
+                                                abs(self._positions[1] - self._positions[0]), self._angles,
+                                                step_dwell=self._settle.model_dwell(pitch),
+                                                rotation_dwell=self._settle.model_dwell())
+        order = min(costs, key=costs.get)
+        print('estimated {:.0f} s turning the waveplate at every pixel and {:.0f} s measuring the map at every angle, '
+              'using order {}'.format(costs['pixel'], costs['map'], order))
+        return order
+
+    def parameters(self):
+        parameters = super().parameters()
+        parameters.update(angles=self._angles, order=self._order, positions=self._positions)
+        return parameters
+
+    def checkpoint_arrays(self):
+        arrays = super().checkpoint_arrays()
+        arrays.update(cube=self._cube, theta=self._theta)
+        return arrays
+
+    def restore(self, state):
+        super().restore(state)
+        self._cube[...] = state['cube']
+        self._theta[...] = state['theta']
+        self.update_fit()
+        print('{} of {} readings at {} angles measured'.format(int(np.isfinite(self._theta).sum()), self._theta.size,
+                                                               self._angles))
+
+    def write_header(self, writer, **kwargs):
+        writer.writerow(['polarization angles:', self._angles])
+        writer.writerow(['order:', self._order])
+        super().write_header(writer, **kwargs)
+
+    def raster(self, post):
+        """Runs in the worker thread. Measures every pixel at every angle in the order of the scan, leaving out the
+        readings made before the scan was resumed"""
+        done = np.isfinite(self._theta)
+        if self._order == 'pixel':
+            self.pixel_raster(post, done)
+            return
+        order = None if self._fly else self.visit_order()
+        last = None
+        for k in range(self._angles):
+            if self._abort:
+                break
+            if done[:, :, k].all():
+                continue
+            self.rotate(post, k)
+            if self._fly:
+                self._done = done[:, :, k]
+                self.fly_raster(post)
+            else:
+                # every other angle visits the pixels backwards, starting where the last one ended
+                pixels = order if k % 2 == 0 else order[::-1]
+                # the signal changes with the polarization, so the first pixel settles fully, as in pixel_raster
+                last = self.step_path(post, [(i, j) for i, j in pixels if not done[i, j, k]], last=last,
+                                      settle_first=True)
+
+    def pixel_raster(self, post, done):
+        """Runs in the worker thread. Moves the stage to every pixel in turn and steps the waveplate through the angles
+        there, back and forth, so that every pixel starts at the angle the last one ended at"""
+        angle = None
+        last = None
+        for x_ind, y_ind, x, y in path_planner.visit(self.visit_order(), self._x_val, self._y_val):
+            if self._abort:
+                break
+            if done[x_ind, y_ind].all():
+                continue
+            for move in self.start_stage_move(x, y, last=last):
+                move.result()
+            step = np.hypot(x - last[0], y - last[1]) if last else None
+            last = x, y
+            if angle is None or angle < self._angles / 2:
+                sweep = range(self._angles)
+            else:
+                sweep = range(self._angles - 1, -1, -1)
+            for k in sweep:
+                if self._abort:
+                    break
+                if done[x_ind, y_ind, k]:
+                    continue
+                if k != angle:
+                    self.rotate(post, k)
+                    angle = k
+                    step = None  # the signal changes with the polarization, so the lock in settles fully
+                raw, dwell = self.read_step(x, y, step)
+                post(('pixel', x_ind, y_ind, raw, dwell))
+
+    def rotate(self, post, k):
+        """Runs in the worker thread. Turns the waveplate to the k-th angle and posts ('angle', k, polarization)"""
+        self._waveplate.move_and_wait(self._positions[k])
+        # the reported position is refreshed at the 250 ms polling interval of the mount
+        post(('angle', k, float(str(self._waveplate.read_polarization(wait_ms=250)))))
+
+    def update_fit(self, pixel=Ellipsis):
+        """Fits the pixel, or every pixel, and updates the maps of the fitted amplitude, phase and anisotropy of X"""
+        result = polarization_fit.fit(self._theta[pixel], self._cube[pixel][..., 0])
+        self._amplitude[pixel] = np.nan_to_num(result.amplitude)
+        self._phase[pixel] = np.nan_to_num(result.phase)
+        # above 1 where the signal changes sign with the polarization, shown as 1
+        self._anisotropy[pixel] = np.nan_to_num(np.clip(result.anisotropy, 0, 1))
+        self._renderer.reload()
+
+    def handle(self, item):
+        """Runs in the tkinter thread for every item posted by scan"""
+        kind, *values = item
+        if kind == 'angle':
+            if self._order == 'map' and values[0] != self._angle:
+                self.update_fit()  # with the angles measured so far
+            self._angle, self._reading = values
+        elif kind == 'pixel':
+            self._x_ind, self._y_ind, raw, self._dwell = values
+            pixel = self._x_ind, self._y_ind
+            self._measured[pixel] = True
+            self._raw[pixel] = raw[0:2]
+            self.do_measurement(raw)
+            self._theta[pixel + (self._angle,)] = self._reading
+            self._cube[pixel + (self._angle,)] = self._z1[pixel], self._z2[pixel]
+            if self._order == 'pixel':
+                self.update_fit(pixel)
+            if self._checkpoint.due():
+                self.save_checkpoint()
+        else:
+            if kind == 'frame end':
+                self.update_fit()
+            super().handle(item)
+
+    def main(self):
+        self.main2('polarization map', record_polarization=False, abort_button=True, center_beam=True)
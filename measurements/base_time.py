@@ -1,29 +1,109 @@
 from optics.measurements.base_measurement import LockinBaseMeasurement
+from optics.measurements.settling import SettlePolicy
+from optics.measurements.live_plot import StreamingPlot
+from optics.measurements.acquisition import AcquisitionThread
+from optics.measurements.scheduling import DeadlineScheduler
+from optics.measurements.storage import ExtraColumns
+import numpy as np
 import time
 
 
 class TimeMeasurement(LockinBaseMeasurement):
+    _curves = (0, 1)  # lock in curve buffer outputs matching read_sample, 0: X, 1: Y, 2: magnitude, 3: phase
+
     def __init__(self, master, filepath, notes, device, scan, rate, maxtime, npc3sg_input=None,
                  sr7270_single_reference=None, powermeter=None, waveplate=None, sr7270_dual_harmonic=None, gain=None,
-                 daq_input=None, ccd=None, mono=None):
+                 daq_input=None, ccd=None, mono=None, buffered=False, settle=None, storage='csv'):
         super().__init__(master=master, filepath=filepath, device=device, npc3sg_input=npc3sg_input,
                          sr7270_dual_harmonic=sr7270_dual_harmonic, sr7270_single_reference=sr7270_single_reference,
                          powermeter=powermeter, waveplate=waveplate, notes=notes, gain=gain, daq_input=daq_input,
-                         ccd=ccd, mono=mono)
+                         ccd=ccd, mono=mono, storage=storage)
+        if buffered and rate > 1000:
+            raise ValueError('the lock in curve buffer samples at most every 1 ms, {} Hz is too fast'.format(rate))
         self._maxtime = maxtime
         self._scan = scan
-        self._sleep = 1 / rate * 1000
+        self._rate = rate
+        self._buffered = buffered  # sample with the lock in curve buffer instead of one USB transfer per point
+        self._settle = settle if settle else SettlePolicy(self._sr7270_single_reference)
+        self._dwell = None  # dwell before the first sample, after start has changed the lock in outputs
+        self._scheduler = None
+        self._schedule = None  # deadline and skipped deadlines of the sample being written
+        self._plot1 = StreamingPlot(self._ax1)
+        self._plot2 = StreamingPlot(self._ax2)
 
     def load(self):
         self._ax1 = self._fig.add_subplot(211)
         self._ax2 = self._fig.add_subplot(212)
 
+    def write_header(self, writer, **kwargs):
+        if not self._buffered:  # the curve buffer samples on its own clock, which has no deadlines to miss
+            self._writer = writer = ExtraColumns(writer, ['deadline', 'missed'], lambda: self._schedule)
+        super().write_header(writer, **kwargs)
+
+    def read_sample(self):
+        return self._sr7270_single_reference.read_xy()
+
+    def do_measurement(self, time_now, raw):
+        pass
+
+    def draw(self):
+        self._plot1.refresh()
+        self._plot2.refresh()
+        self._fig.canvas.draw()
+
     def measure(self):
-        self._master.update()
-        self.do_measurement()
-        self._master.update()
-        if not self._abort and time.time() - self._start_time < self._maxtime:
-            self.measure()
+        _, self._dwell = self._settle.settle(self.read_sample, sleep=lambda seconds: self.tk_sleep(seconds * 1000))
+        print('settled for {:.3f} s before the first sample'.format(self._dwell))
+        self._fig.tight_layout()
+        if self._buffered:
+            self.measure_buffered()
+            return
+        # samples are read in a worker thread and plotted from the tkinter thread whenever the queue is drained
+        AcquisitionThread(self._master, self.sample, self.handle, refresh=self.draw, abort=self.abort).run()
+        print(self._scheduler.summary())
+
+    def sample(self, post):
+        """Runs in the worker thread. Reads the lock in at the requested rate until maxtime or abort and posts
+        (time, raw, deadline, missed) for every sample, with the time it was taken at, the time it was due and the
+        number of deadlines skipped before it"""
+        self._scheduler = DeadlineScheduler(self._rate)
+        offset = time.time() - self._start_time
+        while not self._abort:
+            time_now = offset + self._scheduler.wait()
+            if time_now >= self._maxtime:
+                break
+            post((time_now, self.read_sample(), offset + self._scheduler.deadline, self._scheduler.skipped))
+
+    def handle(self, item):
+        """Runs in the tkinter thread for every sample posted by sample"""
+        time_now, raw, deadline, missed = item
+        self._schedule = deadline, missed
+        self.do_measurement(time_now, raw)
+
+    def measure_buffered(self):
+        """Fills the lock in curve buffer one second at a time at the requested rate and downloads each chunk in
+        bulk, so the sample rate is no longer limited by one USB round trip per point"""
+        lockin = self._sr7270_single_reference
+        interval = int(round(1000 / self._rate)) / 1000  # the interval of the curve buffer has 1 ms resolution
+        points = max(1, int(round(1 / interval)))
+        interval = lockin.setup_curve_buffer(interval, points, curves=self._curves)
+        while not self._abort and time.time() - self._start_time < self._maxtime:
+            chunk_start = time.time() - self._start_time
+            lockin.start_curve_buffer()
+            status = lockin.read_curve_status()
+            while status[0] in (1, 2):
+                self._master.update()
+                if self._abort:
+                    lockin.stop_curve_buffer()
+                self.tk_sleep(50)
+                status = lockin.read_curve_status()
+            acquired = int(status[3])
+            samples = [lockin.read_curve(curve)[0:acquired] for curve in self._curves]
+            times = chunk_start + np.arange(len(samples[0])) * interval
+            for time_now, raw in zip(times, zip(*samples)):
+                self.do_measurement(time_now, list(raw))
+            self.draw()
+            self._master.update()
 
     def main(self):
         self.main2('intensity scan', record_power=False)
@@ -0,0 +1,52 @@
+import json
+import os
+import time
+
+import numpy as np
+
+
+def checkpoint_file(filename):
+    """Returns the checkpoint file of a measurement file"""
+    return os.path.splitext(filename)[0] + '_checkpoint.npz'
+
+
+class MapCheckpoint:
+    """Saves the progress of a map scan next to its measurement file, so the scan can be resumed after an abort or a
+    crash: the scan parameters, the instrument settings, the last stage position, the measured pixels and their values,
+    and the position in the measurement file returned by the sync method of its writer. Saving is done at most every
+    interval seconds, when due returns True, so the cost per pixel is a clock read. The file is replaced atomically,
+    so a crash while saving leaves the previous checkpoint"""
+    def __init__(self, filename, interval=60, clock=time.monotonic):
+        self.filename = filename
+        self._interval = interval
+        self._clock = clock
+        self._last = clock()
+
+    def due(self):
+        return self._clock() - self._last >= self._interval
+
+    def save(self, parameters, settings, stage, position, measured, **arrays):
+        temporary = self.filename + '.tmp'
+        with open(temporary, 'wb') as f:
+            np.savez(f, parameters=json.dumps(parameters), settings=json.dumps(settings), stage=json.dumps(stage),
+                     position=json.dumps(position), measured=measured, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.filename)
+        self._last = self._clock()
+
+    def remove(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+
+def load_checkpoint(filename):
+    """Returns the contents of a checkpoint file as a dictionary. filename can also be the measurement file"""
+    if not filename.endswith('_checkpoint.npz'):
+        filename = checkpoint_file(filename)
+    with np.load(filename) as f:
+        state = {name: f[name] for name in f.files}
+    for name in ('parameters', 'settings', 'stage', 'position'):
+        state[name] = json.loads(str(state[name]))
+    state['filename'] = filename
+    return state
@@ -0,0 +1,222 @@
+"""SQLite index of the measurement files of a directory, kept in the directory next to them. make_file allocates scan
+indices from it instead of probing for free file names, and the header of every file is recorded when it is written,
+so files can be found by device, polarization, power, bias and the other header fields without opening them. The
+index can be rebuilt from the files at any time.
+
+python -m optics.measurements.file_index C:\\data --rebuild --device X --measurement "map scan" --polarization 40
+"""
+import argparse
+import contextlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+from optics.measurements import storage
+
+INDEX_FILE = 'measurement_index.sqlite'
+MEASUREMENTS = ['map scan', 'intensity scan', 'polarization scan', 'polarization map']  # measurement_type of make_file
+NAME = re.compile(r'^(?P<device>.*)_(?P<measurement>{})_(?P<polarization>[^_]*)_(?P<index>\d+)({})$'.format(
+    '|'.join(MEASUREMENTS), '|'.join(re.escape(extension) for extension in storage.EXTENSIONS.values())))
+# indexed columns and the header entries of write_header they are taken from, the first entry found is used
+FIELDS = [('power', 'power (W)'), ('bias', 'applied voltage (V)'), ('time_constant', 'single reference time constant'),
+          ('time_constant', 'dual harmonic time constant 1'), ('gain', 'gain'),
+          ('oscillator_amplitude', 'osc amplitude (V)'), ('oscillator_frequency', 'osc frequency'),
+          ('x_density', 'x scan density'), ('y_density', 'y scan density'), ('x_range', 'x scan range'),
+          ('y_range', 'y scan range'), ('x_center', 'x center'), ('y_center', 'y center'), ('frames', 'frames'),
+          ('angles', 'polarization angles'), ('notes', 'notes')]
+COLUMNS = ['path', 'device', 'measurement', 'polarization', 'scan_index', 'recorded'] + \
+    list(dict.fromkeys(column for column, _ in FIELDS)) + ['attributes']
+TEXT_COLUMNS = ['path', 'device', 'measurement', 'notes', 'attributes']
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, device TEXT, measurement TEXT, polarization REAL,
+    scan_index INTEGER, recorded REAL, {}, attributes TEXT);
+CREATE INDEX IF NOT EXISTS files_device ON files (device, measurement, polarization);
+CREATE TABLE IF NOT EXISTS counters (device TEXT, measurement TEXT, polarization TEXT, next_index INTEGER,
+    PRIMARY KEY (device, measurement, polarization));
+'''.format(', '.join(column + (' TEXT' if column == 'notes' else ' REAL') for column in COLUMNS[6:-1]))
+
+
+def parse_name(filename):
+    """Returns the device, measurement type, polarization and index of a file named by make_file, or None"""
+    match = NAME.match(os.path.basename(filename))
+    if not match:
+        return None
+    return {'device': match.group('device'), 'measurement': match.group('measurement'),
+            'polarization': match.group('polarization'), 'index': int(match.group('index'))}
+
+
+def _value(value):
+    """Header values as numbers where they are numbers, None where they are empty"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+class HeaderRecorder:
+    """Writer wrapper that collects the header attributes written through it. Once the end of the header is written,
+    rows go straight to the wrapped writer"""
+    def __init__(self, writer):
+        self._writer = writer
+        self.attributes = {}
+        self.writerow = self._record
+
+    def _record(self, row):
+        if row and row[0] == 'end:':
+            self.writerow = self._writer.writerow
+        elif row:
+            self.attributes[str(row[0]).strip().rstrip(':').strip()] = row[1] if len(row) > 1 else ''
+        self._writer.writerow(row)
+
+    def __getattr__(self, name):
+        return getattr(self._writer, name)
+
+
+class FileIndex:
+    """The index of the measurement files of a directory. Every operation is its own transaction, so several
+    measurements can share the index"""
+    def __init__(self, directory):
+        self.directory = directory
+        self.filename = os.path.join(directory, INDEX_FILE)
+        self._connection = sqlite3.connect(self.filename, timeout=10, isolation_level=None)  # explicit transactions
+        self._connection.row_factory = sqlite3.Row
+        self._connection.executescript(SCHEMA)
+        existing = [row[1] for row in self._connection.execute('PRAGMA table_info(files)')]
+        for column in COLUMNS:  # columns added since the index was created
+            if column not in existing:
+                self._connection.execute('ALTER TABLE files ADD COLUMN {} {}'.format(
+                    column, 'TEXT' if column in TEXT_COLUMNS else 'REAL'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        self._connection.execute('BEGIN IMMEDIATE')  # takes the write lock, so two allocations cannot interleave
+        try:
+            yield self._connection
+        except BaseException:
+            self._connection.execute('ROLLBACK')
+            raise
+        self._connection.execute('COMMIT')
+
+    def next_index(self, device, measurement, polarization, start=0, taken=None):
+        """Returns the next free scan index of a device, measurement type and polarization, at least start, and
+        reserves it. taken(index) returns whether a file with the index exists anyway, for example one written before
+        the index was created"""
+        key = (str(device), str(measurement), str(polarization))
+        with self._transaction() as connection:
+            row = connection.execute('SELECT next_index FROM counters WHERE device = ? AND measurement = ? AND '
+                                     'polarization = ?', key).fetchone()
+            index = max(start, row[0] if row else 0)
+            while taken and taken(index):
+                index += 1
+            connection.execute('INSERT OR REPLACE INTO counters VALUES (?, ?, ?, ?)', key + (index + 1,))
+        return index
+
+    def _record(self, connection, filename, attributes):
+        name = parse_name(filename) or {'device': None, 'measurement': None, 'polarization': '', 'index': None}
+        values = {'path': os.path.abspath(filename), 'device': name['device'], 'measurement': name['measurement'],
+                  'polarization': _value(name['polarization'] or attributes.get('polarization')),
+                  'scan_index': name['index'], 'recorded': time.time(),
+                  'attributes': json.dumps({key: str(value) for key, value in attributes.items()})}
+        for column, key in FIELDS:
+            if values.get(column) is None and key in attributes:
+                values[column] = _value(attributes[key])
+        connection.execute('INSERT OR REPLACE INTO files ({}) VALUES ({})'.format(
+            ', '.join(COLUMNS), ', '.join('?' * len(COLUMNS))), [values.get(column) for column in COLUMNS])
+        if name['index'] is not None:  # files written without next_index still move the counter on
+            key = (name['device'], name['measurement'], name['polarization'])
+            connection.execute('INSERT OR IGNORE INTO counters VALUES (?, ?, ?, 0)', key)
+            connection.execute('UPDATE counters SET next_index = MAX(next_index, ?) WHERE device = ? AND '
+                               'measurement = ? AND polarization = ?', (name['index'] + 1,) + key)
+
+    def record(self, filename, attributes):
+        """Records a file and its header attributes"""
+        with self._transaction() as connection:
+            self._record(connection, filename, attributes)
+
+    def query(self, **criteria):
+        """Returns the files that match every criterion, a column name and its value, as dictionaries ordered by
+        device, measurement type and index. For example query(device='X', measurement='map scan', polarization=40)"""
+        unknown = [column for column in criteria if column not in COLUMNS]
+        if unknown:
+            raise ValueError('unknown columns {}, use {}'.format(', '.join(unknown), ', '.join(COLUMNS)))
+        clauses = ['{} IS NULL'.format(column) if value is None else '{} = ?'.format(column)
+                   for column, value in criteria.items()]
+        rows = self._connection.execute('SELECT * FROM files{} ORDER BY device, measurement, scan_index'.format(
+            ' WHERE ' + ' AND '.join(clauses) if clauses else ''),
+            [value if column in TEXT_COLUMNS else _value(value) for column, value in criteria.items()
+             if value is not None]).fetchall()
+        return [dict(row, attributes=json.loads(row['attributes'])) for row in rows]
+
+    def rebuild(self):
+        """Clears the index and records every measurement file of the directory again from its header. Returns the
+        number of files recorded"""
+        count = 0
+        with self._transaction() as connection:
+            connection.execute('DELETE FROM files')
+            connection.execute('DELETE FROM counters')
+            for name in sorted(os.listdir(self.directory)):
+                filename = os.path.join(self.directory, name)
+                if not parse_name(name):
+                    continue
+                try:
+                    attributes = storage.read_attributes(filename)
+                except (OSError, ValueError) as err:
+                    print('{}: {}'.format(filename, err))
+                    continue
+                self._record(connection, filename, attributes)
+                count += 1
+        return count
+
+
+def allocate(directory, device, measurement, polarization, start, taken):
+    """Returns the next free scan index from the index of directory. Falls back to probing with taken if the index
+    cannot be used, as the index only makes finding files faster"""
+    try:
+        with FileIndex(directory) as index:
+            return index.next_index(device, measurement, polarization, start=start, taken=taken)
+    except sqlite3.Error as err:
+        print('measurement index {} unavailable: {}'.format(os.path.join(directory, INDEX_FILE), err))
+    while taken(start):
+        start += 1
+    return start
+
+
+def record(filename, attributes):
+    """Records a file in the index of its directory, reporting rather than raising errors"""
+    try:
+        with FileIndex(os.path.dirname(os.path.abspath(filename))) as index:
+            index.record(filename, attributes)
+    except sqlite3.Error as err:
+        print('could not record {} in the measurement index: {}'.format(filename, err))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the measurement file index of a directory')
+    parser.add_argument('directory')
+    parser.add_argument('--rebuild', action='store_true', help='record every file of the directory again')
+    for column in COLUMNS[1:-1]:
+        parser.add_argument('--' + column.replace('_', '-'), dest=column)
+    args = parser.parse_args()
+    with FileIndex(args.directory) as index:
+        if args.rebuild:
+            print('{} files recorded'.format(index.rebuild()))
+        criteria = {column: getattr(args, column) for column in COLUMNS[1:-1] if getattr(args, column) is not None}
+        for row in index.query(**criteria):
+            print(row['path'])
+
+
+if __name__ == '__main__':
+    main()
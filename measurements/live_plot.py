@@ -0,0 +1,227 @@
+import time
+
+import numpy as np
+
+
+class _LiveImage:
+    def __init__(self, im, data, symmetric):
+        self.im = im
+        self.data = data
+        self.symmetric = symmetric  # color limits of +/- the largest magnitude, for a midpoint normalized colormap
+        self.minimum = float(np.amin(data))
+        self.maximum = float(np.amax(data))
+        self.dirty = False
+
+    def clim(self):
+        if self.symmetric:
+            limit = max(abs(self.minimum), abs(self.maximum))
+            return -limit, limit
+        return self.minimum, self.maximum
+
+
+class MapRenderer:
+    """Live rendering of the images of a map scan. Pixels are written into the image data arrays by the measurement,
+    which tells the renderer about every new value with update. The color limits come from running minimum and maximum
+    counters instead of a reduction over the whole map. At most fps times a second the changed images are copied and
+    blitted over a cached background, so the cost of a frame does not grow with the number of pixels. A full draw,
+    which also updates the colorbars and any other artists, only happens when the color limits change or invalidate is
+    called, and at most once every redraw_interval seconds"""
+    def __init__(self, canvas, fps=10, redraw_interval=1.0):
+        self._canvas = canvas
+        self._interval = 1 / fps
+        self._redraw_interval = redraw_interval
+        self._images = []
+        self._background = None
+        self._last_frame = 0
+        self._last_redraw = 0
+        self._redraw = False
+        self._pending = False
+        self._live = True
+        self._cid = self._canvas.mpl_connect('draw_event', self._on_draw)
+
+    def add_image(self, im, data, symmetric=False):
+        """Renders im from the data array (indexed [x][y], like the map arrays of MapScan) while the scan runs"""
+        im.set_animated(True)
+        self._images.append(_LiveImage(im, data, symmetric))
+
+    def _image(self, im):
+        for image in self._images:
+            if image.im is im:
+                return image
+        raise ValueError('image is not rendered by this MapRenderer')
+
+    def update(self, im, value):
+        """Records a new pixel value written into the data of im"""
+        image = self._image(im)
+        image.minimum = min(image.minimum, value)
+        image.maximum = max(image.maximum, value)
+        image.dirty = True
+
+    def reload(self):
+        """Records that the data arrays were changed in place, for example by interpolation, rather than pixel by
+        pixel with update"""
+        for image in self._images:
+            image.minimum = min(image.minimum, float(np.amin(image.data)))
+            image.maximum = max(image.maximum, float(np.amax(image.data)))
+            image.dirty = True
+
+    def invalidate(self):
+        """Requests a full draw, for example after artists other than the images have changed"""
+        self._redraw = True
+
+    def _on_draw(self, event):
+        """Caches the background after every full draw, which leaves out the animated images, then draws the images
+        on top of it"""
+        if not self._live:
+            return
+        self._background = self._canvas.copy_from_bbox(self._canvas.figure.bbox)
+        for image in self._images:
+            image.im.axes.draw_artist(image.im)
+
+    def _apply(self):
+        for image in self._images:
+            if image.dirty:
+                image.im.set_data(image.data.T)
+                image.dirty = False
+            clim = image.clim()
+            if clim != image.im.get_clim() and clim[0] != clim[1]:
+                image.im.set_clim(*clim)
+                self._redraw = True
+
+    def refresh(self):
+        """Renders the changes since the last frame, if a frame is due. Otherwise a frame is scheduled so the last
+        changes are not left unrendered"""
+        now = time.perf_counter()
+        if now - self._last_frame < self._interval:
+            if not self._pending:
+                self._pending = True
+                self._canvas.get_tk_widget().after(int(np.ceil((self._interval - now + self._last_frame) * 1000)),
+                                                   self._scheduled)
+            return
+        self._last_frame = now
+        if not any(image.dirty for image in self._images) and not self._redraw:
+            return
+        self._apply()
+        if self._background is None or (self._redraw and now - self._last_redraw >= self._redraw_interval):
+            self._redraw = False
+            self._last_redraw = now
+            self._canvas.draw()
+            return
+        self._canvas.restore_region(self._background)
+        for image in self._images:
+            image.im.axes.draw_artist(image.im)
+        for image in self._images:
+            self._canvas.blit(image.im.axes.bbox)
+
+    def _scheduled(self):
+        self._pending = False
+        if self._live:
+            self.refresh()
+
+    def finish(self):
+        """Stops live rendering and draws the final images as normal artists, so they are also saved by savefig"""
+        self._apply()
+        self._live = False
+        self._canvas.mpl_disconnect(self._cid)
+        for image in self._images:
+            image.im.set_animated(False)
+        self._canvas.draw()
+
+
+class RingBuffer:
+    """Preallocated first in, first out store of the last capacity (x, y) points"""
+    def __init__(self, capacity):
+        self._x = np.empty(capacity)
+        self._y = np.empty(capacity)
+        self._capacity = capacity
+        self._end = 0  # index after the newest point
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, x, y):
+        self._x[self._end] = x
+        self._y[self._end] = y
+        self._end = (self._end + 1) % self._capacity
+        self._size = min(self._size + 1, self._capacity)
+
+    def data(self):
+        """Returns copies of the x and y arrays, oldest point first"""
+        if self._size < self._capacity:
+            return self._x[0:self._size].copy(), self._y[0:self._size].copy()
+        return np.roll(self._x, -self._end), np.roll(self._y, -self._end)
+
+
+def decimate(x, y, max_points):
+    """Reduces the points to about max_points by keeping the minimum and maximum y of consecutive buckets, in their
+    original order, so peaks and dips survive at any zoom out"""
+    if len(x) <= max_points:
+        return x, y
+    buckets = max_points // 2
+    size = len(x) // buckets
+    used = size * buckets
+    reshaped = y[0:used].reshape(buckets, size)
+    low = np.argmin(reshaped, axis=1)
+    high = np.argmax(reshaped, axis=1)
+    offsets = np.arange(buckets) * size
+    indices = np.column_stack((np.minimum(low, high), np.maximum(low, high))) + offsets[:, np.newaxis]
+    indices = np.r_[indices.ravel(), np.arange(used, len(x))]  # the last partial bucket is kept as it is
+    return x[indices], y[indices]
+
+
+def _expand(limits, low, high, margin=0.1):
+    """Returns limits grown to hold low to high, with a margin so the limits do not change on every new point"""
+    if limits is not None and limits[0] <= low and high <= limits[1]:
+        return limits
+    if limits is not None:
+        low, high = min(low, limits[0]), max(high, limits[1])
+    pad = (high - low) * margin or abs(high) * margin or 1
+    return low - pad, high + pad
+
+
+class StreamingPlot:
+    """One line artist on ax fed from a ring buffer of the last capacity points. At every refresh the buffer is
+    decimated to at most max_points, so the cost of a frame is fixed however long the measurement runs. The axis
+    limits only grow, when a point falls outside them. On a polar axis only the radius is scaled, from zero"""
+    def __init__(self, ax, capacity=100000, max_points=2000, linestyle='', color='blue', marker='o', markersize=2):
+        self._ax = ax
+        self._buffer = RingBuffer(capacity)
+        self._max_points = max_points
+        self._polar = ax.name == 'polar'
+        self._line, = ax.plot([], [], linestyle=linestyle, color=color, marker=marker, markersize=markersize)
+        self._xlim = None
+        self._ylim = None
+        self._dirty = False
+
+    def append(self, x, y):
+        self._buffer.append(x, y)
+        self._dirty = True
+
+    def refresh(self):
+        """Updates the line and the axis limits from the buffer. Returns True if the limits changed"""
+        if not self._dirty or not len(self._buffer):
+            return False
+        self._dirty = False
+        x, y = decimate(*self._buffer.data(), self._max_points)
+        self._line.set_data(x, y)
+        finite = y[np.isfinite(y)]
+        if not len(finite):
+            return False
+        changed = False
+        if self._polar:
+            ylim = 0, _expand(self._ylim, 0, np.amax(finite))[1]
+        else:
+            ylim = _expand(self._ylim, np.amin(finite), np.amax(finite))
+            if self._xlim and x[0] > (self._xlim[0] + self._xlim[1]) / 2:
+                self._xlim = None  # the oldest points have left the ring buffer, so the window moves on
+            xlim = _expand(self._xlim, x[0], x[-1])
+            if xlim != self._xlim:
+                self._xlim = xlim
+                self._ax.set_xlim(*xlim)
+                changed = True
+        if ylim != self._ylim:
+            self._ylim = ylim
+            self._ax.set_ylim(*ylim)
+            changed = True
+        return changed
@@ -0,0 +1,46 @@
+import math
+
+from optics.hardware_control.sr7270 import sensitivity_range
+
+
+class RangeMemory:
+    """Remembers the lock in sensitivity that suits each region of a map, so the next pixel in or next to a region
+    starts at a good range instead of overloading and ranging again. Regions are squares of region_size on the stage.
+    After every pixel the range that holds headroom times the measured magnitude is stored for its region. Before a
+    pixel, the range stored for its region, or the highest range stored for the neighbouring regions, is set if it
+    differs from the current one. Ranging up after an overload is still done by LockIn.read_xy"""
+    def __init__(self, lockin, region_size=0.2, headroom=2):
+        self._lockin = lockin
+        self._region_size = region_size
+        self._headroom = headroom
+        self._ranges = {}  # region: sensitivity in mV
+
+    def region(self, x, y):
+        return int(math.floor(x / self._region_size)), int(math.floor(y / self._region_size))
+
+    def suggest(self, x, y):
+        """Returns the remembered sensitivity in mV for a stage position, or None"""
+        i, j = self.region(x, y)
+        if (i, j) in self._ranges:
+            return self._ranges[(i, j)]
+        neighbours = [self._ranges[(i + di, j + dj)] for di in (-1, 0, 1) for dj in (-1, 0, 1)
+                      if (i + di, j + dj) in self._ranges]
+        return max(neighbours) if neighbours else None
+
+    def prepare(self, x, y):
+        """Sets the remembered sensitivity for the position before it is read. Returns True if it was changed, in which
+        case the caller's dwell should follow, as the outputs take a moment to recover from a range change"""
+        suggested = self.suggest(x, y)
+        if suggested is None or math.isclose(suggested, self._lockin.read_sensitivity() * 1000):
+            return False
+        self._lockin.change_sensitivity(suggested)
+        return True
+
+    def remember(self, x, y, raw):
+        """Stores the range that suits the X and Y reading at the position"""
+        magnitude = math.hypot(*raw[0:2]) * 1000  # mV
+        if math.isnan(magnitude):
+            return
+        current = self._lockin.read_sensitivity() * 1000
+        self._ranges[self.region(x, y)] = max(sensitivity_range(magnitude * self._headroom),
+                                              current if self._lockin.is_overloaded() else 0)
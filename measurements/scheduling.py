@@ -0,0 +1,56 @@
+import time
+
+from optics.misc_utility.statistics import RunningStatistics
+
+
+class DeadlineScheduler:
+    """Paces a sampling loop to absolute deadlines, start + n / rate, so that time spent reading and sleeping does not
+    accumulate into drift. A deadline that has already passed by a whole interval or more is skipped instead of
+    sampled late in a burst, and counted as missed. The achieved interval and the jitter (lateness against the
+    deadline) are kept as running statistics, so the memory used does not grow with the length of the run. After every
+    wait, deadline and skipped hold the deadline of the sample in seconds since the first one and the number of
+    deadlines skipped right before it, for recording with the sample"""
+    def __init__(self, rate, clock=time.perf_counter, sleep=time.sleep):
+        self._interval = 1 / rate
+        self._clock = clock
+        self._sleep = sleep
+        self._start = None
+        self._index = 0
+        self._last = None
+        self.missed = 0
+        self.deadline = None
+        self.skipped = 0
+        self.intervals = RunningStatistics()
+        self.jitter = RunningStatistics()
+
+    def wait(self):
+        """Sleeps until the next deadline and returns the time in seconds since the first one"""
+        now = self._clock()
+        if self._start is None:
+            self._start = now
+        deadline = self._start + self._index * self._interval
+        skipped = 0
+        if now - deadline >= self._interval:
+            skipped = int((now - deadline) // self._interval)
+            self.missed += skipped
+            self._index += skipped
+            deadline += skipped * self._interval
+        if deadline > now:
+            self._sleep(deadline - now)
+            now = self._clock()
+        self.jitter.add(now - deadline)
+        if self._last is not None:
+            self.intervals.add(now - self._last)
+        self._last = now
+        self._index += 1
+        self.deadline = deadline - self._start
+        self.skipped = skipped
+        return now - self._start
+
+    def summary(self):
+        return ('{} samples, interval {:.2f} +/- {:.2f} ms (requested {:.2f} ms), jitter mean {:.2f} ms max {:.2f} ms, '
+                '{} missed deadlines').format(self.jitter.count,
+                                              float(self.intervals.mean) * 1000 if self.intervals.count else 0,
+                                              float(self.intervals.std) * 1000 if self.intervals.count > 1 else 0,
+                                              self._interval * 1000, float(self.jitter.mean) * 1000,
+                                              float(self.jitter.maximum or 0) * 1000, self.missed)
@@ -0,0 +1,445 @@
+import contextlib
+import csv
+import io
+import json
+import os
+
+import numpy as np
+
+try:
+    import h5py
+except ImportError:  # HDF5 storage is optional, csv and npz always work
+    h5py = None
+
+try:
+    import pandas as pd
+except ImportError:  # csv files are then parsed with numpy, which is slower
+    pd = None
+
+EXTENSIONS = {'csv': '.csv', 'hdf5': '.h5', 'npz': '.npz'}
+_INDEX = ('x_pixel', 'y_pixel', 'frame', 'angle')  # columns that place the rows of a map on its grid, always loaded
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _attribute(value):
+    if isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool):
+        return value
+    return '' if value is None else str(value)
+
+
+def _read_attribute(value):
+    """Returns a header value read back from a file of any backend as an int, float or str, so that csv headers, in
+    which every value is text, read the same as binary ones"""
+    if isinstance(value, bytes):
+        value = value.decode()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, str):
+        for convert in (int, float):
+            try:
+                return convert(value)
+            except ValueError:
+                pass
+    return value
+
+
+class CsvWriter:
+    """csv.writer for an open file, which can also write out its buffered rows for a checkpoint"""
+    def __init__(self, f):
+        self._file = f
+        self._writer = csv.writer(f)
+
+    def writerow(self, row):
+        self._writer.writerow(row)
+
+    def writerows(self, rows):
+        self._writer.writerows(rows)
+
+    def sync(self):
+        """Writes the rows so far to disk and returns the position in the file from which a resumed scan appends"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+
+class BinaryWriter:
+    """Base of the binary storage backends. It is used like a csv.writer by the measurements: the header rows written
+    by write_header, ['name:', value], become attributes, the row after ['end:', 'end of header'] names the columns
+    and every later row is data. When the columns include x_pixel and y_pixel and the header has the x and y scan
+    densities, each column is stored as a preallocated 2D array indexed [x_pixel, y_pixel], with the acquisition order
+    of every pixel in 'order'. A map with a 'frame' column and a 'frames' attribute, a map measured several times, is
+    stored as 3D arrays indexed [frame, x_pixel, y_pixel], of which only the current frame is kept in memory by the
+    HDF5 backend. A map with an 'angle' column and a 'polarization angles' attribute, a map measured at several
+    waveplate angles, is stored as 3D arrays indexed [x_pixel, y_pixel, angle]. Otherwise each column is an
+    appendable series. Data is kept in memory and written out every flush_rows rows and on close"""
+    def __init__(self, filename, flush_rows=1000):
+        self._filename = filename
+        self._flush_rows = flush_rows
+        self.attributes = {}
+        self.columns = None
+        self._header = True
+        self._map = False
+        self._frames = None  # number of frames of a map measured several times
+        self._frame = 0
+        self._angles = None  # number of waveplate angles of a polarization map
+        self._arrays = {}
+        self._rows = []
+        self._unflushed = 0
+        self._count = 0
+
+    def writerow(self, row):
+        if self._header:
+            if row and row[0] == 'end:':
+                self._header = False
+            elif row:
+                self.attributes[str(row[0]).strip().rstrip(':').strip()] = _attribute(row[1]) if len(row) > 1 else ''
+        elif self.columns is None:
+            self.columns = [str(column) for column in row]
+            self._map = 'x_pixel' in self.columns and 'y_pixel' in self.columns and \
+                'x scan density' in self.attributes and 'y scan density' in self.attributes
+            if self._map:
+                if 'frame' in self.columns and 'frames' in self.attributes:
+                    self._frames = int(float(self.attributes['frames']))
+                if 'angle' in self.columns and 'polarization angles' in self.attributes:
+                    self._angles = int(float(self.attributes['polarization angles']))
+                self._arrays = self.new_frame()
+            self.start()
+        else:
+            values = [_number(value) for value in row]
+            if self._map:
+                if self._frames:
+                    frame = int(values[self.columns.index('frame')])
+                    if frame != self._frame:
+                        self.end_frame()
+                        self._frame = frame
+                        self._arrays = self.new_frame()
+                index = int(values[self.columns.index('x_pixel')]), int(values[self.columns.index('y_pixel')])
+                if self._angles:
+                    index += (int(values[self.columns.index('angle')]),)
+                for column, value in zip(self.columns, values):
+                    if column in self._arrays:
+                        self._arrays[column][index] = value
+                self._arrays['order'][index] = self._count
+            else:
+                self._rows.append(values)
+            self._count += 1
+            self._unflushed += 1
+            if self._unflushed >= self._flush_rows:
+                self.flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def data_columns(self):
+        if self._map:
+            return [column for column in self.columns if column not in _INDEX]
+        return self.columns
+
+    def new_frame(self):
+        """Returns empty map arrays for a frame"""
+        shape = int(self.attributes['x scan density']), int(self.attributes['y scan density'])
+        if self._angles:
+            shape += (self._angles,)
+        arrays = {column: np.full(shape, np.nan) for column in self.data_columns()}
+        arrays['order'] = np.full(shape, -1, dtype=np.int64)
+        return arrays
+
+    def start(self):
+        pass
+
+    def end_frame(self):
+        self.flush()
+
+    def flush(self):
+        self._unflushed = 0
+
+    def close(self):
+        self.flush()
+
+    def sync(self):
+        """Writes the data so far to the file and returns the number of rows and the frame, from which a resumed scan
+        continues"""
+        self.flush()
+        return [self._count, self._frame]
+
+    def existing(self):
+        """Returns the attributes, columns, map flag and arrays already in the file"""
+        raise ValueError('{} files cannot be resumed'.format(type(self).__name__))
+
+    def resume(self, position):
+        """Continues a map file written by this backend after the checkpoint at which sync returned position. Pixels
+        measured after the checkpoint are measured again and overwritten"""
+        self._count, self._frame = position
+        self.attributes, self.columns, self._map, existing = self.existing()
+        if not self._map:
+            raise ValueError('only map files can be resumed')
+        if 'frame' in self.columns and 'frames' in self.attributes:
+            self._frames = int(float(self.attributes['frames']))
+        if 'angle' in self.columns and 'polarization angles' in self.attributes:
+            self._angles = int(float(self.attributes['polarization angles']))
+        self._header = False
+        self._arrays = {name: np.array(array[self._frame] if self._frames else array)
+                        for name, array in existing.items()}
+        return existing
+
+
+class Hdf5Writer(BinaryWriter):
+    """Writes into an HDF5 file: attributes on the root group and one chunked, gzip compressed dataset per column"""
+    def __init__(self, filename, flush_rows=1000, chunk_size=64, append=False):
+        if h5py is None:
+            raise ValueError('HDF5 storage needs h5py, which is not installed')
+        super().__init__(filename, flush_rows=flush_rows)
+        self._chunk_size = chunk_size
+        self._file = h5py.File(filename, 'r+' if append else 'w')
+        self._written = 0  # series rows already in the file
+
+    def start(self):
+        for key, value in self.attributes.items():
+            self._file.attrs[key] = value
+        self._file.attrs['map'] = self._map
+        self._file.attrs['columns'] = json.dumps(self.columns)
+        if self._map:
+            for column, array in self._arrays.items():
+                shape = ((self._frames,) if self._frames else ()) + array.shape
+                chunks = ((1,) if self._frames else ()) + tuple(min(n, self._chunk_size) for n in array.shape)
+                self._file.create_dataset(column, shape=shape, dtype=array.dtype, chunks=chunks,
+                                          compression='gzip', fillvalue=array.flat[0])
+        else:
+            for column in self.columns:
+                self._file.create_dataset(column, shape=(0,), maxshape=(None,), dtype='f8',
+                                          chunks=(self._chunk_size ** 2,), compression='gzip')
+
+    def flush(self):
+        if self.columns is None:
+            return
+        if self._map:
+            for column, array in self._arrays.items():
+                if self._frames:
+                    self._file[column][self._frame] = array
+                else:
+                    self._file[column][...] = array
+        elif self._rows:
+            rows = np.array(self._rows, dtype=float).reshape(len(self._rows), -1)
+            for i, column in enumerate(self.columns):
+                dataset = self._file[column]
+                dataset.resize((self._written + len(rows),))
+                dataset[self._written:] = rows[:, i]
+            self._written += len(rows)
+            self._rows = []
+        self._file.flush()
+        super().flush()
+
+    def existing(self):
+        attributes = {key: value for key, value in self._file.attrs.items() if key not in ('map', 'columns')}
+        datasets = {name: self._file[name] for name in self._file}  # read when sliced, not all frames at once
+        return attributes, json.loads(self._file.attrs['columns']), bool(self._file.attrs['map']), datasets
+
+    def close(self):
+        if self.columns is None:  # no data, but keep the header
+            for key, value in self.attributes.items():
+                self._file.attrs[key] = value
+        super().close()
+        self._file.close()
+
+
+class NpzWriter(BinaryWriter):
+    """Writes a compressed NumPy .npz archive with one array per column. The attributes and the column names are
+    stored as JSON strings. A zip archive cannot be appended to in place, so the whole archive is written again every
+    flush_rows rows and on close, which makes hdf5 the better choice for long series. For the same reason a map
+    measured several times, which would keep every frame in memory, is refused"""
+    def __init__(self, filename, flush_rows=1000):
+        super().__init__(filename, flush_rows=flush_rows)
+        self._chunks = []
+
+    def start(self):
+        if self._frames:
+            raise ValueError('npz storage cannot hold a map measured {} times, use csv or hdf5'.format(self._frames))
+
+    def flush(self):
+        if self._rows:
+            self._chunks.append(np.array(self._rows, dtype=float).reshape(len(self._rows), -1))
+            self._rows = []
+        self._save()
+        super().flush()
+
+    def _save(self):
+        arrays = dict(self._arrays)
+        if not self._map and self.columns:
+            rows = np.concatenate(self._chunks) if self._chunks else np.empty((0, len(self.columns)))
+            self._chunks = [rows]
+            arrays = {column: rows[:, i] for i, column in enumerate(self.columns)}
+        temporary = self._filename + '.tmp'  # a crash while saving leaves the last archive intact
+        with open(temporary, 'wb') as f:
+            np.savez_compressed(f, attributes=json.dumps(self.attributes), columns=json.dumps(self.columns),
+                                map=self._map, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self._filename)
+
+    def existing(self):
+        with np.load(self._filename) as f:
+            arrays = {name: f[name] for name in f.files if name not in ('attributes', 'columns', 'map')}
+            return json.loads(str(f['attributes'])), json.loads(str(f['columns'])), bool(f['map']), arrays
+
+
+
+class ExtraColumns:
+    """Adds columns to the column names that follow the end of the header, and the values returned by values to every
+    data row written through it. With header False the rows are data from the start, for a resumed file"""
+    def __init__(self, writer, names, values, header=True):
+        self._writer = writer
+        self._names = list(names)
+        self._values = values  # returns the values of the added columns for the current row
+        self._state = 'header' if header else 'data'
+
+    def writerow(self, row):
+        if self._state == 'data':
+            row = list(row) + list(self._values())
+        elif self._state == 'columns':
+            row = list(row) + self._names
+            self._state = 'data'
+        elif row and row[0] == 'end:':
+            self._state = 'columns'
+        self._writer.writerow(row)
+
+    def __getattr__(self, name):
+        return getattr(self._writer, name)
+
+
+@contextlib.contextmanager
+def open_writer(filename, storage='csv', resume=None):
+    """Context manager for a writer with the writerow method of csv.writer, for the csv, hdf5 or npz storage backend.
+    resume is the value returned by the sync method of the writer at a checkpoint. The existing file is then continued
+    from that point on, without a new header"""
+    if storage == 'csv':
+        if resume is None:
+            with open(filename, 'w', newline='') as f:
+                yield CsvWriter(f)
+        else:
+            with open(filename, 'r+', newline='') as f:
+                f.seek(resume)
+                f.truncate()  # rows written after the checkpoint are measured again
+                yield CsvWriter(f)
+        return
+    if storage == 'hdf5':
+        writer = Hdf5Writer(filename, append=resume is not None)
+    elif storage == 'npz':
+        writer = NpzWriter(filename)
+    else:
+        raise ValueError('unknown storage {}, use one of {}'.format(storage, ', '.join(EXTENSIONS)))
+    if resume is not None:
+        writer.resume(resume)
+    try:
+        yield writer
+    finally:
+        writer.close()
+
+
+def _read_rows(f, count, usecols):
+    """Reads the rows that follow the header of a csv file as a float array of the columns usecols, with the C parser
+    of pandas if it is installed. A last row cut short by an aborted scan is dropped and values that are not numbers
+    are read as nan"""
+    body = f.read()
+    if not body.endswith('\n'):
+        body = body[:body.rfind('\n') + 1]  # the last row was cut short
+    if not body.strip():
+        return np.empty((0, len(usecols)))
+    try:
+        if pd:
+            return pd.read_csv(io.StringIO(body), header=None, usecols=usecols, dtype=float).to_numpy()
+        return np.loadtxt(io.StringIO(body), delimiter=',', usecols=usecols, ndmin=2)
+    except ValueError:
+        rows = [row + [''] * (count - len(row)) for row in csv.reader(io.StringIO(body)) if row]
+        return np.array([[_number(row[i]) for i in usecols] for row in rows], dtype=float).reshape(-1, len(usecols))
+
+
+def _load_csv(filename, columns=None):
+    attributes = {}
+    with open(filename, newline='') as f:
+        reader = csv.reader(f)
+        for row in reader:
+            if row and row[0] == 'end:':
+                break
+            if row:
+                attributes[row[0].strip().rstrip(':').strip()] = _read_attribute(row[1]) if len(row) > 1 else ''
+        names = next(reader, None)
+        if names is None:
+            return attributes, {}
+        usecols = [i for i, name in enumerate(names) if columns is None or name in columns or name in _INDEX]
+        rows = _read_rows(f, len(names), usecols)
+    columns = [names[i] for i in usecols]
+    data = {column: rows[:, i] for i, column in enumerate(columns)}
+    if 'x_pixel' in columns and 'y_pixel' in columns and 'x scan density' in attributes and \
+            'y scan density' in attributes:
+        shape = int(float(attributes['x scan density'])), int(float(attributes['y scan density']))
+        valid = ~np.isnan(data['x_pixel']) & ~np.isnan(data['y_pixel'])
+        data = {column: values[valid] for column, values in data.items()}
+        index = data.pop('x_pixel').astype(int), data.pop('y_pixel').astype(int)
+        if 'frame' in data:  # a map measured several times, indexed [frame, x_pixel, y_pixel]
+            frame = data.pop('frame').astype(int)
+            shape = (int(float(attributes.get('frames', frame.max() + 1 if len(frame) else 0))),) + shape
+            index = (frame,) + index
+        elif 'angle' in data:  # a map measured at several waveplate angles, indexed [x_pixel, y_pixel, angle]
+            angle = data.pop('angle').astype(int)
+            shape += (int(float(attributes.get('polarization angles', angle.max() + 1 if len(angle) else 0))),)
+            index += (angle,)
+        for column in list(data):
+            grid = np.full(shape, np.nan)
+            grid[index] = data[column]
+            data[column] = grid
+        order = np.full(shape, -1, dtype=np.int64)
+        order[index] = np.arange(len(index[0]))
+        data['order'] = order
+    return attributes, data
+
+
+def read_attributes(filename):
+    """Returns the header attributes of a measurement file of any storage backend without reading its data"""
+    extension = os.path.splitext(filename)[1]
+    if extension == EXTENSIONS['hdf5']:
+        if h5py is None:
+            raise ValueError('loading HDF5 files needs h5py, which is not installed')
+        with h5py.File(filename, 'r') as f:
+            return {key: _read_attribute(value) for key, value in f.attrs.items() if key not in ('map', 'columns')}
+    if extension == EXTENSIONS['npz']:
+        with np.load(filename) as f:
+            return {key: _read_attribute(value) for key, value in json.loads(str(f['attributes'])).items()}
+    attributes = {}
+    with open(filename, newline='') as f:
+        for row in csv.reader(f):
+            if row and row[0] == 'end:':
+                break
+            if row:
+                attributes[row[0].strip().rstrip(':').strip()] = _read_attribute(row[1]) if len(row) > 1 else ''
+    return attributes
+
+
+def load(filename, columns=None):
+    """Returns the header attributes and a dictionary of column name to array of a measurement file of any storage
+    backend. Map columns are 2D arrays indexed [x_pixel, y_pixel], with nan where no pixel was measured, or 3D arrays
+    indexed [frame, x_pixel, y_pixel] for a map measured several times or [x_pixel, y_pixel, angle] for a map
+    measured at several waveplate angles. columns limits the columns that are read, which makes large files faster
+    to load"""
+    extension = os.path.splitext(filename)[1]
+    if extension == EXTENSIONS['hdf5']:
+        if h5py is None:
+            raise ValueError('loading HDF5 files needs h5py, which is not installed')
+        with h5py.File(filename, 'r') as f:
+            attributes = {key: _read_attribute(value) for key, value in f.attrs.items()
+                          if key not in ('map', 'columns')}
+            return attributes, {name: f[name][...] for name in f
+                                if columns is None or name in columns or name == 'order'}
+    if extension == EXTENSIONS['npz']:
+        with np.load(filename) as f:
+            data = {name: f[name] for name in f.files if name not in ('attributes', 'columns', 'map') and
+                    (columns is None or name in columns or name == 'order')}
+            attributes = {key: _read_attribute(value) for key, value in json.loads(str(f['attributes'])).items()}
+            return attributes, data
+    return _load_csv(filename, columns)
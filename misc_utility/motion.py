@@ -0,0 +1,46 @@
+import math
+
+
+def move_time(distance, velocity, acceleration):
+    """Returns the time in seconds a point to point move of the given distance takes with a trapezoidal velocity
+    profile. Short moves never reach the maximum velocity and follow a triangular profile"""
+    distance = abs(distance)
+    if distance == 0:
+        return 0
+    ramp = velocity ** 2 / acceleration  # distance covered while accelerating and decelerating
+    if distance < ramp:
+        return 2 * math.sqrt(distance / acceleration)
+    return 2 * velocity / acceleration + (distance - ramp) / velocity
+
+
+class TrapezoidalMove:
+    """Position against time of a point to point move with a trapezoidal velocity profile"""
+    def __init__(self, start, stop, velocity, acceleration, start_time):
+        self.start = start
+        self.stop = stop
+        self.start_time = start_time
+        self._direction = 1 if stop >= start else -1
+        self._distance = abs(stop - start)
+        self._acceleration = acceleration
+        if self._distance < velocity ** 2 / acceleration:
+            self._peak_velocity = math.sqrt(self._distance * acceleration)
+        else:
+            self._peak_velocity = velocity
+        self._ramp_time = self._peak_velocity / acceleration
+        self.duration = move_time(self._distance, velocity, acceleration)
+
+    @property
+    def end_time(self):
+        return self.start_time + self.duration
+
+    def position(self, t):
+        """Returns the position at the absolute time t"""
+        t = min(max(t - self.start_time, 0), self.duration)
+        if t < self._ramp_time:
+            travelled = self._acceleration * t ** 2 / 2
+        elif t < self.duration - self._ramp_time:
+            travelled = self._acceleration * self._ramp_time ** 2 / 2 + self._peak_velocity * (t - self._ramp_time)
+        else:
+            remaining = self.duration - t
+            travelled = self._distance - self._acceleration * remaining ** 2 / 2
+        return self.start + self._direction * travelled
@@ -0,0 +1,226 @@
+import numpy as np
+
+from optics.misc_utility.motion import move_time
+
+PATHS = ['serpentine', 'hilbert', 'nearest neighbour']
+
+move_times = np.vectorize(move_time, otypes=[float])  # move_time for an array of distances
+
+
+class StageModel:
+    """Time cost of moving the BSC102 between two stage positions. Each axis follows a trapezoidal velocity profile,
+    and the axes move one after the other unless concurrent is True. Every axis that moves costs overhead seconds of
+    command and polling latency, and reversing the direction of an axis costs reversal seconds more, for the backlash
+    of the lead screw"""
+    def __init__(self, velocity=2.0, acceleration=4.0, overhead=0.1, reversal=0.05, concurrent=False):
+        self.velocity = velocity
+        self.acceleration = acceleration
+        self.overhead = overhead
+        self.reversal = reversal
+        self.concurrent = concurrent
+
+    @classmethod
+    def from_stages(cls, x_stage, y_stage, **kwargs):
+        """Returns a model with the velocity and acceleration of the slower of the two stages"""
+        (xv, xa), (yv, ya) = x_stage.read_velocity(), y_stage.read_velocity()
+        return cls(velocity=min(xv, yv), acceleration=min(xa, ya), **kwargs)
+
+    def axis_costs(self, distance, direction=0):
+        """Returns the cost of moving one axis by each of an array of signed distances, after a previous move in the
+        given direction (-1, 0 or 1), or after each of an array of directions"""
+        distance = np.asarray(distance, dtype=float)
+        cost = move_times(distance, self.velocity, self.acceleration) + np.where(distance != 0, self.overhead, 0)
+        direction = np.asarray(direction)
+        return cost + np.where((direction != 0) & (np.sign(distance) == -direction), self.reversal, 0)
+
+    def costs(self, start, positions, directions=(0, 0)):
+        """Returns the cost of moving from start, an (x, y) position, to each row of an array of positions"""
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        x = self.axis_costs(positions[:, 0] - start[0], directions[0])
+        y = self.axis_costs(positions[:, 1] - start[1], directions[1])
+        return np.maximum(x, y) if self.concurrent else x + y
+
+    def cost(self, start, stop, directions=(0, 0)):
+        return float(self.costs(start, [stop], directions)[0])
+
+    def path_costs(self, positions):
+        """Returns the cost of every move between consecutive rows of an array of (x, y) positions. Each axis reverses
+        against the direction of its last move"""
+        moves = np.diff(np.asarray(positions, dtype=float).reshape(-1, 2), axis=0)
+        axes = []
+        for distance in moves.T:
+            sign = np.sign(distance)
+            last = np.maximum.accumulate(np.where(sign != 0, np.arange(len(sign)), 0))  # the last move so far
+            axes.append(self.axis_costs(distance, np.r_[0, sign[last][:-1]]))
+        return np.maximum(*axes) if self.concurrent else axes[0] + axes[1]
+
+    def lower_bound(self, distance):
+        """Returns a lower bound of the cost of any move in which one axis moves by distance or more"""
+        return float(move_times(distance, self.velocity, self.acceleration)) + self.overhead
+
+
+class RotatorModel:
+    """Time cost of turning a rotation mount, such as the waveplate, by an angle in degrees. Moves follow a
+    trapezoidal velocity profile, and every move costs overhead seconds of command latency and of waiting for the
+    status polled every 250 ms to show the move complete"""
+    def __init__(self, velocity=10.0, acceleration=10.0, overhead=0.25):
+        self.velocity = velocity
+        self.acceleration = acceleration
+        self.overhead = overhead
+
+    @classmethod
+    def from_rotator(cls, rotator, **kwargs):
+        velocity, acceleration = rotator.read_velocity()
+        return cls(velocity=velocity, acceleration=acceleration, **kwargs)
+
+    def cost(self, angle):
+        return float(move_times(angle, self.velocity, self.acceleration)) + (self.overhead if angle else 0)
+
+
+def polarization_costs(order, x_val, y_val, stage_model, rotator_model, rotation, angles, step_dwell=0,
+                       rotation_dwell=0):
+    """Returns the time in seconds that a map measured at several waveplate angles, rotation degrees apart, takes in
+    each order: 'pixel' steps the waveplate through the angles at every pixel of the visit order, sweeping back and
+    forth so each pixel starts at the angle the last one ended at, and 'map' measures the whole map at one angle
+    before turning the waveplate, visiting the pixels backwards at every other angle. Each reading also waits
+    step_dwell seconds after a stage step or rotation_dwell seconds after a rotation for the lock in to settle"""
+    pixels = len(order)
+    raster = path_cost(order, x_val, y_val, stage_model)
+    rotations = {'pixel': pixels * (angles - 1), 'map': angles - 1}
+    steps = {'pixel': pixels, 'map': angles * pixels - (angles - 1)}
+    rasters = {'pixel': 1, 'map': angles}
+    return {key: rasters[key] * raster + rotations[key] * (rotator_model.cost(rotation) + rotation_dwell) +
+            steps[key] * step_dwell for key in rotations}
+
+
+def _directions(start, stop, directions):
+    return tuple(int(np.sign(b - a)) or d for a, b, d in zip(start, stop, directions))
+
+
+def serpentine(x_scan_density, y_scan_density, axis='y', direction=True):
+    """Returns the visit order of the serpentine raster of MapScan as (x_ind, y_ind) pairs. With axis 'y' every line
+    is at constant y and runs along x. direction False starts at the last line"""
+    outer_count, inner_count = (y_scan_density, x_scan_density) if axis == 'y' else (x_scan_density, y_scan_density)
+    outer_order = range(outer_count) if direction else range(outer_count - 1, -1, -1)
+    order = []
+    for line, i in enumerate(outer_order):
+        inner_order = range(inner_count) if line % 2 == 0 else range(inner_count - 1, -1, -1)
+        order += [(j, i) if axis == 'y' else (i, j) for j in inner_order]
+    return order
+
+
+def _hilbert_point(n, d):
+    """Returns the point at distance d along the Hilbert curve that fills an n by n grid, n a power of two"""
+    x = y = 0
+    s = 1
+    while s < n:
+        rx = 1 & (d // 2)
+        ry = 1 & (d ^ rx)
+        if ry == 0:
+            if rx == 1:
+                x, y = s - 1 - x, s - 1 - y
+            x, y = y, x
+        x += s * rx
+        y += s * ry
+        d //= 4
+        s *= 2
+    return x, y
+
+
+def hilbert(x_scan_density, y_scan_density):
+    """Returns a visit order along a Hilbert curve as (x_ind, y_ind) pairs. Consecutive pixels are always neighbours
+    on a square grid whose side is a power of two, and the curve keeps the stage close to the pixels it has already
+    visited. Pixels outside the map are skipped, which leaves a few longer moves on other grids"""
+    n = 1
+    while n < max(x_scan_density, y_scan_density):
+        n *= 2
+    points = (_hilbert_point(n, d) for d in range(n * n))
+    return [(x, y) for x, y in points if x < x_scan_density and y < y_scan_density]
+
+
+def _ring(i, j, r):
+    """Returns the grid indices at a Chebyshev distance of r from i, j"""
+    if r == 0:
+        return [(i, j)]
+    return ([(i + di, j - r) for di in range(-r, r + 1)] + [(i + di, j + r) for di in range(-r, r + 1)] +
+            [(i - r, j + dj) for dj in range(1 - r, r)] + [(i + r, j + dj) for dj in range(1 - r, r)])
+
+
+def _pitch(values):
+    """Returns the smallest distance between two different stage positions of an axis"""
+    steps = np.diff(np.unique(np.asarray(values, dtype=float)))
+    return float(steps.min()) if len(steps) else np.inf
+
+
+def nearest_neighbour(points, x_val, y_val, model, start=None):
+    """Returns a visit order of an arbitrary set of (x_ind, y_ind) pixels, for example the pixels of a pass of an
+    adaptive map, that goes to the cheapest pixel not yet visited at every step according to the stage model. The
+    pixels are looked for in square rings around the current one, and the search stops once the model's lower bound
+    for the next ring is above the cheapest pixel found, so a step usually only costs the neighbouring pixels. Once
+    the rings would hold more pixels than are left, all of them are costed instead"""
+    points = [tuple(point) for point in points]
+    if not points:
+        return []
+    indices = np.array(points, dtype=int)
+    positions = np.column_stack((np.asarray(x_val, dtype=float)[indices[:, 0]],
+                                 np.asarray(y_val, dtype=float)[indices[:, 1]]))
+    pitch = min(_pitch(x_val), _pitch(y_val))
+    bounds = {}  # ring: lower bound of the cost of moving to any pixel of it
+    remaining = {point: k for k, point in reversed(list(enumerate(points)))}  # pixel: first index into points
+    current = tuple(start) if start is not None else tuple(positions[0])
+    pixel = None  # the current pixel, the search starts from all pixels when the stage is elsewhere
+    directions = (0, 0)
+    order = []
+    for _ in range(len(remaining)):
+        best = None  # (cost, index into points)
+        r = 0
+        while pixel is not None and 8 * r < len(remaining):
+            candidates = [remaining[cell] for cell in _ring(pixel[0], pixel[1], r) if cell in remaining]
+            if candidates:
+                found = min(zip(model.costs(current, positions[candidates], directions).tolist(), candidates))
+                best = min(best, found) if best else found
+            r += 1
+            if r not in bounds:
+                bounds[r] = model.lower_bound(r * pitch)
+            if best and bounds[r] > best[0]:
+                break
+        else:
+            candidates = sorted(remaining.values())
+            best = min(zip(model.costs(current, positions[candidates], directions).tolist(), candidates))
+        k = best[1]
+        pixel = points[k]
+        del remaining[pixel]
+        order.append(pixel)
+        directions = _directions(current, positions[k], directions)
+        current = tuple(positions[k])
+    return order
+
+
+def path_cost(order, x_val, y_val, model, start=None):
+    """Returns the total stage motion cost in seconds of visiting the pixels in order"""
+    indices = np.array(order, dtype=int).reshape(-1, 2)
+    positions = np.column_stack((np.asarray(x_val, dtype=float)[indices[:, 0]],
+                                 np.asarray(y_val, dtype=float)[indices[:, 1]]))
+    if start is not None:
+        positions = np.vstack((start, positions))
+    return float(model.path_costs(positions).sum())
+
+
+def plan(points, x_val, y_val, model, start=None):
+    """Returns the cheapest of a serpentine along x, a serpentine along y and the nearest neighbour visit order of an
+    arbitrary set of pixels"""
+    points = list(points)
+    rows, columns = {}, {}
+    for x_ind, y_ind in points:
+        rows.setdefault(y_ind, []).append(x_ind)
+        columns.setdefault(x_ind, []).append(y_ind)
+    candidates = [[(i, j) for n, j in enumerate(sorted(rows)) for i in sorted(rows[j], reverse=n % 2 == 1)],
+                  [(i, j) for n, i in enumerate(sorted(columns)) for j in sorted(columns[i], reverse=n % 2 == 1)],
+                  nearest_neighbour(points, x_val, y_val, model, start=start)]
+    return min(candidates, key=lambda order: path_cost(order, x_val, y_val, model, start=start))
+
+
+def visit(order, x_val, y_val):
+    """Iterates over a visit order as (x_ind, y_ind, x, y), with the stage positions of the pixels"""
+    for x_ind, y_ind in order:
+        yield x_ind, y_ind, float(x_val[x_ind]), float(y_val[y_ind])
@@ -18,6 +18,25 @@ def find_scan_values(x_center, y_center, x_range, y_range, x_scan_density, y_sca
     return x_val, y_val
 
 
+def bin_fly_scan(grid, positions, values):
+    """Averages samples taken at arbitrary stage positions onto the nearest points of a uniform grid from
+    find_scan_values. values has one row per sample. Grid points that received no samples are nan, as nothing was
+    measured there. Returns the binned values and the number of samples in each bin"""
+    grid = np.asarray(grid, dtype=float)
+    positions = np.asarray(positions, dtype=float)
+    values = np.asarray(values, dtype=float).reshape(len(positions), -1)
+    pitch = grid[1] - grid[0] if len(grid) > 1 else 1
+    ind = np.rint((positions - grid[0]) / pitch).astype(int)
+    keep = (ind >= 0) & (ind < len(grid))
+    counts = np.bincount(ind[keep], minlength=len(grid))
+    binned = np.full((len(grid), values.shape[1]), np.nan)
+    filled = counts > 0
+    for k in range(values.shape[1]):
+        sums = np.bincount(ind[keep], weights=values[keep, k], minlength=len(grid))
+        binned[filled, k] = sums[filled] / counts[filled]
+    return binned, counts
+
+
 def scan(x_val, y_val, w, z1, z2, fig, ax1, ax2, im1, im2, npc3sg_x, npc3sg_y, sr7270_bottom, gain):
     for y_ind, i in enumerate(y_val):
         npc3sg_y.move(i)
@@ -33,4 +52,89 @@ def scan(x_val, y_val, w, z1, z2, fig, ax1, ax2, im1, im2, npc3sg_x, npc3sg_y, s
             thermovoltage_plot.plot(ax2, im2, z2, np.amax(np.abs(z2)), -np.amax(np.abs(z2)))
             plt.tight_layout()
             fig.canvas.draw()  # dynamically plots the data and closes automatically after completing the scan
-    return z1, z2
\ No newline at end of file
+    return z1, z2
+
+
+def fill_grid(z, measured):
+    """Fills the pixels of a 2D map that were not measured by linear interpolation, first along x in every row that
+    has measured pixels and then along y in every column. For the measured corners of the cells of an AdaptiveGrid
+    this is bilinear interpolation inside every cell. Returns a new array"""
+    z = np.array(z, dtype=float)
+    known = np.array(measured, dtype=bool)
+    index = np.arange(z.shape[0])
+    for j in range(z.shape[1]):
+        if known[:, j].any():
+            z[~known[:, j], j] = np.interp(index[~known[:, j]], index[known[:, j]], z[known[:, j], j])
+    filled = known.any(axis=0)
+    index = np.arange(z.shape[1])
+    if filled.any():
+        for i in range(z.shape[0]):
+            z[i, ~filled] = np.interp(index[~filled], index[filled], z[i, filled])
+    return z
+
+
+class AdaptiveGrid:
+    """Chooses the pixels of an adaptive map on the uniform grid of find_scan_values. The first pass measures every
+    coarse-th pixel along each axis, plus the last one, which divides the map into cells. Every later pass splits the
+    cells whose corners have a magnitude above magnitude_threshold, or differ from each other by more than
+    gradient_threshold, into four and measures the new corners. Both thresholds are fractions of the largest
+    magnitude measured so far, and cells whose corners are all within floor of zero and of each other are never
+    split. Cells one pixel wide are not split further, so flat background is measured at the coarse pitch and
+    hotspots at the full pitch"""
+    def __init__(self, x_scan_density, y_scan_density, coarse=4, magnitude_threshold=0.1, gradient_threshold=0.05,
+                 floor=0):
+        self.shape = x_scan_density, y_scan_density
+        self._magnitude_threshold = magnitude_threshold
+        self._gradient_threshold = gradient_threshold
+        self._floor = floor
+        self.values = {}  # (x_pixel, y_pixel): complex reading
+        self.measured = np.zeros(self.shape, dtype=bool)
+        x = np.unique(np.r_[np.arange(0, x_scan_density, coarse), x_scan_density - 1])
+        y = np.unique(np.r_[np.arange(0, y_scan_density, coarse), y_scan_density - 1])
+        self._cells = [(x0, x1, y0, y1) for x0, x1 in zip(x[:-1], x[1:]) for y0, y1 in zip(y[:-1], y[1:])]
+        self._pending = [(int(i), int(j)) for i in x for j in y]
+        self.passes = 0
+
+    def add(self, x_pixel, y_pixel, x, y):
+        """Records the X and Y reading of a pixel"""
+        self.values[(x_pixel, y_pixel)] = complex(x, y)
+        self.measured[x_pixel, y_pixel] = True
+
+    def _split(self, cell, peak):
+        x0, x1, y0, y1 = cell
+        if x1 - x0 <= 1 and y1 - y0 <= 1:
+            return False
+        corners = np.array([self.values.get(corner, np.nan) for corner in ((x0, y0), (x1, y0), (x0, y1), (x1, y1))])
+        corners = corners[~np.isnan(corners)]
+        if not len(corners):
+            return False
+        magnitude = np.max(np.abs(corners))
+        spread = np.max(np.abs(corners[:, np.newaxis] - corners[np.newaxis, :]))
+        if magnitude <= self._floor and spread <= self._floor:
+            return False
+        return magnitude > self._magnitude_threshold * peak or spread > self._gradient_threshold * peak
+
+    def next_points(self):
+        """Returns the pixels to measure in the next pass, in rows of alternating direction along x, or an empty list
+        when the map is complete"""
+        if not self._pending and self.passes:
+            peak = max(abs(value) for value in self.values.values()) if self.values else 0
+            cells = []
+            for cell in self._cells:
+                if not self._split(cell, peak):
+                    continue
+                x0, x1, y0, y1 = cell
+                xm, ym = (x0 + x1) // 2, (y0 + y1) // 2
+                xs = (x0, xm, x1) if x1 - x0 > 1 else (x0, x1)
+                ys = (y0, ym, y1) if y1 - y0 > 1 else (y0, y1)
+                cells += [(xa, xb, ya, yb) for xa, xb in zip(xs[:-1], xs[1:]) for ya, yb in zip(ys[:-1], ys[1:])]
+                self._pending += [(i, j) for i in xs for j in ys if not self.measured[i, j]]
+            self._cells = cells
+        points = set(self._pending)
+        self._pending = []
+        if points:
+            self.passes += 1
+        rows = {}
+        for i, j in points:
+            rows.setdefault(j, []).append(i)
+        return [(i, j) for n, j in enumerate(sorted(rows)) for i in sorted(rows[j], reverse=n % 2 == 1)]
@@ -0,0 +1,68 @@
+import numpy as np
+
+
+class RunningStatistics:
+    """Mean, variance, minimum and maximum of a stream of values in constant memory, with Welford's algorithm. The
+    values can be numbers or equally shaped arrays, which are treated elementwise"""
+    def __init__(self):
+        self.count = 0
+        self.mean = 0
+        self._m2 = 0  # sum of squared differences from the mean
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value):
+        value = np.asarray(value, dtype=float)
+        self.count += 1
+        delta = value - self.mean
+        self.mean = self.mean + delta / self.count
+        self._m2 = self._m2 + delta * (value - self.mean)
+        self.minimum = value if self.minimum is None else np.minimum(self.minimum, value)
+        self.maximum = value if self.maximum is None else np.maximum(self.maximum, value)
+
+    @property
+    def variance(self):
+        """Sample variance, nan until there are two values"""
+        if self.count < 2:
+            return np.full(np.shape(self.mean), np.nan) if np.ndim(self.mean) else np.nan
+        return self._m2 / (self.count - 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    @property
+    def sem(self):
+        """Standard error of the mean"""
+        return self.std / np.sqrt(self.count) if self.count else np.nan
+
+
+class PixelStatistics:
+    """Welford statistics for every pixel of a map, updated one pixel at a time. The running mean is kept in place in
+    the array that is passed in, so a live map shows the average so far, and only the count and the sum of squared
+    differences are added, so memory does not grow with the number of frames"""
+    def __init__(self, mean, count=None, m2=None):
+        self.mean = mean
+        self.count = np.zeros(mean.shape, dtype=np.int64) if count is None else count
+        self.m2 = np.zeros(mean.shape) if m2 is None else m2  # sum of squared differences from the mean
+
+    def add(self, index, value):
+        self.count[index] += 1
+        if self.count[index] == 1:
+            self.mean[index] = value  # the array can hold anything before the first value
+            return
+        delta = value - self.mean[index]
+        self.mean[index] += delta / self.count[index]
+        self.m2[index] += delta * (value - self.mean[index])
+
+    @property
+    def variance(self):
+        """Sample variance of every pixel, nan where there are fewer than two values"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.count > 1, self.m2 / (self.count - 1), np.nan)
+
+    @property
+    def sem(self):
+        """Standard error of the mean of every pixel"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.sqrt(self.variance / self.count)
@@ -0,0 +1,28 @@
+import numpy as np
+
+
+class PhotovoltageField:
+    """Synthetic photovoltage image of a device. Each hotspot is a gaussian of the beam size with a signed amplitude in
+    volts and a polarization dependence amplitude * (1 - anisotropy + anisotropy * cos^2(polarization - angle)). The
+    signal appears in X and Y of the lock in with the given phase in degrees"""
+    def __init__(self, hotspots=None, beam_size=0.15, background=0, phase=20):
+        if hotspots is None:  # (x, y, amplitude (V), angle (degrees), anisotropy)
+            hotspots = [(3.2, 4.4, 40e-6, 30, 0.8),
+                        (4.6, 3.5, -25e-6, 120, 0.6),
+                        (4.0, 4.0, 10e-6, 0, 0.2),
+                        (5.3, 4.8, 15e-6, 75, 0.9)]
+        self._hotspots = np.array(hotspots, dtype=float).reshape(-1, 5)
+        self._beam_size = beam_size
+        self._background = background
+        self._phase = np.deg2rad(phase)
+
+    def __call__(self, x, y, polarization=0):
+        """Returns the signal X + iY in volts at a stage position for a laser polarization in degrees. x and y can be
+        arrays"""
+        x = np.asarray(x, dtype=float)[..., np.newaxis]
+        y = np.asarray(y, dtype=float)[..., np.newaxis]
+        hx, hy, amplitude, angle, anisotropy = self._hotspots.T
+        polarization_factor = 1 - anisotropy + anisotropy * np.cos(np.deg2rad(polarization - angle)) ** 2
+        spot = np.exp(-((x - hx) ** 2 + (y - hy) ** 2) / (2 * self._beam_size ** 2))
+        signal = self._background + np.sum(amplitude * polarization_factor * spot, axis=-1)
+        return signal * np.exp(1j * self._phase)
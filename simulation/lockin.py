@@ -0,0 +1,301 @@
+import array
+import math
+import random
+import re
+import threading
+import time
+
+import numpy as np
+
+try:
+    from usb.core import USBTimeoutError
+except ImportError:
+    class USBTimeoutError(Exception):
+        pass
+
+SENSITIVITIES = [2e-6, 5e-6, 1e-5, 2e-5, 5e-5, 1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2, 0.1, 0.2, 0.5, 1,
+                 2, 5, 10, 20, 50, 100, 200, 500, 1000]  # full scale in mV for sen 1 to 27
+TIME_CONSTANTS = [10e-06, 20e-06, 50e-06, 100e-06, 200e-06, 500e-06, 1e-03, 2e-03, 5e-03, 10e-03, 20e-03, 50e-03,
+                  100e-03, 200e-03, 500e-03, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000,
+                  100000]  # seconds for tc 0 to 30
+ENBW = [1 / 4, 1 / 8, 3 / 32, 5 / 64]  # equivalent noise bandwidth times the time constant for 6 to 24 dB/octave
+COMMAND = re.compile(r'^([a-z]+?)([12]?)(\.?)(?:\s+(.*))?$')
+
+
+class _Endpoint:
+    def __init__(self, device):
+        self._device = device
+
+    def write(self, command):
+        self._device.write(command)
+
+
+class SimulatedLockInDevice:
+    """Stand in for the USB device of an SR7270 in single reference mode. It understands the commands sent by
+    sr7270.LockIn and answers in the same format: the ascii response, a new line, a null character, the status byte
+    and the overload byte. The input is the photovoltage field at position(t) and polarization(t), filtered by a
+    cascade of RC stages with the set time constant and slope, plus white noise of noise V/rtHz. Readings beyond 120%
+    of the sensitivity set the output overload bits. Reference unlock and input overload events happen at random at
+    the given rates per second. Every read takes latency seconds, like one USB round trip"""
+    def __init__(self, field, position=None, polarization=None, latency=0.002, time_constant=0.1, slope=12,
+                 sensitivity=1, noise=20e-9, unlock_rate=0, unlock_duration=0.5, input_overload_rate=0, seed=None):
+        self._field = field
+        self._position = position if position else lambda t: (4, 4)
+        self._polarization = polarization if polarization else lambda t: 0
+        self._latency = latency
+        self._time_constant = time_constant
+        self._poles = slope // 6
+        self._sensitivity = sensitivity  # full scale in mV
+        self._noise = noise
+        self._unlock_rate = unlock_rate
+        self._unlock_duration = unlock_duration
+        self._input_overload_rate = input_overload_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._response = bytearray()
+        self._replies = None  # replies of the parts of a compound command
+        self._reference_phase = 0
+        self._applied_voltage = 0
+        self._oscillator_amplitude = 1
+        self._oscillator_frequency = 1000
+        self._last = time.time()
+        self._states = [self._input(self._last)] * self._poles
+        self._next_unlock = self._next_event(self._unlock_rate)
+        self._next_input_overload = self._next_event(self._input_overload_rate)
+        self._curve_length = 1000
+        self._curve_interval = 0.005
+        self._curves = 3
+        self._curve_start = None
+        self._curve_stop = None
+        self._curve_states = None
+        self._curve_points = []
+        self.ep0 = _Endpoint(self)
+        self.ep1 = object()
+
+    def _next_event(self, rate):
+        return time.time() + self._random.expovariate(rate) if rate else math.inf
+
+    def _input(self, t):
+        x, y = self._position(t)
+        return complex(self._field(x, y, self._polarization(t)))
+
+    def _advance(self, states, start, stop):
+        """Returns the filter states at stop, starting from states at start. Long gaps settle completely"""
+        gap = stop - start
+        if gap <= 0:
+            return states
+        if gap > 50 * self._time_constant:
+            return [self._input(stop)] * len(states)
+        steps = min(max(int(math.ceil(gap / (self._time_constant / 4))), 1), 400)
+        h = gap / steps
+        alpha = 1 - math.exp(-h / self._time_constant)
+        states = list(states)
+        for k in range(steps):
+            value = self._input(start + (k + 1) * h)
+            for pole in range(len(states)):
+                states[pole] += alpha * (value - states[pole])
+                value = states[pole]
+        return states
+
+    def _output(self, states):
+        std = self._noise * math.sqrt(ENBW[self._poles - 1] / self._time_constant)
+        noise = complex(self._random.gauss(0, std), self._random.gauss(0, std))
+        return (states[-1] + noise) * complex(math.cos(math.radians(-self._reference_phase)),
+                                              math.sin(math.radians(-self._reference_phase)))
+
+    def _sample(self):
+        now = time.time()
+        self._states = self._advance(self._states, self._last, now)
+        self._last = now
+        return self._output(self._states)
+
+    def _fill_curve(self):
+        """Computes the curve buffer points stored up to now"""
+        if self._curve_start is None:
+            return
+        stop = min(time.time(), self._curve_stop)
+        while True:
+            t = self._curve_start + len(self._curve_points) * self._curve_interval
+            if t > stop or len(self._curve_points) >= self._curve_length:
+                break
+            previous = self._curve_start + (len(self._curve_points) - 1) * self._curve_interval
+            self._curve_states = self._advance(self._curve_states, max(previous, self._curve_start), t)
+            self._curve_points.append(self._output(self._curve_states))
+
+    def _status(self, now, values=()):
+        status = 1
+        overload = 0
+        if self._next_unlock + self._unlock_duration < now:
+            self._next_unlock = self._next_event(self._unlock_rate)
+        if self._next_unlock <= now:
+            status |= 8
+        if self._next_input_overload <= now:
+            self._next_input_overload = self._next_event(self._input_overload_rate)
+            status |= 64
+        for bit, value in enumerate(values[0:2]):
+            if abs(value) > 1.2 * self._sensitivity / 1000:
+                overload |= 2 ** bit
+        if overload:
+            status |= 16
+        return status, overload
+
+    def _respond(self, text, status=1, overload=0):
+        if self._replies is not None:
+            self._replies.append((text, status, overload))
+        else:
+            self._response.extend(text.encode('latin-1') + b'\n\x00' + bytes([status, overload]))
+
+    def write(self, command):
+        """Runs a command, or the parts of a compound command separated by semicolons. The replies of a compound
+        command come back on separate lines of one response, with the status and overload bytes of all the parts"""
+        with self._lock:
+            commands = command.strip().lower().split(';')
+            if len(commands) == 1:
+                self._command(commands[0])
+                return
+            self._replies = []
+            try:
+                for part in commands:
+                    self._command(part.strip())
+                replies = self._replies
+            finally:
+                self._replies = None
+            status = overload = 0
+            for _, part_status, part_overload in replies:
+                status |= part_status
+                overload |= part_overload
+            self._respond('\n'.join(text for text, _, _ in replies if text), status, overload)
+
+    def _command(self, command):
+        match = COMMAND.match(command)
+        if not match:
+            self._respond('', status=3)
+            return
+        name, channel, floating, argument = match.groups()
+        now = time.time()
+        try:
+            if name in ('xy', 'mp'):
+                value = self._sample()
+                clip = 3 * self._sensitivity / 1000
+                x = min(max(value.real, -clip), clip)
+                y = min(max(value.imag, -clip), clip)
+                status, overload = self._status(now, (x, y))
+                if name == 'xy':
+                    self._respond('{:.5E},{:.5E}'.format(x, y), status, overload)
+                else:
+                    self._respond('{:.5E},{:.4f}'.format(abs(complex(x, y)), math.degrees(math.atan2(y, x))),
+                                  status, overload)
+                return
+            if name == 'sen':
+                if argument:
+                    self._sensitivity = SENSITIVITIES[int(argument) - 1]
+                    self._respond('')
+                else:
+                    value = self._sensitivity / 1000 if floating else SENSITIVITIES.index(self._sensitivity) + 1
+                    self._respond(str(value))
+            elif name == 'tc':
+                if argument:
+                    self._sample()
+                    self._time_constant = TIME_CONSTANTS[int(argument)]
+                    self._respond('')
+                else:
+                    value = self._time_constant if floating else TIME_CONSTANTS.index(self._time_constant)
+                    self._respond(str(value))
+            elif name == 'slope':
+                if argument:
+                    self._sample()
+                    self._poles = int(argument) + 1
+                    self._states = [self._states[-1]] * self._poles
+                    self._respond('')
+                else:
+                    self._respond(str(self._poles - 1))
+            elif name == 'refmode':
+                self._respond('0')
+            elif name in ('st', 'n'):
+                self._respond('', *self._status(now, self._sample_values()))
+            elif name == 'refp':
+                self._respond('{:.3f}'.format(self._reference_phase))
+            elif name == 'aqn':
+                value = self._sample()
+                self._reference_phase = (self._reference_phase + math.degrees(math.atan2(value.imag, value.real))) % 360
+                self._respond('')
+            elif name == 'dac':
+                arguments = argument.split()
+                if len(arguments) > 1:
+                    self._applied_voltage = float(arguments[1]) * 10 / 1000
+                    self._respond('')
+                else:
+                    self._respond('{:.4f}'.format(self._applied_voltage))
+            elif name == 'of':
+                if argument:
+                    self._oscillator_frequency = float(argument) / 100 / 1000
+                    self._respond('')
+                else:
+                    self._respond('{:.4f}'.format(self._oscillator_frequency))
+            elif name == 'oa':
+                if argument:
+                    self._oscillator_amplitude = float(argument) / 100 / 1000
+                    self._respond('')
+                else:
+                    self._respond('{:.6f}'.format(self._oscillator_amplitude))
+            elif name == 'adc':
+                self._respond('{:.4E}'.format(self._random.gauss(0, 1e-3)))
+            elif name == 'cbd':
+                self._curves = int(argument)
+                self._respond('')
+            elif name == 'len':
+                self._curve_length = int(argument)
+                self._respond('')
+            elif name == 'str':
+                self._curve_interval = int(argument) / 1000
+                self._respond('')
+            elif name == 'nc':
+                self._curve_start = None
+                self._curve_points = []
+                self._respond('')
+            elif name == 'td':
+                self._curve_start = now
+                self._curve_stop = now + (self._curve_length - 1) * self._curve_interval
+                self._states = self._advance(self._states, self._last, now)
+                self._last = now
+                self._curve_states = list(self._states)
+                self._curve_points = []
+                self._respond('')
+            elif name == 'hc':
+                self._fill_curve()
+                if self._curve_start is not None:
+                    self._curve_stop = min(self._curve_stop, now)
+                self._respond('')
+            elif name == 'm':
+                self._fill_curve()
+                running = self._curve_start is not None and now < self._curve_stop
+                self._respond('{},{},{},{}'.format(1 if running else 0, 0 if running else 1, 0,
+                                                   len(self._curve_points)))
+            elif name == 'dc':
+                self._fill_curve()
+                curve = int(argument)
+                if not self._curves & 2 ** curve:
+                    raise ValueError
+                points = np.array(self._curve_points, dtype=complex)
+                values = [points.real, points.imag, np.abs(points), np.degrees(np.angle(points))][curve]
+                self._respond('\n'.join('{:.5E}'.format(value) for value in values))
+            else:
+                self._respond('', status=3)
+        except (ValueError, IndexError, TypeError, AttributeError):
+            self._respond('', status=5)
+
+    def _sample_values(self):
+        value = self._sample()
+        return value.real, value.imag
+
+    def read(self, endpoint, size, timeout):
+        time.sleep(self._latency)
+        with self._lock:
+            if not self._response:
+                raise USBTimeoutError('Operation timed out')
+            chunk = self._response[0:size]
+            del self._response[0:size]
+        return array.array('B', chunk)
+
+    def set_configuration(self):
+        pass
@@ -0,0 +1,156 @@
+import math
+import random
+import threading
+import time
+from decimal import Decimal
+
+from optics.misc_utility.motion import TrapezoidalMove
+
+
+class _Status:
+    def __init__(self, moving, homed):
+        self.IsInMotion = moving
+        self.IsJogging = False
+        self.IsHomed = homed
+
+
+class _VelocityParameters:
+    def __init__(self, velocity, acceleration):
+        self.MinVelocity = Decimal(0)
+        self.MaxVelocity = Decimal(str(velocity))
+        self.Acceleration = Decimal(str(acceleration))
+
+
+class SimulatedMotorChannel:
+    """Stand in for a Kinesis motor channel (a BSC102 channel or a TDC001/KDC101 rotation mount) with the members used
+    by StepperMotorController and RotatorMountController. Moves follow a trapezoidal velocity profile. Like the real
+    device, Position and Status are only refreshed at the polling interval, and every command takes latency seconds.
+    A wait argument of 0 returns immediately, a positive number blocks until the move is complete and a callable is
+    called with a task id when the move is complete"""
+    def __init__(self, position=0, velocity=2.0, acceleration=4.0, latency=0.002, polling_ms=250, travel=None):
+        self._lock = threading.Lock()
+        self._position = position
+        self._move = None
+        self._velocity = velocity
+        self._acceleration = acceleration
+        self._latency = latency
+        self._polling = polling_ms / 1000
+        self._travel = travel  # (minimum, maximum) position, None for a rotation mount
+        self._homed = False
+        self._tasks = 0
+        self.DeviceID = 'simulated'
+        self.MotorDeviceSettings = None
+
+    def position_at(self, t):
+        """Returns the true position at the absolute time t"""
+        with self._lock:
+            if self._move:
+                return self._move.position(t)
+            return self._position
+
+    def _polled_time(self):
+        now = time.time()
+        if not self._polling:
+            return now
+        return math.floor(now / self._polling) * self._polling
+
+    def _moving(self, t):
+        with self._lock:
+            return bool(self._move) and self._move.start_time <= t < self._move.end_time
+
+    def _start(self, target):
+        time.sleep(self._latency)
+        if self._travel:
+            target = min(max(target, self._travel[0]), self._travel[1])
+        now = time.time()
+        current = self.position_at(now)
+        with self._lock:
+            self._position = current
+            self._move = TrapezoidalMove(current, target, self._velocity, self._acceleration, now)
+            self._tasks += 1
+            return self._move, self._tasks
+
+    def _finish(self, move, task, wait):
+        remaining = max(move.end_time - time.time(), 0)
+        if callable(wait):
+            threading.Timer(remaining, wait, args=(task,)).start()
+        elif wait:
+            time.sleep(remaining)
+
+    @property
+    def Position(self):
+        return Decimal(str(round(self.position_at(self._polled_time()), 5)))
+
+    @property
+    def Status(self):
+        return _Status(self._moving(self._polled_time()), self._homed)
+
+    @property
+    def State(self):
+        return 1 if self._moving(time.time()) else 0
+
+    @property
+    def IsDeviceBusy(self):
+        return self._moving(time.time())
+
+    def MoveTo(self, position, wait):
+        move, task = self._start(float(str(position)))
+        self._finish(move, task, wait)
+
+    def Home(self, wait):
+        move, task = self._start(0)
+        self._homed = True
+        self._finish(move, task, wait)
+
+    def StopImmediate(self):
+        time.sleep(self._latency)
+        now = time.time()
+        current = self.position_at(now)
+        with self._lock:
+            self._position = current
+            self._move = None
+
+    def InitializeWaitHandler(self):
+        return lambda task: None
+
+    def GetVelocityParams(self):
+        return _VelocityParameters(self._velocity, self._acceleration)
+
+    def SetVelocityParams(self, velocity, acceleration):
+        time.sleep(self._latency)
+        self._velocity = float(str(velocity))
+        self._acceleration = float(str(acceleration))
+
+    def WaitForSettingsInitialized(self, timeout):
+        pass
+
+    def IsSettingsInitialized(self):
+        return True
+
+    def LoadMotorConfiguration(self, device_id):
+        return None
+
+    def StartPolling(self, ms):
+        self._polling = ms / 1000
+
+    def StopPolling(self):
+        pass
+
+    def EnableDevice(self):
+        pass
+
+    def Disconnect(self, *args):
+        pass
+
+
+class SimulatedPowerMeter:
+    """Stand in for ThorlabsPM100 with a power reading in watts that fluctuates by the given relative noise"""
+    def __init__(self, power=1e-3, noise=0.01, latency=0.005):
+        self._power = power
+        self._noise = noise
+        self._latency = latency
+
+    @property
+    def read(self):
+        time.sleep(self._latency)
+        return self._power * (1 + random.gauss(0, self._noise))
@@ -0,0 +1,92 @@
+import argparse
+import contextlib
+import tkinter as tk
+from contextlib import ExitStack
+
+from optics.hardware_control import sr7270, pm100d, polarizercontroller, bsc102controller
+import optics.hardware_control.hardware_addresses_and_constants as hw
+from optics.simulation.field import PhotovoltageField
+from optics.simulation.lockin import SimulatedLockInDevice
+from optics.simulation.motors import SimulatedMotorChannel, SimulatedPowerMeter
+
+
+class SimulatedSetup:
+    """Simulated optics setup. The lock in sees the photovoltage field at the position of the simulated BSC102 stage
+    and the polarization of the simulated waveplate, so the measurement classes and the GUI behave as they do with
+    the real instruments. The connect methods are stand ins for the context managers in hardware_control with the
+    same arguments and they yield the real controller classes"""
+    def __init__(self, field=None, usb_latency=0.002, motor_latency=0.005, polling_ms=250, stage_velocity=2.0,
+                 stage_acceleration=4.0, rotator_velocity=10.0, rotator_acceleration=10.0, time_constant=0.1, slope=12,
+                 sensitivity=1, noise=20e-9, unlock_rate=0, input_overload_rate=0, power=1e-3, seed=None):
+        self.field = field if field else PhotovoltageField()
+        self.x = SimulatedMotorChannel(velocity=stage_velocity, acceleration=stage_acceleration,
+                                       latency=motor_latency, polling_ms=polling_ms, travel=(0, 8))
+        self.y = SimulatedMotorChannel(velocity=stage_velocity, acceleration=stage_acceleration,
+                                       latency=motor_latency, polling_ms=polling_ms, travel=(0, 8))
+        self.waveplate = SimulatedMotorChannel(velocity=rotator_velocity, acceleration=rotator_acceleration,
+                                               latency=motor_latency, polling_ms=polling_ms)
+        self.lockin = SimulatedLockInDevice(self.field, position=self.position, polarization=self.polarization,
+                                            latency=usb_latency, time_constant=time_constant, slope=slope,
+                                            sensitivity=sensitivity, noise=noise, unlock_rate=unlock_rate,
+                                            input_overload_rate=input_overload_rate, seed=seed)
+        self.powermeter = SimulatedPowerMeter(power=power)
+
+    def position(self, t):
+        return self.x.position_at(t), self.y.position_at(t)
+
+    def polarization(self, t):
+        return (self.waveplate.position_at(t) - hw.waveplate_offset) * 2
+
+    @contextlib.contextmanager
+    def create_endpoints_single(self, vendor, product):
+        yield sr7270.LockIn(self.lockin, self.lockin.ep0, self.lockin.ep1)
+
+    @contextlib.contextmanager
+    def connect_bsc102(self, serial_number):
+        yield bsc102controller.StepperMotorController(self.y), bsc102controller.StepperMotorController(self.x)
+
+    @contextlib.contextmanager
+    def connect_tdc001(self, serial_number, waveplate=False):
+        if waveplate:
+            yield polarizercontroller.WaveplateController(self.waveplate)
+        else:
+            yield polarizercontroller.PolarizerController(self.waveplate)
+
+    @contextlib.contextmanager
+    def connect_kdc101(self, serial_number, waveplate=True):
+        with self.connect_tdc001(serial_number, waveplate=waveplate) as controller:
+            yield controller
+
+    @contextlib.contextmanager
+    def connect_pm100d(self, address):
+        yield pm100d.PowerMeter(self.powermeter)
+
+
+def main():
+    """Runs the lock in measurement GUI against the simulated setup"""
+    from optics.gui.main_lockin_gui import BaseLockinGUI
+    parser = argparse.ArgumentParser(description='Run the lock in measurement GUI with simulated instruments')
+    parser.add_argument('--usb-latency', type=float, default=0.002, help='seconds per lock in round trip')
+    parser.add_argument('--stage-velocity', type=float, default=2.0, help='BSC102 velocity')
+    parser.add_argument('--stage-acceleration', type=float, default=4.0, help='BSC102 acceleration')
+    parser.add_argument('--time-constant', type=float, default=0.1, help='initial lock in time constant (s)')
+    parser.add_argument('--unlock-rate', type=float, default=0, help='reference unlock events per second')
+    parser.add_argument('--input-overload-rate', type=float, default=0, help='input overload events per second')
+    args = parser.parse_args()
+    setup = SimulatedSetup(usb_latency=args.usb_latency, stage_velocity=args.stage_velocity,
+                           stage_acceleration=args.stage_acceleration, time_constant=args.time_constant,
+                           unlock_rate=args.unlock_rate, input_overload_rate=args.input_overload_rate)
+    with ExitStack() as cm:
+        sr7270_single_reference = cm.enter_context(setup.create_endpoints_single(hw.vendor, hw.product))
+        powermeter = cm.enter_context(setup.connect_pm100d(hw.pm100d_address))
+        waveplate = cm.enter_context(setup.connect_tdc001(hw.tdc001_serial_number, waveplate=True))
+        bsc102_y, bsc102_x = cm.enter_context(setup.connect_bsc102(hw.bsc102_serial_number))
+        root = tk.Tk()
+        app = BaseLockinGUI(root, sr7270_single_reference=sr7270_single_reference, powermeter=powermeter,
+                            waveplate=waveplate, bsc102_x=bsc102_x, bsc102_y=bsc102_y)
+        app.build()
+        root.mainloop()
+
+
+if __name__ == '__main__':
+    main()
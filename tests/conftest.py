@@ -0,0 +1,15 @@
+"""The repository is the optics package. When it is not installed under that name, it is imported from here"""
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    import optics  # noqa: F401
+except ImportError:
+    spec = importlib.util.spec_from_file_location('optics', os.path.join(ROOT, '__init__.py'),
+                                                  submodule_search_locations=[ROOT])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['optics'] = module
+    spec.loader.exec_module(module)
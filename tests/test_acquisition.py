@@ -0,0 +1,102 @@
+import gc
+import threading
+import time
+import tkinter as tk
+
+import pytest
+
+from optics.hardware_control import sr7270
+from optics.measurements.acquisition import AcquisitionThread
+from optics.simulation.lockin import SimulatedLockInDevice
+
+
+@pytest.fixture
+def master():
+    """A tcl interpreter that stands in for the tkinter root without a display. tkwait needs tk, so waiting for a
+    variable processes events until it is set"""
+    master = tk.Tcl()
+
+    def wait_variable(variable):
+        while not variable.get():
+            master.update()
+            time.sleep(0.005)
+    master.wait_variable = wait_variable
+    yield master
+    gc.collect()  # tcl variables have to be deleted from this thread, not whichever thread collects them later
+
+
+def test_run_hands_every_item_to_the_handler(master):
+    handled = []
+    AcquisitionThread(master, lambda post: [post(i) for i in range(5)], handled.append, interval_ms=5).run()
+    assert handled == list(range(5))
+
+
+def test_run_reads_a_simulated_lock_in_while_the_handler_draws(master):
+    device = SimulatedLockInDevice(lambda x, y, polarization: 0.01, latency=0.002, time_constant=0.001, noise=0)
+    lockin = sr7270.LockIn(device, device.ep0, device.ep1)
+    handled, refreshes = [], []
+
+    def target(post):
+        for _ in range(50):
+            post(lockin.read_xy())
+
+    def refresh():
+        refreshes.append(len(handled))
+        time.sleep(0.01)  # drawing, which the worker thread does not wait for
+    started = time.time()
+    AcquisitionThread(master, target, handled.append, refresh=refresh, interval_ms=5).run()
+    assert len(handled) == 50
+    assert handled[-1] == pytest.approx([0.01, 0], abs=1e-4)
+    assert len(refreshes) < 50  # several readings are drawn at once
+    assert time.time() - started < 50 * (0.002 + 0.01)
+
+
+def test_run_raises_an_error_of_the_target(master):
+    def target(post):
+        raise ValueError('lost the lock in')
+    with pytest.raises(ValueError, match='lost the lock in'):
+        AcquisitionThread(master, target, lambda item: None, interval_ms=5).run()
+
+
+def test_run_aborts_the_target_and_raises_when_the_handler_raises(master):
+    aborted = threading.Event()
+    stopped = threading.Event()
+
+    def target(post):
+        while not aborted.is_set():
+            post('sample')
+            time.sleep(0.001)
+        stopped.set()
+
+    def handler(item):
+        raise RuntimeError('disk full')
+    with pytest.raises(RuntimeError, match='disk full'):
+        AcquisitionThread(master, target, handler, interval_ms=5, abort=aborted.set).run()
+    assert stopped.is_set()  # the worker thread was joined before the error was raised
+
+
+class Button:
+    def __init__(self):
+        self.states = []
+
+    def config(self, state):
+        self.states.append(state)
+
+
+def test_run_disables_the_widgets_while_the_worker_thread_runs(master):
+    button = Button()
+    states = []
+    AcquisitionThread(master, lambda post: post(None), lambda item: states.append(list(button.states)),
+                      interval_ms=5, disabled=[button, None]).run()
+    assert states == [[tk.DISABLED]]
+    assert button.states == [tk.DISABLED, tk.NORMAL]
+
+
+def test_run_enables_the_widgets_again_after_an_error(master):
+    button = Button()
+
+    def target(post):
+        raise ValueError('lost the stage')
+    with pytest.raises(ValueError):
+        AcquisitionThread(master, target, lambda item: None, interval_ms=5, disabled=[button]).run()
+    assert button.states == [tk.DISABLED, tk.NORMAL]
@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+from optics.hardware_control.bsc102controller import StepperMotorController, move_xy, start_move_xy
+from optics.misc_utility.motion import move_time
+from optics.simulation.motors import SimulatedMotorChannel
+
+VELOCITY = 10.0  # mm/s
+ACCELERATION = 100.0  # mm/s2
+POLLING = 0.01  # s, the reported position can lag the stage by one polling interval
+
+
+def simulated_stage(callbacks=False):
+    channel = SimulatedMotorChannel(velocity=VELOCITY, acceleration=ACCELERATION, latency=0.001,
+                                    polling_ms=POLLING * 1000, travel=(0, 8))
+    return StepperMotorController(channel, poll_interval=0.001, callbacks=callbacks)
+
+
+@pytest.mark.parametrize('callbacks', [False, True])
+def test_move_async_resolves_once_the_stage_is_there(callbacks):
+    stage = simulated_stage(callbacks)
+    move = stage.move_async(2.5)
+    assert not move.done()
+    assert move.result() == 2.5
+    assert stage.read_position() == pytest.approx(2.5, abs=VELOCITY * POLLING)
+    if not callbacks:  # the completion callback can come before the polled status shows the move complete
+        assert not stage.is_moving()
+    stage.close()
+
+
+def test_moves_of_one_channel_run_one_after_the_other():
+    stage = simulated_stage()
+    started = time.time()
+    moves = [stage.move_async(position) for position in (1, 3, 2)]
+    assert [move.result() for move in moves] == [1, 3, 2]
+    assert time.time() - started >= sum(move_time(d, VELOCITY, ACCELERATION) for d in (1, 2, 1))
+    assert stage.read_position() == pytest.approx(2)
+    stage.close()
+
+
+def test_moves_are_clamped_to_the_travel():
+    stage = simulated_stage()
+    assert stage.move_async(9).result() == 8
+    assert stage.move_async(-1).result() == 0
+    stage.close()
+
+
+def test_move_xy_moves_both_axes_at_the_same_time():
+    x, y = simulated_stage(), simulated_stage()
+    started = time.time()
+    move_xy(x, y, 4, 4)
+    elapsed = time.time() - started
+    single = move_time(4, VELOCITY, ACCELERATION)
+    assert single <= elapsed < 1.5 * single  # one after the other would take twice as long
+    assert (x.read_position(), y.read_position()) == pytest.approx((4, 4))
+    x.close()
+    y.close()
+
+
+def test_start_move_xy_only_moves_the_given_axes():
+    x, y = simulated_stage(), simulated_stage()
+    moves = start_move_xy(x, y, x=3)
+    assert len(moves) == 1
+    moves[0].result()
+    assert (x.read_position(), y.read_position()) == pytest.approx((3, 0))
+    x.close()
+    y.close()
@@ -0,0 +1,76 @@
+import os
+import sqlite3
+
+import pytest
+
+from optics.measurements import file_index, storage
+
+
+def write_file(directory, name, header):
+    filename = os.path.join(str(directory), name)
+    with storage.open_writer(filename, os.path.splitext(name)[1][1:]) as writer:
+        for row in header + [['end:', 'end of header'], ['time', 'x_v'], [0, 1]]:
+            writer.writerow(row)
+    return filename
+
+
+def test_parse_name():
+    assert file_index.parse_name('/data/flake 2_map scan_40_3.csv') == {
+        'device': 'flake 2', 'measurement': 'map scan', 'polarization': '40', 'index': 3}
+    assert file_index.parse_name('flake_polarization map_x_0.npz')['measurement'] == 'polarization map'
+    assert file_index.parse_name('notes.txt') is None
+
+
+def test_next_index_counts_up_and_skips_taken(tmp_path):
+    with file_index.FileIndex(str(tmp_path)) as index:
+        assert index.next_index('flake', 'map scan', 40) == 0
+        assert index.next_index('flake', 'map scan', 40) == 1
+        assert index.next_index('flake', 'map scan', 45) == 0  # every polarization counts on its own
+        assert index.next_index('flake', 'map scan', 40, taken=lambda k: k in (2, 3)) == 4
+        assert index.next_index('flake', 'map scan', 40, start=10) == 10
+
+
+def test_allocate_falls_back_to_probing(tmp_path):
+    missing = str(tmp_path / 'missing')  # sqlite cannot create the index there
+    assert file_index.allocate(missing, 'flake', 'map scan', 40, 0, lambda k: k < 2) == 2
+
+
+def test_record_and_query(tmp_path):
+    with file_index.FileIndex(str(tmp_path)) as index:
+        index.record(str(tmp_path / 'flake_map scan_40_0.csv'), {'power (W)': '0.5', 'gain': 1000, 'notes': 'a'})
+        index.record(str(tmp_path / 'flake_map scan_45_0.csv'), {'power (W)': 0.25, 'notes': ''})
+        index.record(str(tmp_path / 'other_intensity scan_40_0.csv'), {'power (W)': 0.5})
+        rows = index.query(device='flake', polarization=40)
+        assert [row['path'] for row in rows] == [os.path.abspath(str(tmp_path / 'flake_map scan_40_0.csv'))]
+        assert rows[0]['power'] == 0.5 and rows[0]['gain'] == 1000 and rows[0]['notes'] == 'a'
+        assert rows[0]['attributes']['gain'] == '1000'
+        assert len(index.query(power=0.5)) == 2
+        assert len(index.query(notes=None)) == 2
+        # recording a file moves the counter past its index
+        assert index.next_index('flake', 'map scan', '40') == 1
+        with pytest.raises(ValueError):
+            index.query(colour='red')
+
+
+def test_rebuild_reads_the_headers(tmp_path):
+    write_file(tmp_path, 'flake_intensity scan_40_0.csv', [['gain:', 1000], ['power (W):', 0.5]])
+    write_file(tmp_path, 'flake_intensity scan_40_4.npz', [['gain:', 100], ['power (W):', 0.25]])
+    write_file(tmp_path, 'unrelated.csv', [['gain:', 1]])
+    with file_index.FileIndex(str(tmp_path)) as index:
+        index.record(str(tmp_path / 'deleted_map scan_0_0.csv'), {})
+        assert index.rebuild() == 2
+        rows = index.query(device='flake')
+        assert [(row['scan_index'], row['gain'], row['power']) for row in rows] == [(0, 1000, 0.5), (4, 100, 0.25)]
+        assert index.query(device='deleted') == []
+        assert index.next_index('flake', 'intensity scan', '40') == 5
+
+
+def test_old_index_gains_new_columns(tmp_path):
+    connection = sqlite3.connect(str(tmp_path / file_index.INDEX_FILE))
+    connection.execute('CREATE TABLE files (path TEXT PRIMARY KEY, device TEXT, measurement TEXT, polarization REAL,'
+                       ' scan_index INTEGER, recorded REAL, attributes TEXT)')
+    connection.commit()
+    connection.close()
+    with file_index.FileIndex(str(tmp_path)) as index:
+        index.record(str(tmp_path / 'flake_polarization map_0_0.csv'), {'polarization angles': 6})
+        assert index.query(angles=6)[0]['measurement'] == 'polarization map'
@@ -0,0 +1,32 @@
+import types
+
+import numpy as np
+import pytest
+
+from optics.measurements.base_map import MapScan
+from optics.measurements.settling import SettlePolicy
+from optics.simulation.simulated_setup import SimulatedSetup
+
+SLOPE = 0.01  # V/mm, the signal rises along x
+
+
+def ramp(x, y, polarization=0):
+    return SLOPE * x
+
+
+@pytest.mark.parametrize('reverse', [False, True])
+def test_fly_line_bins_the_sweep_onto_the_pixels(reverse):
+    setup = SimulatedSetup(field=ramp, usb_latency=0.001, motor_latency=0.001, polling_ms=20, stage_velocity=5.0,
+                           stage_acceleration=50.0, time_constant=0.001, sensitivity=100, noise=0)
+    values = np.linspace(2, 3, 5)
+    with setup.create_endpoints_single(0, 0) as lockin, setup.connect_bsc102(0) as (y_stage, x_stage):
+        # fly_line only needs the settle policy, the lock in and the abort flag of a map scan
+        scan = types.SimpleNamespace(_settle=SettlePolicy(lockin), _abort=False, read_pixel=lockin.read_xy,
+                                     _time_constant=lockin.read_tc())
+        binned, dwell = MapScan.fly_line(scan, x_stage, values, reverse=reverse)
+        assert x_stage.read_velocity() == (5.0, 50.0)  # restored after the sweep
+    binned = np.asarray(binned)
+    measured = ~np.isnan(binned[:, 0])
+    assert measured.sum() >= len(values) - 1  # a pixel can be missed between two position polls
+    np.testing.assert_allclose(binned[measured, 0], SLOPE * values[measured], atol=SLOPE * 0.1)
+    assert dwell == pytest.approx(0.25 / 5.0)  # one pixel at the full velocity
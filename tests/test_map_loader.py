@@ -0,0 +1,86 @@
+import csv
+
+import numpy as np
+import pytest
+
+from optics.analysis import map_loader
+from optics.measurements import storage
+
+HEADER = [['x scan density:', 3], ['y scan density:', 2], ['x scan range:', 2], ['y scan range:', 1],
+          ['x center:', 4], ['y center:', 4]]
+
+
+def write_map(filename, rows, columns=('x_v', 'y_v', 'x_pixel', 'y_pixel'), header=(), backend='csv'):
+    with storage.open_writer(filename, backend) as writer:
+        for row in list(header) + HEADER + [['end:', 'end of header'], list(columns)]:
+            writer.writerow(row)
+        writer.writerows(rows)
+
+
+@pytest.mark.parametrize('backend', ['csv', 'npz'])
+def test_unmeasured_pixels_are_masked(tmp_path, backend):
+    filename = str(tmp_path / ('map' + storage.EXTENSIONS[backend]))
+    write_map(filename, [[1, 2, 0, 0], [3, 4, 2, 1]], backend=backend)
+    map_data = map_loader.load_map(filename)
+    assert map_data.kind == 'thermovoltage'
+    assert map_data.axes == ('x_pixel', 'y_pixel')
+    assert not map_data.complete
+    assert map_data.x.count() == 2
+    assert map_data.x[2, 1] == 3
+    assert map_data.x.mask[1, 0]
+    assert map_data.y[0, 0] == 2
+    assert len(map_data.x_values) == 3 and len(map_data.y_values) == 2
+
+
+def test_pixels_measured_as_nan_are_not_masked(tmp_path):
+    filename = str(tmp_path / 'map.csv')
+    write_map(filename, [['nan', 'nan', 0, 0]])
+    map_data = map_loader.load_map(filename)
+    assert map_data.measured[0, 0] and np.isnan(map_data.x[0, 0])
+
+
+def test_frames_are_averaged(tmp_path):
+    filename = str(tmp_path / 'map.csv')
+    write_map(filename, [[1, 0, 0, 0, 0], [3, 0, 0, 0, 1], [5, 0, 1, 0, 0]],
+              columns=('x_v', 'y_v', 'x_pixel', 'y_pixel', 'frame'), header=[['frames:', 2]])
+    map_data = map_loader.load_map(filename)
+    assert map_data.axes == ('frame', 'x_pixel', 'y_pixel')
+    assert map_data.frames == 2
+    average = map_data.average('x_v')
+    assert average.shape == (3, 2)
+    assert average[0, 0] == 2
+    assert average[1, 0] == 5  # measured in one frame only
+    assert average.mask[2, 1]
+
+
+def test_polarization_map_is_not_averaged(tmp_path):
+    filename = str(tmp_path / 'map.csv')
+    write_map(filename, [[1, 0, 0, 0, 0, 0], [3, 0, 0, 0, 1, 45]],
+              columns=('x_v', 'y_v', 'x_pixel', 'y_pixel', 'angle', 'polarization'),
+              header=[['polarization angles:', 4]])
+    map_data = map_loader.load_map(filename, columns=None)
+    assert map_data.axes == ('x_pixel', 'y_pixel', 'angle')
+    assert map_data.frames == 1 and map_data.angles == 4
+    assert map_data.x.shape == (3, 2, 4)
+    with pytest.raises(ValueError):
+        map_data.average('x_v')
+
+
+def test_cut_file(tmp_path):
+    filename = str(tmp_path / 'map.csv')
+    write_map(filename, [[1, 2, 0, 0]])
+    assert map_loader.load_map(filename).cut is None
+    with open(map_loader.cut_file(filename), 'w', newline='') as f:
+        writer = csv.writer(f)
+        for row in [['axis:', 'y'], ['end:', 'end of header'], ['pixel', 'cut v_x', 'cut v_y'], [0, 1, 2]]:
+            writer.writerow(row)
+    map_data = map_loader.load_map(filename)
+    assert map_data.cut_axis == 'y'
+    np.testing.assert_array_equal(map_data.cut['cut v_x'], [1])
+
+
+def test_schema():
+    assert map_loader.schema(['x_iphoto', 'y_iphoto', 'x_raw', 'y_raw']) == ('heating', ('x_iphoto', 'y_iphoto'))
+    assert map_loader.schema(['x_raw', 'y_raw']) == ('raw', ('x_raw', 'y_raw'))
+    with pytest.raises(ValueError):
+        map_loader.schema(['time'])
@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+
+from optics.misc_utility import path_planner
+
+X_VAL = np.linspace(0, 1, 4)
+Y_VAL = np.linspace(0, 0.6, 3)
+
+
+def neighbours(order):
+    return all(abs(a[0] - b[0]) + abs(a[1] - b[1]) == 1 for a, b in zip(order, order[1:]))
+
+
+def test_serpentine_along_x():
+    assert path_planner.serpentine(3, 2) == [(0, 0), (1, 0), (2, 0), (2, 1), (1, 1), (0, 1)]
+
+
+def test_serpentine_along_y_backwards():
+    assert path_planner.serpentine(2, 3, axis='x', direction=False) == [(1, 0), (1, 1), (1, 2), (0, 2), (0, 1),
+                                                                         (0, 0)]
+
+
+@pytest.mark.parametrize('size', [(4, 4), (8, 8), (5, 3)])
+def test_hilbert_visits_every_pixel_once(size):
+    order = path_planner.hilbert(*size)
+    assert sorted(order) == [(i, j) for i in range(size[0]) for j in range(size[1])]
+
+
+def test_hilbert_steps_to_neighbours_on_a_power_of_two():
+    assert neighbours(path_planner.hilbert(8, 8))
+
+
+def test_nearest_neighbour_visits_every_point_once():
+    points = [(0, 0), (3, 2), (1, 0), (2, 2), (0, 1)]
+    order = path_planner.nearest_neighbour(points, X_VAL, Y_VAL, path_planner.StageModel())
+    assert sorted(order) == sorted(points)
+    assert order[0] == (0, 0)
+    assert path_planner.nearest_neighbour([], X_VAL, Y_VAL, path_planner.StageModel()) == []
+
+
+def greedy(points, x_val, y_val, model):
+    """The nearest neighbour order found by costing every remaining point at every step"""
+    remaining = list(points)
+    current = x_val[remaining[0][0]], y_val[remaining[0][1]]
+    directions = (0, 0)
+    order = []
+    while remaining:
+        point = min(remaining, key=lambda p: (model.cost(current, (x_val[p[0]], y_val[p[1]]), directions),
+                                              points.index(p)))
+        remaining.remove(point)
+        order.append(point)
+        position = x_val[point[0]], y_val[point[1]]
+        directions = tuple(int(np.sign(b - a)) or d for a, b, d in zip(current, position, directions))
+        current = position
+    return order
+
+
+@pytest.mark.parametrize('concurrent', [False, True])
+@pytest.mark.parametrize('fraction', [0.05, 0.5, 1])
+def test_nearest_neighbour_searching_rings_matches_costing_every_point(concurrent, fraction):
+    rng = np.random.default_rng(3)
+    x_val, y_val = np.linspace(0, 2, 12), np.linspace(0, 1, 9)
+    points = [(i, j) for i in range(12) for j in range(9) if rng.random() < fraction]
+    model = path_planner.StageModel(concurrent=concurrent)
+    assert path_planner.nearest_neighbour(points, x_val, y_val, model) == greedy(points, x_val, y_val, model)
+
+
+def test_path_cost_adds_the_moves_with_their_reversals():
+    model = path_planner.StageModel(velocity=2.0, acceleration=4.0, overhead=0.1, reversal=0.05)
+    order = [(0, 0), (1, 0), (1, 1), (0, 1), (0, 2)]
+    x = float(path_planner.move_times(X_VAL[1], 2.0, 4.0)) + 0.1
+    y = float(path_planner.move_times(Y_VAL[1], 2.0, 4.0)) + 0.1
+    assert path_planner.path_cost(order, X_VAL, Y_VAL, model) == pytest.approx(2 * x + 0.05 + 2 * y)
+    assert path_planner.path_cost(order[:1], X_VAL, Y_VAL, model) == 0
+    assert path_planner.path_cost(order[:1], X_VAL, Y_VAL, model, start=(X_VAL[1], 0)) == pytest.approx(x)
+
+
+def test_plan_is_no_costlier_than_serpentines():
+    model = path_planner.StageModel()
+    points = [(i, j) for i in range(4) for j in range(3)]
+    order = path_planner.plan(points, X_VAL, Y_VAL, model)
+    cost = path_planner.path_cost(order, X_VAL, Y_VAL, model)
+    assert sorted(order) == sorted(points)
+    for other in (path_planner.serpentine(4, 3), path_planner.serpentine(4, 3, axis='x')):
+        assert cost <= path_planner.path_cost(other, X_VAL, Y_VAL, model) + 1e-12
+
+
+def test_move_times_are_trapezoidal():
+    # below the ramp distance the move is all acceleration and deceleration, above it cruises at the velocity
+    assert path_planner.move_times(1.0, 2.0, 4.0) == pytest.approx(1.0)
+    assert path_planner.move_times(3.0, 2.0, 4.0) == pytest.approx(1.0 + 2.0 / 2.0)
+    assert path_planner.move_times(0.0, 2.0, 4.0) == 0
+
+
+def test_stage_costs():
+    model = path_planner.StageModel(velocity=2.0, acceleration=4.0, overhead=0.1, reversal=0.05)
+    x = path_planner.move_times(1.0, 2.0, 4.0) + 0.1
+    assert model.cost((0, 0), (1, 0)) == pytest.approx(x)
+    assert model.cost((0, 0), (1, 1)) == pytest.approx(2 * x)  # one axis after the other
+    model.concurrent = True
+    assert model.cost((0, 0), (1, 1)) == pytest.approx(x)
+    assert model.cost((1, 0), (0, 0), directions=(1, 0)) == pytest.approx(x + 0.05)  # backlash on a reversal
+    assert model.cost((0, 0), (0, 0)) == 0
+
+
+def test_rotator_cost():
+    model = path_planner.RotatorModel(velocity=10.0, acceleration=10.0, overhead=0.25)
+    assert model.cost(0) == 0
+    assert model.cost(20) == pytest.approx(float(path_planner.move_times(20, 10.0, 10.0)) + 0.25)
+
+
+def test_polarization_costs():
+    order = path_planner.serpentine(4, 3)
+    stage = path_planner.StageModel()
+    rotator = path_planner.RotatorModel()
+    raster = path_planner.path_cost(order, X_VAL, Y_VAL, stage)
+    rotation = rotator.cost(22.5)
+    costs = path_planner.polarization_costs(order, X_VAL, Y_VAL, stage, rotator, 22.5, 4, step_dwell=0.01,
+                                            rotation_dwell=0.1)
+    assert costs['pixel'] == pytest.approx(raster + 12 * 3 * (rotation + 0.1) + 12 * 0.01)
+    assert costs['map'] == pytest.approx(4 * raster + 3 * (rotation + 0.1) + (4 * 12 - 3) * 0.01)
+
+
+def test_visit_gives_positions():
+    assert list(path_planner.visit([(1, 2)], X_VAL, Y_VAL)) == [(1, 2, X_VAL[1], Y_VAL[2])]
@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+
+from optics.analysis import polarization_fit
+from optics.measurements import storage
+
+THETA = np.arange(0, 180, 15.0)
+
+
+def curve(theta, amplitude=2.0, phase=30.0, offset=0.5):
+    return amplitude * np.cos(np.radians(theta - phase)) ** 2 + offset
+
+
+def test_exact_fit():
+    result = polarization_fit.fit(THETA, curve(THETA))
+    assert result.amplitude == pytest.approx(2.0)
+    assert result.phase == pytest.approx(30.0)
+    assert result.offset == pytest.approx(0.5)
+    assert result.rms == pytest.approx(0, abs=1e-9)
+    assert result.anisotropy == pytest.approx(2.0 / 3.0)
+    np.testing.assert_allclose(result.evaluate(THETA), curve(THETA), atol=1e-9)
+
+
+def test_a_dip_is_a_peak_90_degrees_away():
+    result = polarization_fit.fit(THETA, curve(THETA, amplitude=-1.0, phase=10.0, offset=3.0))
+    assert result.amplitude == pytest.approx(1.0)
+    assert result.phase == pytest.approx(100.0)
+    assert result.offset == pytest.approx(2.0)
+
+
+def test_errors_match_the_scatter_of_repeated_fits():
+    rng = np.random.default_rng(1)
+    noise = 0.05
+    values = curve(THETA) + rng.normal(0, noise, (2000, len(THETA)))
+    result = polarization_fit.fit(THETA, values)
+    assert np.mean(result.amplitude_error) == pytest.approx(np.std(result.amplitude), rel=0.1)
+    assert np.mean(result.phase_error) == pytest.approx(np.std(result.phase), rel=0.1)
+    assert np.mean(result.offset_error) == pytest.approx(np.std(result.offset), rel=0.1)
+    assert np.mean(result.rms) == pytest.approx(noise, rel=0.2)
+
+
+def test_many_series_with_nan_padding():
+    values = np.array([curve(THETA, phase=20.0), curve(THETA, phase=70.0)])
+    values[1, 8:] = np.nan
+    result = polarization_fit.fit(THETA, values)
+    np.testing.assert_allclose(result.phase, [20.0, 70.0])
+    np.testing.assert_array_equal(result.count, [12, 8])
+
+
+def test_too_few_angles_give_nan():
+    result = polarization_fit.fit([0, 0, 90, 90], [1, 1, 2, 2])
+    assert np.isnan(result.amplitude) and np.isnan(result.phase) and np.isnan(result.offset)
+
+
+def test_converged():
+    rng = np.random.default_rng(2)
+    quiet = polarization_fit.fit(THETA, curve(THETA) + rng.normal(0, 1e-4, len(THETA)))
+    noisy = polarization_fit.fit(THETA, curve(THETA) + rng.normal(0, 1.0, len(THETA)))
+    assert quiet.converged(0.02, 1.0)
+    assert not noisy.converged(0.02, 1.0)
+
+
+def test_live_fit_without_points_is_nan():
+    live = polarization_fit.LiveFit(channels=2)
+    result = live.result()
+    assert result.amplitude.shape == (2,)
+    assert np.isnan(result.amplitude).all() and np.isnan(result.phase).all()
+    assert not live.converged()
+    assert np.isnan(polarization_fit.LiveFit().result().amplitude)
+
+
+def test_live_fit_matches_fit():
+    rng = np.random.default_rng(3)
+    values = np.column_stack([curve(THETA), rng.normal(0, 0.01, len(THETA))])
+    live = polarization_fit.LiveFit(channels=2)
+    for theta, value in zip(THETA, values):
+        live.add(theta, value)
+    live.add(0, [np.nan, 0])  # a failed reading is left out
+    result = live.result()
+    expected = polarization_fit.fit(THETA, values.T)
+    np.testing.assert_allclose(result.amplitude, expected.amplitude)
+    np.testing.assert_allclose(result.phase_error, expected.phase_error)
+    assert live.count == len(THETA)
+
+
+def test_live_fit_converges_on_the_chosen_channels():
+    rng = np.random.default_rng(4)
+    live = polarization_fit.LiveFit(channels=2)
+    for theta in THETA:
+        live.add(theta, [curve(theta) + rng.normal(0, 1e-4), rng.normal(0, 0.01)])  # Y is noise
+    assert live.converged(0.02, 1.0, channels=[0])
+    assert not live.converged(0.02, 1.0)
+
+
+def test_live_fit_needs_minimum_points():
+    live = polarization_fit.LiveFit(minimum_points=6)
+    for theta in THETA[:5]:
+        live.add(theta, curve(theta))
+    assert not live.converged()
+    live.add(THETA[5], curve(THETA[5]))
+    assert live.converged()
+
+
+def test_fit_files(tmp_path):
+    filenames = []
+    for k, phase in enumerate([20.0, 60.0]):
+        filenames.append(str(tmp_path / 'scan{}.csv'.format(k)))
+        with storage.open_writer(filenames[-1], 'csv') as writer:
+            writer.writerow(['end:', 'end of header'])
+            writer.writerow(['x_v', 'y_v', 'polarization'])
+            for theta in THETA[:len(THETA) - k]:
+                writer.writerow([curve(theta, phase=phase), curve(theta, amplitude=1.0, phase=phase), theta])
+    fits = polarization_fit.fit_files(filenames)
+    assert [fit['x_v'].phase for fit in fits] == [pytest.approx(20.0), pytest.approx(60.0)]
+    assert fits[1]['y_v'].amplitude == pytest.approx(1.0)
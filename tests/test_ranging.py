@@ -0,0 +1,53 @@
+import time
+
+from optics.hardware_control import sr7270
+from optics.measurements.ranging import RangeMemory
+from optics.simulation.lockin import SimulatedLockInDevice
+
+BRIGHT = 0.5  # V, in the bright spot around x = 5
+SETTLE = 0.02  # s, twenty time constants
+
+
+def simulated_stage_lockin():
+    """Returns a lock in on a simulated device whose input is BRIGHT near x = 5 and small elsewhere, the list that
+    holds the stage position and the list of the commands sent to the lock in"""
+    stage = [0.0, 4.0]
+    device = SimulatedLockInDevice(lambda x, y, polarization: BRIGHT if abs(x - 5) < 0.5 else 1e-4,
+                                   position=lambda t: tuple(stage), latency=0, time_constant=0.001, sensitivity=100,
+                                   noise=0)
+    commands = []
+    write = device.write
+
+    def record(command):
+        commands.append(command)
+        write(command)
+    device.write = record
+    return sr7270.LockIn(device, device.ep0, device.ep1), stage, commands
+
+
+def test_a_neighbouring_pixel_starts_at_the_remembered_range():
+    lockin, stage, commands = simulated_stage_lockin()
+    ranging = RangeMemory(lockin, region_size=0.2)
+    stage[0] = 5.0
+    time.sleep(SETTLE)
+    raw = lockin.read_xy()  # overloads and ranges up
+    ranging.remember(*stage, raw)
+    lockin.change_sensitivity(100)  # as if dimmer pixels had been measured in between
+    stage[0] = 5.15
+    assert ranging.prepare(*stage)
+    assert lockin.read_sensitivity() == 1  # V
+    time.sleep(SETTLE)
+    del commands[:]
+    x, y = lockin.read_xy()
+    assert abs(x - BRIGHT) < 0.01 * BRIGHT
+    assert not any(command.startswith('sen ') for command in commands)  # no overload to range up from
+
+
+def test_a_distant_pixel_keeps_the_current_range():
+    lockin, stage, commands = simulated_stage_lockin()
+    ranging = RangeMemory(lockin, region_size=0.2)
+    stage[0] = 5.0
+    time.sleep(SETTLE)
+    ranging.remember(*stage, lockin.read_xy())
+    assert ranging.suggest(5.0, 5.0) is None
+    assert not ranging.prepare(5.0, 5.0)
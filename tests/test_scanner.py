@@ -0,0 +1,38 @@
+import numpy as np
+
+from optics.misc_utility import scanner
+
+GRID = np.linspace(1.0, 2.0, 5)  # pitch 0.25
+
+
+def test_bin_fly_scan_averages_samples_onto_the_nearest_pixel():
+    positions = [1.0, 1.05, 1.24, 1.26, 2.1]
+    values = [[1, 10], [3, 30], [5, 50], [7, 70], [9, 90]]
+    binned, counts = scanner.bin_fly_scan(GRID, positions, values)
+    np.testing.assert_array_equal(counts, [2, 2, 0, 0, 1])
+    np.testing.assert_array_equal(binned[0], [2, 20])
+    np.testing.assert_array_equal(binned[1], [6, 60])
+    np.testing.assert_array_equal(binned[4], [9, 90])
+
+
+def test_bin_fly_scan_leaves_pixels_without_samples_nan():
+    binned, counts = scanner.bin_fly_scan(GRID, [1.0, 2.0], [[1, 1], [2, 2]])
+    assert np.isnan(binned[1:4]).all()  # nothing is interpolated or clamped into them
+    assert counts[1:4].sum() == 0
+
+
+def test_bin_fly_scan_drops_samples_off_the_grid():
+    binned, counts = scanner.bin_fly_scan(GRID, [0.5, 2.5], [[1, 1], [2, 2]])
+    assert counts.sum() == 0
+    assert np.isnan(binned).all()
+
+
+def test_fill_grid_interpolates_between_measured_pixels():
+    z = np.zeros((3, 3))
+    measured = np.zeros((3, 3), dtype=bool)
+    for i, j, value in [(0, 0, 0), (2, 0, 2), (0, 2, 4), (2, 2, 6)]:
+        z[i, j] = value
+        measured[i, j] = True
+    filled = scanner.fill_grid(z, measured)
+    np.testing.assert_allclose(filled, [[0, 2, 4], [1, 3, 5], [2, 4, 6]])
+    assert z[1, 1] == 0  # a new array
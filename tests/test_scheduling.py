@@ -0,0 +1,52 @@
+import pytest
+
+from optics.hardware_control import sr7270
+from optics.measurements.scheduling import DeadlineScheduler
+from optics.simulation.lockin import SimulatedLockInDevice
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_samples_are_paced_to_absolute_deadlines():
+    clock = FakeClock()
+    scheduler = DeadlineScheduler(10, clock=clock, sleep=clock.sleep)
+    times = []
+    for work in [0.03, 0.05, 0.01, 0.08, 0.0]:
+        times.append(scheduler.wait())
+        clock.now += work  # reading the lock in
+    assert times == pytest.approx([0, 0.1, 0.2, 0.3, 0.4])  # the work does not accumulate into drift
+    assert scheduler.missed == 0
+
+
+def test_deadlines_passed_by_a_whole_interval_are_skipped():
+    clock = FakeClock()
+    scheduler = DeadlineScheduler(10, clock=clock, sleep=clock.sleep)
+    scheduler.wait()
+    clock.now += 0.25
+    assert scheduler.wait() == pytest.approx(0.25)  # 0.1 is skipped and 0.2 is sampled late
+    assert scheduler.missed == 1
+    assert (scheduler.deadline, scheduler.skipped) == (pytest.approx(0.2), 1)  # recorded with the sample
+    assert scheduler.wait() == pytest.approx(0.3)
+    assert (scheduler.deadline, scheduler.skipped) == (pytest.approx(0.3), 0)
+    assert '1 missed deadlines' in scheduler.summary()
+
+
+@pytest.mark.parametrize('rate, latency, missed', [(50, 0.002, False), (500, 0.005, True)])
+def test_sampling_a_simulated_lock_in(rate, latency, missed):
+    device = SimulatedLockInDevice(lambda x, y, polarization: 0.01, latency=latency, time_constant=0.001, noise=0)
+    lockin = sr7270.LockIn(device, device.ep0, device.ep1)
+    scheduler = DeadlineScheduler(rate)
+    while scheduler.wait() < 0.3:
+        lockin.read_xy()
+    assert (scheduler.missed > 0) == missed
+    if not missed:
+        assert float(scheduler.intervals.mean) == pytest.approx(1 / rate, rel=0.05)
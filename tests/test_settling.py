@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+from optics.hardware_control import sr7270
+from optics.measurements.settling import SettlePolicy, settle_time_constants
+from optics.simulation.lockin import SimulatedLockInDevice
+
+SIGNAL = 0.3  # V, on the 1 V sensitivity
+TIME_CONSTANT = 0.05
+
+
+def stepped_lockin(slope):
+    """Returns a simulated lock in whose input steps from 0 to SIGNAL when the stage reaches x = 1, and a function that
+    makes the step"""
+    moved = []
+    device = SimulatedLockInDevice(lambda x, y, polarization: SIGNAL if x > 0.5 else 0,
+                                   position=lambda t: (1, 0) if moved and t >= moved[0] else (0, 0),
+                                   latency=0.0005, time_constant=TIME_CONSTANT, slope=slope, sensitivity=1000, noise=0)
+    return sr7270.LockIn(device, device.ep0, device.ep1), lambda: moved.append(time.time())
+
+
+@pytest.mark.parametrize('slope', [6, 12, 18, 24])
+def test_settle_reads_within_tolerance_of_a_full_step(slope):
+    lockin, step = stepped_lockin(slope)
+    policy = SettlePolicy(lockin)
+    step()
+    (x, y), dwell = policy.settle(lockin.read_xy)
+    assert abs(x - SIGNAL) <= 0.05 * SIGNAL, (x, dwell)
+    assert dwell <= policy.model_dwell() + 3 * TIME_CONSTANT
+
+
+@pytest.mark.parametrize('slope', [6, 12, 18, 24])
+def test_settle_without_convergence_dwells_the_model_time(slope):
+    lockin, step = stepped_lockin(slope)
+    policy = SettlePolicy(lockin, converge=False)
+    assert policy.model_dwell() == pytest.approx(settle_time_constants(slope // 6, 0.05) * TIME_CONSTANT)
+    step()
+    (x, y), dwell = policy.settle(lockin.read_xy)
+    assert dwell >= policy.model_dwell()
+    assert abs(x - SIGNAL) <= 0.05 * SIGNAL
+
+
+def test_settle_stops_reading_once_the_signal_is_flat():
+    lockin, step = stepped_lockin(24)
+    policy = SettlePolicy(lockin)
+    readings = []
+
+    def read():
+        readings.append(lockin.read_xy())
+        return readings[-1]
+    policy.settle(read)
+    assert len(readings) == 2
@@ -0,0 +1,114 @@
+import time
+
+import pytest
+
+from optics.hardware_control import sr7270
+from optics.simulation.lockin import SimulatedLockInDevice
+
+
+def simulated_lockin(signal, sensitivity=1000, **kwargs):
+    """Returns a lock in on a simulated device with a constant input of signal volts, and the list of the commands
+    sent to it"""
+    device = SimulatedLockInDevice(lambda x, y, polarization: signal, latency=0, time_constant=0.001,
+                                   sensitivity=sensitivity, noise=0, **kwargs)
+    commands = []
+    write = device.write
+
+    def record(command):
+        commands.append(command)
+        write(command)
+    device.write = record
+    return sr7270.LockIn(device, device.ep0, device.ep1), commands
+
+
+def test_auto_sensitivity_only_forgets_the_settings_it_changes():
+    lockin, commands = simulated_lockin(0.5, sensitivity=100)
+    lockin.read_state()
+    lockin.read_xy(sleep=lambda seconds: None)
+    assert lockin.read_sensitivity() == 1  # V, the lowest range above twice the signal
+    del commands[:]
+    lockin.read_oscillator_frequency()
+    lockin.read_reference_phase()
+    lockin.read_applied_voltage()
+    assert commands == []
+
+
+def test_an_overloaded_reading_is_decoded_from_the_status_bytes():
+    lockin, commands = simulated_lockin(0.5, sensitivity=100)
+    transaction = lockin.transaction()
+    transaction.read_xy()
+    (x, y), = transaction.execute()
+    assert x > 0.12  # clipped, but above 120% of the sensitivity
+    assert lockin.is_overloaded()
+    lockin.change_sensitivity(1000)
+    transaction = lockin.transaction()
+    transaction.read_xy()
+    transaction.execute()
+    assert not lockin.is_overloaded()
+
+
+def test_an_invalid_command_raises_and_forgets_the_cached_settings():
+    lockin, commands = simulated_lockin(0.01)
+    lockin.read_state()
+    transaction = lockin.transaction()
+    transaction.write('bogus 1')
+    with pytest.raises(ValueError, match='Invalid lock in command'):
+        transaction.execute()
+    del commands[:]
+    lockin.read_tc()
+    assert commands == ['tc.']
+
+
+def test_settings_are_read_once_until_invalidated():
+    lockin, commands = simulated_lockin(0.01)
+    assert lockin.read_tc() == 0.001
+    assert lockin.read_tc() == 0.001
+    lockin.change_tc(0.01)
+    assert lockin.read_tc() == 0.01  # written through to the cache
+    lockin.invalidate('tc.')
+    assert lockin.read_tc() == 0.01
+    assert [command for command in commands if command.startswith('tc')] == ['tc.', 'tc 9', 'tc.']
+
+
+def test_read_state_reads_every_setting_in_one_round_trip():
+    lockin, commands = simulated_lockin(0.01)
+    del commands[:]
+    lockin.read_state()
+    assert len(commands) == 1
+    assert lockin.read_sensitivity() == 1
+    assert lockin.read_slope() == 12
+    assert len(commands) == 1
+
+
+def test_a_transaction_splits_the_replies_between_its_commands():
+    lockin, commands = simulated_lockin(0.25)
+    time.sleep(0.01)
+    del commands[:]
+    transaction = lockin.transaction()
+    xy = transaction.read_xy()
+    tc = transaction.read_setting('tc.')
+    adc = transaction.read_adc(1)
+    results = transaction.execute()
+    assert len(commands) == 1
+    assert results[xy] == pytest.approx([0.25, 0], abs=1e-3)
+    assert results[tc] == 0.001
+    assert len(results[adc]) == 1
+    assert lockin.read_tc() == 0.001 and len(commands) == 1  # cached by the transaction
+
+
+def test_curve_buffer_stores_points_at_the_interval_that_was_set():
+    lockin, commands = simulated_lockin(0.25)
+    assert lockin.setup_curve_buffer(0.0104, 20) == 0.01
+    lockin.start_curve_buffer()
+    time.sleep(0.3)
+    status = lockin.read_curve_status()
+    assert status[3] == 20
+    x, y = lockin.read_curve(0), lockin.read_curve(1)
+    assert len(x) == len(y) == 20
+    assert x[-1] == pytest.approx(0.25, rel=1e-3)
+
+
+def test_curve_buffer_refuses_intervals_below_one_millisecond():
+    lockin, commands = simulated_lockin(0.25)
+    with pytest.raises(ValueError):
+        lockin.setup_curve_buffer(0.0004, 20)
@@ -0,0 +1,144 @@
+import numpy as np
+import pytest
+
+from optics.measurements import storage
+
+MAP_HEADER = [['gain:', 1000], ['notes:', 'sample 1'], ['power (W):', 0.5], ['x scan density:', 3],
+              ['y scan density:', 2], ['end:', 'end of header']]
+SERIES_HEADER = [['gain:', 1000], ['notes:', 'sample 1'], ['end:', 'end of header']]
+BACKENDS = ['csv', 'npz']
+
+
+def filename(tmp_path, backend):
+    return str(tmp_path / ('scan' + storage.EXTENSIONS[backend]))
+
+
+def write_map(writer, pixels):
+    for row in MAP_HEADER:
+        writer.writerow(row)
+    writer.writerow(['x_raw', 'y_raw', 'x_pixel', 'y_pixel'])
+    for x_ind, y_ind in pixels:
+        writer.writerow([10 * x_ind + y_ind, -(10 * x_ind + y_ind), x_ind, y_ind])
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_map_round_trip(tmp_path, backend):
+    name = filename(tmp_path, backend)
+    with storage.open_writer(name, backend) as writer:
+        write_map(writer, [(0, 0), (1, 0), (2, 0), (2, 1)])
+    attributes, data = storage.load(name)
+    assert data['x_raw'].shape == (3, 2)
+    assert data['x_raw'][2, 1] == 21
+    assert data['y_raw'][1, 0] == -10
+    assert np.isnan(data['x_raw'][0, 1])  # never measured
+    assert data['order'][2, 1] == 3
+    assert data['order'][0, 1] == -1
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_series_round_trip(tmp_path, backend):
+    name = filename(tmp_path, backend)
+    with storage.open_writer(name, backend) as writer:
+        for row in SERIES_HEADER:
+            writer.writerow(row)
+        writer.writerow(['time', 'x_v'])
+        for k in range(5):
+            writer.writerow([k * 0.5, k])
+    _, data = storage.load(name)
+    np.testing.assert_array_equal(data['time'], [0, 0.5, 1, 1.5, 2])
+    np.testing.assert_array_equal(data['x_v'], [0, 1, 2, 3, 4])
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_attributes_read_back_alike(tmp_path, backend):
+    name = filename(tmp_path, backend)
+    with storage.open_writer(name, backend) as writer:
+        write_map(writer, [(0, 0)])
+    expected = {'gain': 1000, 'notes': 'sample 1', 'power (W)': 0.5, 'x scan density': 3, 'y scan density': 2}
+    assert storage.read_attributes(name) == expected
+    assert storage.load(name)[0] == expected
+    assert isinstance(storage.read_attributes(name)['gain'], int)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_resume_overwrites_rows_after_checkpoint(tmp_path, backend):
+    name = filename(tmp_path, backend)
+    with storage.open_writer(name, backend) as writer:
+        write_map(writer, [(0, 0), (1, 0)])
+        position = writer.sync()
+        writer.writerow([99, 99, 2, 0])  # written after the checkpoint, then the scan stops
+    with storage.open_writer(name, backend, resume=position) as writer:
+        writer.writerow([20, -20, 2, 0])
+        writer.writerow([21, -21, 2, 1])
+    _, data = storage.load(name)
+    np.testing.assert_array_equal(data['x_raw'], [[0, np.nan], [10, np.nan], [20, 21]])
+    assert data['order'][2, 1] == 3
+
+
+def test_csv_load_drops_a_row_cut_short(tmp_path):
+    name = filename(tmp_path, 'csv')
+    with storage.open_writer(name, 'csv') as writer:
+        write_map(writer, [(0, 0)])
+    with open(name, 'a') as f:
+        f.write('10,-10,1')  # the scan stopped in the middle of a row
+    _, data = storage.load(name)
+    assert int((data['order'] >= 0).sum()) == 1
+
+
+def test_npz_series_is_on_disk_after_every_flush(tmp_path):
+    name = filename(tmp_path, 'npz')
+    with storage.open_writer(name, 'npz') as writer:
+        writer._flush_rows = 10
+        for row in SERIES_HEADER:
+            writer.writerow(row)
+        writer.writerow(['time', 'x_v'])
+        for k in range(25):
+            writer.writerow([k, k])
+        assert len(storage.load(name)[1]['x_v']) == 20
+    assert len(storage.load(name)[1]['x_v']) == 25
+
+
+def test_npz_refuses_several_frames(tmp_path):
+    with pytest.raises(ValueError):
+        with storage.open_writer(filename(tmp_path, 'npz'), 'npz') as writer:
+            for row in [['frames:', 3]] + MAP_HEADER:
+                writer.writerow(row)
+            writer.writerow(['x_raw', 'x_pixel', 'y_pixel', 'frame'])
+
+
+def test_csv_frames_load_as_3d(tmp_path):
+    name = filename(tmp_path, 'csv')
+    with storage.open_writer(name, 'csv') as writer:
+        for row in [['frames:', 2]] + MAP_HEADER:
+            writer.writerow(row)
+        writer.writerow(['x_raw', 'x_pixel', 'y_pixel', 'frame'])
+        writer.writerow([1, 0, 0, 0])
+        writer.writerow([2, 0, 0, 1])
+    _, data = storage.load(name)
+    assert data['x_raw'].shape == (2, 3, 2)
+    assert data['x_raw'][1, 0, 0] == 2
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_extra_columns_are_added_to_every_data_row(tmp_path, backend):
+    name = filename(tmp_path, backend)
+    schedule = [0, 0]
+    with storage.open_writer(name, backend) as writer:
+        writer = storage.ExtraColumns(writer, ['deadline', 'missed'], lambda: schedule)
+        for row in SERIES_HEADER:
+            writer.writerow(row)
+        writer.writerow(['time', 'x_v'])
+        for k, missed in enumerate([0, 2, 0]):
+            schedule[:] = k * 0.5, missed
+            writer.writerow([k * 0.5 + 0.001, k])
+    attributes, data = storage.load(name)
+    assert attributes == {'gain': 1000, 'notes': 'sample 1'}
+    np.testing.assert_array_equal(data['deadline'], [0, 0.5, 1])
+    np.testing.assert_array_equal(data['missed'], [0, 2, 0])
+    np.testing.assert_array_equal(data['x_v'], [0, 1, 2])
+
+
+def test_unknown_storage(tmp_path):
+    with pytest.raises(ValueError):
+        with storage.open_writer(str(tmp_path / 'scan.dat'), 'dat'):
+            pass
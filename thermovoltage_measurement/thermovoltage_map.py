@@ -10,10 +10,14 @@ import matplotlib.pyplot as plt
 class ThermovoltageMapScan(MapScan):
     def __init__(self, master, filepath, notes, device, scan, gain, xd, yd, xr, yr, xc, yc,
                  bsc102_x, bsc102_y, sr7270_single_reference, powermeter, waveplate, direction,
-                 axis):
+                 axis, fly=False, settle=None, storage='csv', adaptive=False, path='serpentine', home=True,
+                 frames=1, target_sem=None, resume=None, checkpoint_interval=60, ranging=False):
         super().__init__(master, filepath, notes, device, scan, gain, xd, yd, xr, yr, xc, yc,
                          bsc102_x, bsc102_y, sr7270_single_reference, powermeter=powermeter, waveplate=waveplate,
-                         direction=direction, axis=axis)
+                         direction=direction, axis=axis, fly=fly, settle=settle,
+                         storage=storage, adaptive=adaptive, path=path, home=home, frames=frames,
+                         target_sem=target_sem, resume=resume, checkpoint_interval=checkpoint_interval,
+                         ranging=ranging)
         self._norm = thermovoltage_plot.MidpointNormalize(midpoint=0)
 
     def start(self):
@@ -23,6 +27,8 @@ class ThermovoltageMapScan(MapScan):
                                      origin='lower')
         self._clb1 = self._fig.colorbar(self._im1, ax=self._ax1)
         self._clb2 = self._fig.colorbar(self._im2, ax=self._ax2)
+        self._renderer.add_image(self._im1, self._z1, symmetric=True)
+        self._renderer.add_image(self._im2, self._z2, symmetric=True)
 
     def end_header(self, writer):
         writer.writerow(['x scan density:', self._xd])
@@ -32,7 +38,7 @@ class ThermovoltageMapScan(MapScan):
         writer.writerow(['x center:', self._xc])
         writer.writerow(['y center:', self._yc])
         writer.writerow(['end:', 'end of header'])
-        writer.writerow(['x_raw', 'y_raw', 'x_v', 'y_v', 'x_pixel', 'y_pixel'])
+        writer.writerow(['x_raw', 'y_raw', 'x_v', 'y_v', 'x_pixel', 'y_pixel', 'dwell'])
 
     def setup_plots(self):
         self._clb1.set_label('voltage (uV)', rotation=270, labelpad=20)
@@ -52,15 +58,14 @@ class ThermovoltageMapScan(MapScan):
             self._ax3.set_xlim(0, self._xd - 1, 1)
             self._ax4.set_xlim(0, self._xd - 1, 1)
 
-    def do_measurement(self):
-        raw = self._sr7270_single_reference.read_xy()
+    def do_measurement(self, raw):
         voltages = [conversions.convert_x_to_iphoto(x, self._gain) for x in raw]
         self._v.append(voltages)
-        self._writer.writerow([raw[0], raw[1], voltages[0], voltages[1], self._x_ind, self._y_ind])
+        self._writer.writerow([raw[0], raw[1], voltages[0], voltages[1], self._x_ind, self._y_ind, self._dwell])
         self._z1[self._x_ind][self._y_ind] = voltages[0] * 1000000
         self._z2[self._x_ind][self._y_ind] = voltages[1] * 1000000
-        self.update_plot(self._im1, self._z1, -np.amax(np.abs(self._z1)), np.amax(np.abs(self._z1)))
-        self.update_plot(self._im2, self._z2, -np.amax(np.abs(self._z2)), np.amax(np.abs(self._z2)))
+        self._renderer.update(self._im1, self._z1[self._x_ind][self._y_ind])
+        self._renderer.update(self._im2, self._z2[self._x_ind][self._y_ind])
 
     def do_cut_measurement(self):
         v_x_cut = np.mean(sorted([i[0] for i in self._v], key=abs)[-3:-1])
@@ -78,12 +83,6 @@ class ThermovoltageMapScan(MapScan):
             self._ax4.plot(self._x_ind, v_y_cut * 1000000,
                            linestyle='', color='blue', marker='o', markersize=2)
 
-    @staticmethod
-    def update_plot(im, data, min_val, max_val):
-        im.set_data(data.T)
-        im.set_clim(vmin=min_val)
-        im.set_clim(vmax=max_val)
-
     def plot_final(self):
         thermovoltage_plot.plot(self._ax1, self._im1, self._z1, np.amax(np.abs(self._z1)),
                                 -np.amax(np.abs(self._z1)))
@@ -0,0 +1,72 @@
+import matplotlib
+matplotlib.use('TkAgg')
+from optics.misc_utility import conversions
+from optics.measurements.base_polarization_map import PolarizationMapScan
+import numpy as np
+from optics.thermovoltage_plot import thermovoltage_plot
+import matplotlib.pyplot as plt
+
+
+class ThermovoltagePolarizationMapScan(PolarizationMapScan):
+    def __init__(self, master, filepath, notes, device, scan, gain, xd, yd, xr, yr, xc, yc,
+                 bsc102_x, bsc102_y, sr7270_single_reference, powermeter, waveplate, direction,
+                 axis, angles=6, order='auto', fly=False, settle=None, storage='csv', path='serpentine', home=True,
+                 resume=None, checkpoint_interval=60):
+        super().__init__(master, filepath, notes, device, scan, gain, xd, yd, xr, yr, xc, yc,
+                         bsc102_x, bsc102_y, sr7270_single_reference, powermeter=powermeter, waveplate=waveplate,
+                         angles=angles, order=order, direction=direction, axis=axis, fly=fly, settle=settle,
+                         storage=storage, path=path, home=home, resume=resume,
+                         checkpoint_interval=checkpoint_interval)
+        self._norm = thermovoltage_plot.MidpointNormalize(midpoint=0)
+        self._im3 = None
+        self._im4 = None
+        self._clb3 = None
+        self._clb4 = None
+
+    def start(self):
+        self._im1 = self._ax1.imshow(self._z1.T, norm=self._norm, cmap=plt.cm.coolwarm, interpolation='nearest',
+                                     origin='lower')
+        self._im2 = self._ax2.imshow(self._amplitude.T, cmap=plt.cm.viridis, interpolation='nearest', origin='lower')
+        self._im3 = self._ax3.imshow(self._phase.T, cmap=plt.cm.twilight, interpolation='nearest', origin='lower')
+        self._im4 = self._ax4.imshow(self._anisotropy.T, cmap=plt.cm.viridis, interpolation='nearest',
+                                     origin='lower')
+        self._clb1 = self._fig.colorbar(self._im1, ax=self._ax1)
+        self._clb2 = self._fig.colorbar(self._im2, ax=self._ax2)
+        self._clb3 = self._fig.colorbar(self._im3, ax=self._ax3)
+        self._clb4 = self._fig.colorbar(self._im4, ax=self._ax4)
+        self._renderer.add_image(self._im1, self._z1, symmetric=True)
+        self._renderer.add_image(self._im2, self._amplitude)
+        self._renderer.add_image(self._im3, self._phase)
+        self._renderer.add_image(self._im4, self._anisotropy)
+
+    def end_header(self, writer):
+        writer.writerow(['x scan density:', self._xd])
+        writer.writerow(['y scan density:', self._yd])
+        writer.writerow(['x scan range:', self._xr])
+        writer.writerow(['y scan range:', self._yr])
+        writer.writerow(['x center:', self._xc])
+        writer.writerow(['y center:', self._yc])
+        writer.writerow(['end:', 'end of header'])
+        writer.writerow(['x_raw', 'y_raw', 'x_v', 'y_v', 'x_pixel', 'y_pixel', 'angle', 'polarization', 'dwell'])
+
+    def setup_plots(self):
+        self._clb1.set_label('voltage (uV)', rotation=270, labelpad=20)
+        self._clb2.set_label('voltage (uV)', rotation=270, labelpad=20)
+        self._clb3.set_label('polarization (degrees)', rotation=270, labelpad=20)
+        self._clb4.set_label('(max - min) / (max + min)', rotation=270, labelpad=20)
+        self._ax1.title.set_text('X_1')
+        self._ax2.title.set_text('X_1 polarization amplitude')
+        self._ax3.title.set_text('X_1 maximum polarization')
+        self._ax4.title.set_text('X_1 polarization anisotropy')
+
+    def do_measurement(self, raw):
+        voltages = [conversions.convert_x_to_iphoto(x, self._gain) for x in raw]
+        self._writer.writerow([raw[0], raw[1], voltages[0], voltages[1], self._x_ind, self._y_ind, self._angle,
+                               self._reading, self._dwell])
+        self._z1[self._x_ind][self._y_ind] = voltages[0] * 1000000
+        self._z2[self._x_ind][self._y_ind] = voltages[1] * 1000000
+        self._renderer.update(self._im1, self._z1[self._x_ind][self._y_ind])
+
+    def plot_final(self):
+        thermovoltage_plot.plot(self._ax1, self._im1, self._z1, np.amax(np.abs(self._z1)),
+                                -np.amax(np.abs(self._z1)))
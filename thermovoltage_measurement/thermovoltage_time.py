@@ -2,16 +2,14 @@ import matplotlib
 matplotlib.use('TkAgg')
 from optics.misc_utility import conversions
 from optics.measurements.base_time import TimeMeasurement
-import time
-from optics.misc_utility.tkinter_utilities import tk_sleep
 
 
 class ThermovoltageTime(TimeMeasurement):
     def __init__(self, master, filepath, notes, device, scan, gain, rate, maxtime,
-                 sr7270_single_reference, powermeter, waveplate):
+                 sr7270_single_reference, powermeter, waveplate, buffered=False, settle=None, storage='csv'):
         super().__init__(master, filepath, notes, device, scan, rate, maxtime,
                          sr7270_single_reference=sr7270_single_reference, powermeter=powermeter, gain=gain,
-                         waveplate=waveplate)
+                         waveplate=waveplate, buffered=buffered, settle=settle, storage=storage)
         self._voltages = []
 
     def end_header(self, writer):
@@ -27,24 +25,19 @@ class ThermovoltageTime(TimeMeasurement):
         self._ax2.set_xlabel('time (s)')
         self._canvas.draw()
 
-    def do_measurement(self):
-        raw = self._sr7270_single_reference.read_xy()
+    def do_measurement(self, time_now, raw):
         self._voltages = [conversions.convert_x_to_iphoto(x, self._gain) for x in raw]
-        tk_sleep(self._master, self._sleep)
-        time_now = time.time() - self._start_time
         self._writer.writerow([time_now, raw[0], raw[1], self._voltages[0], self._voltages[1]])
-        self._ax1.plot(time_now, self._voltages[0] * 1000000, linestyle='', color='blue', marker='o', markersize=2)
-        self._ax2.plot(time_now, self._voltages[1] * 1000000, linestyle='', color='blue', marker='o', markersize=2)
-        self._fig.tight_layout()
-        self._fig.canvas.draw()
+        self._plot1.append(time_now, self._voltages[0] * 1000000)
+        self._plot2.append(time_now, self._voltages[1] * 1000000)
 
 
 class ThermovoltageTimeRT(TimeMeasurement):
     def __init__(self, master, filepath, notes, device, scan, gain, rate, maxtime,
-                 sr7270_single_reference, powermeter, waveplate):
+                 sr7270_single_reference, powermeter, waveplate, buffered=False, settle=None, storage='csv'):
         super().__init__(master, filepath, notes, device, scan, rate, maxtime,
                          sr7270_single_reference=sr7270_single_reference, powermeter=powermeter, gain=gain,
-                         waveplate=waveplate)
+                         waveplate=waveplate, buffered=buffered, settle=settle, storage=storage)
         self._voltages = []
 
     def end_header(self, writer):
@@ -60,13 +53,8 @@ class ThermovoltageTimeRT(TimeMeasurement):
         self._ax2.set_xlabel('time (s)')
         self._canvas.draw()
 
-    def do_measurement(self):
-        raw = self._sr7270_single_reference.read_xy()
+    def do_measurement(self, time_now, raw):
         self._voltage = conversions.convert_x_to_iphoto(raw[0], self._gain)
-        tk_sleep(self._master, self._sleep)
-        time_now = time.time() - self._start_time
         self._writer.writerow([time_now, raw[0], raw[1], self._voltage, raw[1] / self._gain])
-        self._ax1.plot(time_now, self._voltage * 1000000, linestyle='', color='blue', marker='o', markersize=2)
-        self._ax2.plot(time_now, raw[1] / self._gain, linestyle='', color='blue', marker='o', markersize=2)
-        self._fig.tight_layout()
-        self._fig.canvas.draw()
\ No newline at end of file
+        self._plot1.append(time_now, self._voltage * 1000000)
+        self._plot2.append(time_now, raw[1] / self._gain)